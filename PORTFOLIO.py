@@ -1,14 +1,19 @@
-import yfinance as yf
-import pandas as pd
 import streamlit as st
-from datetime import datetime, timedelta
-import plotly.express as px
+from datetime import datetime
 import warnings
-import re 
-import numpy as np
 import os
+import threading
+import uuid
 from supabase import create_client, Client
-import bcrypt  # type: ignore
+import secrets
+from auth import PasswordHasher, SessionSigner
+from portfolio_import import chunked, iter_import_rows
+from tracing import Tracer
+# pandas, plotly, yfinance y los módulos que dependen de ellos se importan
+# más abajo, solo cuando hay sesión iniciada (ver DASHBOARD IMPORTS)
+
+# Debe ser la primera llamada a Streamlit del script
+st.set_page_config(page_title="Gestor de Portfolio de Inversión", layout="wide")
 
 # --- Suppress FutureWarnings ---
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -19,6 +24,63 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 # -----------------------------------------------
 # Elimina DB_NAME, ahora usamos Supabase
 BASE_CURRENCY = "USD"
+# Segundos que una cotización se sirve desde la caché compartida antes de volver a Yahoo
+QUOTE_TTL_SECONDS = int(os.environ.get("QUOTE_TTL_SECONDS", "60"))
+# Cadencia del refresco en segundo plano: cripto (24/7), mercado abierto y mercado cerrado
+CRYPTO_REFRESH_SECONDS = int(os.environ.get("CRYPTO_REFRESH_SECONDS", "60"))
+OPEN_MARKET_REFRESH_SECONDS = int(os.environ.get("OPEN_MARKET_REFRESH_SECONDS", "60"))
+CLOSED_MARKET_REFRESH_SECONDS = int(os.environ.get("CLOSED_MARKET_REFRESH_SECONDS", "1800"))
+# Caché en disco de nombres y divisas de los tickers (se refresca cada semana)
+METADATA_CACHE_PATH = os.environ.get(
+    "TICKER_METADATA_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "ticker_metadata.json")
+)
+METADATA_TTL_SECONDS = int(os.environ.get("TICKER_METADATA_TTL_SECONDS", str(7 * 24 * 3600)))
+# Coste de bcrypt para contraseñas nuevas; las existentes se re-cifran al iniciar sesión
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# Hashes de bcrypt simultáneos como máximo en todo el proceso
+AUTH_WORKERS = int(os.environ.get("AUTH_WORKERS", "2"))
+# Clave para firmar los tokens de sesión (si no se define, cambia en cada reinicio)
+SESSION_SECRET = os.environ.get("SESSION_SECRET")
+SESSION_MAX_AGE_SECONDS = int(os.environ.get("SESSION_MAX_AGE_SECONDS", str(12 * 3600)))
+# "client": se leen las posiciones con sus lotes abiertos y se ponen al día con el libro.
+# "server": Supabase devuelve una fila por ticker sin lotes (ver supabase/migrations). Solo
+# sirve para el resumen: cada posición cuenta como un único lote a su coste medio y con la
+# fecha de su primer lote abierto. El histórico siempre lee el libro completo.
+PORTFOLIO_AGGREGATION = os.environ.get("PORTFOLIO_AGGREGATION", "client")
+# Cómo se casan las ventas con las compras: "fifo" (las más antiguas primero) o "average" (coste medio)
+COST_BASIS_METHOD = os.environ.get("COST_BASIS_METHOD", "fifo")
+# Filas por cada insert en la importación masiva de CSV
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", "500"))
+# Intervalos (segundos) que se pueden elegir en el modo en directo
+LIVE_REFRESH_OPTIONS = [15, 30, 60, 300]
+# Con el modo en directo en pausa, cada cuánto se comprueba si ha abierto algún mercado
+LIVE_PAUSED_CHECK_SECONDS = int(os.environ.get("LIVE_PAUSED_CHECK_SECONDS", "300"))
+# Último precio conocido de cada cotización y tipo de cambio (SQLite): se pinta al instante y sirve si Yahoo falla
+SNAPSHOT_PATH = os.environ.get(
+    "SNAPSHOT_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "snapshots.db")
+)
+# Segundos que un tipo de cambio se da por bueno antes de volver a Yahoo
+FX_TTL_SECONDS = int(os.environ.get("FX_TTL_SECONDS", "3600"))
+# Listado de símbolos del buscador de acciones (symbol, name, currency, market); por defecto el incluido en data/
+SYMBOLS_PATH = os.environ.get(
+    "SYMBOLS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "symbols.csv")
+)
+# Resultados como máximo del buscador de acciones
+SYMBOL_SEARCH_LIMIT = int(os.environ.get("SYMBOL_SEARCH_LIMIT", "20"))
+# Histórico local de precios (SQLite), solo se descargan las barras que faltan
+PRICE_HISTORY_PATH = os.environ.get(
+    "PRICE_HISTORY_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "price_history.db")
+)
+# Días de histórico de los que se sacan los escenarios Monte Carlo
+SCENARIO_LOOKBACK_DAYS = int(os.environ.get("SCENARIO_LOOKBACK_DAYS", "365"))
+# Mide cada fase de todas las ejecuciones; si no, solo en las sesiones con el panel de tiempos abierto
+PERF_TRACING = os.environ.get("PERF_TRACING", "0") == "1"
+# Archivo opcional con las métricas en formato Prometheus (textfile collector de node_exporter)
+PERF_TRACING_PROMETHEUS_FILE = os.environ.get("PERF_TRACING_PROMETHEUS_FILE")
 
 # List of all tickers including stocks, indices and commodities
 TICKERS_INFO = {
@@ -55,7 +117,9 @@ TICKERS_INFO = {
 CURRENCY_SYMBOLS = {
     "USD": "$",
     "EUR": "€",
-    "GBP": "£"
+    "GBP": "£",
+    "CHF": "CHF ",
+    "JPY": "¥"
 }
 
 CRYPTO_TICKERS_INFO = {
@@ -71,7 +135,10 @@ CRYPTO_TICKERS_INFO = {
     "Avalanche": {"symbol_usd": "AVAX-USD", "name": "Avalanche"},
 }
 
-SUPPORTED_CURRENCIES = ["EUR", "USD", "GBP"]
+# Sufijos de Yahoo Finance de bolsas europeas, para tickers que no están en TICKERS_INFO
+EU_EXCHANGE_SUFFIXES = {"PA", "MC", "DE", "AS", "MI", "BR", "LS", "IL", "BE", "F", "SW", "VI", "HE", "CO", "ST", "OL"}
+
+SUPPORTED_CURRENCIES = ["EUR", "USD", "GBP", "CHF", "JPY"]
 GLOBAL_TICKERS = list(TICKERS_INFO.keys())
 CRYPTO_TICKERS = [info["symbol_usd"] for info in CRYPTO_TICKERS_INFO.values()]
 
@@ -102,30 +169,7 @@ st.markdown(
         background-color: #f0f2f6;
         border-right: 1px solid #e0e0e0;
     }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
 
-# -----------------------------------------------
-# INICIALIZAR EL ANCHO DE LA BARRA LATERAL CON JAVASCRIPT
-# -----------------------------------------------
-st.html("""
-    <script>
-        document.addEventListener("DOMContentLoaded", function() {
-            const sidebar = document.querySelector('[data-testid="stSidebar"]');
-            if (sidebar) {
-                sidebar.style.width = '33%';
-            }
-        });
-    </script>
-""")
-
-# -----------------------------------------------
-
-st.markdown(
-    """
-    <style>
     /* Estilos para los contenedores de los gráficos de pastel */
     .st-emotion-cache-1f1q7x4 {
         display: flex;
@@ -156,83 +200,151 @@ st.markdown(
 # -----------------------------------------------
 # DATA HELPER FUNCTIONS
 # -----------------------------------------------
-@st.cache_resource 
+def fetch_ticker_details(ticker_symbol):
+    """Gets the full name and currency of a single ticker using yfinance."""
+    import market_data
+
+    default_currency = TICKERS_INFO.get(ticker_symbol, {}).get('currency') or BASE_CURRENCY
+    return market_data.fetch_ticker_details(ticker_symbol, default_currency)
+
+@st.cache_resource
+def get_metadata_cache():
+    """Process-wide ticker metadata cache backed by METADATA_CACHE_PATH."""
+    return TickerMetadataCache(METADATA_CACHE_PATH, fetch_ticker_details, ttl=METADATA_TTL_SECONDS)
+
 def get_ticker_details(tickers):
-    """Gets full names and currency of tickers using yfinance."""
-    details_map = {}
-    for ticker_symbol in tickers:
-        try:
-            ticker_yf = yf.Ticker(ticker_symbol)
-            info = ticker_yf.info
-            name = info.get('longName') or info.get('shortName') or ticker_symbol
-            currency = info.get('currency') or TICKERS_INFO.get(ticker_symbol, {}).get('currency') or BASE_CURRENCY
-            details_map[ticker_symbol] = {'name': name, 'currency': currency}
-        except Exception:
-            details_map[ticker_symbol] = {'name': ticker_symbol, 'currency': None}
-    return details_map
-
-@st.cache_data(ttl=3600) # Cache the exchange rate for 1 hour
-def get_usd_to_eur_exchange_rate_from_yf():
-    """
-    Obtiene el tipo de cambio actual de USD a EUR de Yahoo Finance (ticker EUR=X).
+    """Gets full names and currency of tickers, looking up only missing or expired ones."""
+    return get_metadata_cache().get_many(tickers)
+
+@st.cache_resource
+def get_snapshot_store():
+    """Last known prices and FX rates on disk, shared by every session."""
+    return SnapshotStore(SNAPSHOT_PATH)
+
+@st.cache_resource
+def get_quote_service():
+    """Shared latest-price cache used by every session of this server process."""
+    return QuoteService(fetch_last_prices, ttl=QUOTE_TTL_SECONDS, snapshots=get_snapshot_store())
+
+@st.cache_resource
+def get_fx_service():
+    """Shared cache of the FX pairs against USD, refreshed from quotes (daily bars when a pair has none)."""
+    return QuoteService(fetch_fx_quotes, ttl=FX_TTL_SECONDS, snapshots=get_snapshot_store())
+
+@st.cache_resource
+def get_symbol_index():
+    """Searchable listings of SYMBOLS_PATH, loaded once per process."""
+    from symbol_index import SymbolIndex
+
+    return SymbolIndex.from_csv(SYMBOLS_PATH)
+
+def get_ticker_market(ticker):
+    """Market of a ticker from TICKERS_INFO or the symbol index, guessed from its exchange suffix otherwise."""
+    if ticker in TICKERS_INFO:
+        return TICKERS_INFO[ticker]["market"]
+    record = get_symbol_index().get(ticker)
+    if record and record["market"]:
+        return record["market"]
+    suffix = ticker.rsplit(".", 1)[1] if "." in ticker else ""
+    return "EU" if suffix in EU_EXCHANGE_SUFFIXES else "US"
+
+def is_crypto_ticker(ticker):
+    """True for the cryptocurrencies, which trade around the clock."""
+    return ticker in CRYPTO_TICKERS or ticker.endswith("-USD")
+
+def live_tickers(tickers):
+    """Tickers whose price can move right now: cryptocurrencies and stocks of open markets."""
+    return [t for t in tickers if is_crypto_ticker(t) or is_market_open(get_ticker_market(t))]
+
+@st.cache_resource
+def get_quote_prewarmer():
     """
-    try:
-        # Get data for the last few days to ensure we get a recent close price
-        today = datetime.now().date()
-        df = yf.download("EURUSD=X", start=today - timedelta(days=7), end=today + timedelta(days=1))
-
-        if not df.empty:
-            # We want the USD/EUR rate, but the ticker is EUR/USD, so we need to invert it.
-            exchange_rate = 1 / df['Close'].iloc[-1]
-            if isinstance(exchange_rate, pd.Series): 
-                return exchange_rate.iloc[0]
-            return float(exchange_rate)
-        else:
-            st.warning("⚠️ El ticker EURUSD=X no devolvió datos. No se podrá realizar la conversión a EUR.")
-            return None
-    except Exception as e:
-        st.error(f"❌ Error al obtener el tipo de cambio USD/EUR de Yahoo Finance: {e}")
-        return None
+    Starts (once per process) the background thread that keeps quotes warm
+    for the tickers of every active session plus GLOBAL_TICKERS and CRYPTO_TICKERS.
+    """
+    prewarmer = QuotePrewarmer(
+        get_quote_service(),
+        GLOBAL_TICKERS + CRYPTO_TICKERS,
+        is_crypto=is_crypto_ticker,
+        is_open=lambda ticker: is_market_open(get_ticker_market(ticker)),
+        crypto_every=CRYPTO_REFRESH_SECONDS,
+        open_every=OPEN_MARKET_REFRESH_SECONDS,
+        closed_every=CLOSED_MARKET_REFRESH_SECONDS,
+    )
+    prewarmer.start()
+    return prewarmer
+
+@st.cache_resource
+def get_price_history_store():
+    """Local incremental store of daily and intraday bars, shared by every session."""
+    return PriceHistoryStore(PRICE_HISTORY_PATH)
+
+def yahoo_client_metrics():
+    """Prometheus text of the Yahoo Finance fetch client shared by the whole process."""
+    from yahoo_client import default_client
+
+    return default_client().prometheus_text()
+
+@st.cache_resource
+def get_tracer():
+    """Process-wide collector of per-rerun stage timings."""
+    return Tracer(textfile=PERF_TRACING_PROMETHEUS_FILE, collectors=[yahoo_client_metrics])
+
+def supported_fx_symbols():
+    """Yahoo Finance symbol of every SUPPORTED_CURRENCIES pair against USD."""
+    return {currency: fx_symbol(currency) for currency in SUPPORTED_CURRENCIES if currency != "USD"}
 
-@st.cache_data(ttl=3600)
-def get_exchange_rates():
+def get_exchange_rates(base_currency=BASE_CURRENCY, quotes=None):
     """
-    Fetches real-time exchange rates to the BASE_CURRENCY.
-    This version now uses the specific yfinance function for EUR.
+    Returns the value of one unit of every supported currency in base_currency.
+    All pairs against USD come from one shared, batched cache, so any base
+    currency is a cross rate without further network calls. With a `quotes`
+    dict, the quote of every pair used (see QuoteService.get_quotes) is
+    added to it.
     """
-    rates = {BASE_CURRENCY: 1.0}
-    
-    for currency in SUPPORTED_CURRENCIES:
-        if currency == BASE_CURRENCY:
-            continue
-        try:
-            if currency == "EUR":
-                # Use the specific function requested by the user for EUR
-                rate_eur = get_usd_to_eur_exchange_rate_from_yf()
-                if rate_eur is not None:
-                    rates[currency] = rate_eur
-                else:
-                    st.warning(f"⚠️ No se pudo obtener la tasa de cambio para {currency}. Usando 1.0 por defecto.")
-                    rates[currency] = 1.0
-            else:
-                # For other currencies, continue with the standard robust method
-                ticker_symbol = f"{currency}{BASE_CURRENCY}=X"
-                data = yf.download(ticker_symbol, period="1d", interval="1m")
-                
-                if not data.empty:
-                    rates[currency] = data['Close'].iloc[-1]
-                else:
-                    st.warning(f"⚠️ No se pudo obtener la tasa de cambio para {currency} usando el ticker {ticker_symbol}. Usando 1.0 por defecto.")
-                    rates[currency] = 1.0
-        except Exception as e:
-            st.error(f"❌ Error al obtener la tasa de cambio para {currency}: {e}. Usando 1.0 por defecto.")
-            rates[currency] = 1.0
-            
+    symbols = supported_fx_symbols()
+    fx_quotes = get_fx_service().get_quotes(list(symbols.values()))
+    if quotes is not None:
+        quotes.update(fx_quotes)
+    fx_prices = {symbol: quote[0] for symbol, quote in fx_quotes.items()}
+    usd_rates = {"USD": 1.0, **{c: fx_prices[s] for c, s in symbols.items() if fx_prices.get(s)}}
+    matrix = cross_rate_matrix(usd_rates, SUPPORTED_CURRENCIES)
+    rates = {}
+    for currency, rate in matrix[base_currency].items():
+        if pd.isna(rate):
+            st.error(f"❌ No hay ningún tipo de cambio conocido para {currency}. Sus importes se muestran sin convertir.")
+            rate = 1.0
+        rates[currency] = float(rate)
     return rates
 
-TICKER_DETAILS = get_ticker_details(GLOBAL_TICKERS + CRYPTO_TICKERS)
-GLOBAL_DISPLAY_NAMES = [f"{TICKER_DETAILS[t]['name']} ({t})" for t in GLOBAL_TICKERS if TICKER_DETAILS.get(t) and TICKER_DETAILS[t]['name']]
-CRYPTO_DISPLAY_NAMES = [f"{info['name']} ({info['symbol_usd']})" for info in CRYPTO_TICKERS_INFO.values()]
+def format_age(seconds):
+    """Short Spanish label for how long ago something happened."""
+    if seconds < 60:
+        return f"hace {int(seconds)} s"
+    if seconds < 3600:
+        return f"hace {int(seconds // 60)} min"
+    if seconds < 2 * 86400:
+        return f"hace {int(seconds // 3600)} h"
+    return f"hace {int(seconds // 86400)} días"
+
+def search_stock_symbols(query):
+    """
+    Non-crypto listings of the symbol index matching `query`. A ticker typed in
+    full that is not in the index is offered too, as a record without name.
+    """
+    query = query.strip().upper()
+    if not query:
+        return []
+    records = [r for r in get_symbol_index().search(query, limit=SYMBOL_SEARCH_LIMIT) if r["market"] != "CRYPTO"]
+    if not any(r["symbol"] == query for r in records):
+        records.append({"symbol": query, "name": None, "currency": None, "market": None})
+    return records
+
+def format_symbol_record(record):
+    """Picker label of a symbol index record."""
+    if record["name"] is None:
+        return f"{record['symbol']} (no está en el índice)"
+    return f"{record['symbol']} · {record['name']} · {record['currency']}"
 
 # -----------------------------------------------
 # DATABASE FUNCTIONS
@@ -241,19 +353,35 @@ CRYPTO_DISPLAY_NAMES = [f"{info['name']} ({info['symbol_usd']})" for info in CRY
 # --- Configuración de Supabase ---
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+@st.cache_resource
+def get_supabase_client():
+    """Supabase client shared by every session and rerun."""
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+supabase: Client = get_supabase_client()
 # ---------------------------------
 
 # -----------------------------------------------
 # AUTHENTICATION FUNCTIONS
 # -----------------------------------------------
+@st.cache_resource
+def get_password_hasher():
+    """bcrypt hasher shared by every session, with at most AUTH_WORKERS hashes in flight."""
+    return PasswordHasher(rounds=BCRYPT_ROUNDS, max_workers=AUTH_WORKERS)
+
+@st.cache_resource
+def get_session_signer():
+    """Signs and checks the session tokens issued at login."""
+    return SessionSigner(SESSION_SECRET or secrets.token_hex(32), max_age=SESSION_MAX_AGE_SECONDS)
+
 def hash_password(password):
     """Hashes a password using bcrypt."""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return get_password_hasher().hash(password)
 
 def verify_password(password, hashed_password):
     """Verifies a password against a stored hash."""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return get_password_hasher().verify(password, hashed_password)
 
 def register_user(username, password):
     """Registers a new user in the database."""
@@ -279,161 +407,351 @@ def login_user(username, password):
         
         stored_hash = response.data[0]['password']
         if verify_password(password, stored_hash):
+            if get_password_hasher().needs_rehash(stored_hash):
+                # El coste configurado cambió: se guarda un hash nuevo con la contraseña ya verificada
+                try:
+                    supabase.table("users").update({"password": hash_password(password)}).eq("username", username).execute()
+                except Exception:
+                    pass  # Se volverá a intentar en el próximo inicio de sesión
             return True, "✔️ ¡Inicio de sesión exitoso!"
         else:
             return False, "❌ Contraseña incorrecta."
     except Exception as e:
         return False, f"❌ Error en el inicio de sesión: {e}"
 
-def save_portfolio_item(ticker, cantidad, precio_compra, precio_compra_currency, nombre_personalizado, user_id):
+@st.cache_resource
+def get_portfolio_versions():
+    """
+    Per-user portfolio version shared by every session of this process.
+    Each write bumps it, so other sessions of the same user know their
+    cached copy is outdated without asking Supabase.
+    """
+    return {"lock": threading.Lock(), "versions": {}}
+
+def _cache_positions(user_id, version, positions):
+    st.session_state.portfolio_cache = {
+        "user_id": user_id, "version": version, "positions": positions, "df": open_lots(positions)
+    }
+
+def _write_through(user_id, update):
+    """
+    Applies a successful write to this session's cached positions instead of
+    re-reading them. With update None (a write whose result is unknown) every
+    session just drops its cached copy.
+    """
+    registry = get_portfolio_versions()
+    with registry["lock"]:
+        previous = registry["versions"].get(user_id, 0)
+        registry["versions"][user_id] = version = previous + 1
+
+    cache = st.session_state.get("portfolio_cache")
+    if update is not None and cache and cache["user_id"] == user_id and cache["version"] == previous:
+        _cache_positions(user_id, version, update(cache["positions"]))
+    else:
+        # Otra sesión escribió entretanto: la próxima lectura irá a Supabase
+        st.session_state.pop("portfolio_cache", None)
+
+def _sync_positions(user_id):
+    """
+    Brings the user's materialized positions up to date with the ledger and
+    returns them as {ticker: Position} (see ledger.sync_positions). Each write
+    applies its own trades this way; on a plain load there is usually nothing
+    to apply, unless a write was interrupted, two sessions wrote at once or
+    the positions were stored with another COST_BASIS_METHOD.
+    """
+    return sync_positions(supabase, user_id, COST_BASIS_METHOD)
+
+def _record_trades(user_id, rows):
+    """Appends buys or sells to the ledger and applies them to the stored positions."""
+    inserted = supabase.table("portfolio").insert(rows).execute().data
+    _apply_inserted(user_id)
+    return inserted
+
+def _apply_inserted(user_id):
+    """
+    Brings the stored and cached positions up to date after inserting ledger
+    rows. If that fails the rows are already in the ledger, so the cached
+    positions are dropped and the next read catches up with them.
+    """
+    try:
+        positions = _sync_positions(user_id)
+    except Exception:
+        _write_through(user_id, None)
+        raise
+    _write_through(user_id, lambda _: positions)
+
+def save_portfolio_item(ticker, cantidad, precio_compra, precio_compra_currency, nombre_personalizado, user_id, fecha_compra=None):
     """Adds a new purchase entry for a stock or crypto in the user's portfolio."""
-    data = {
+    _record_trades(user_id, [{
         "user_id": user_id,
         "ticker": ticker.upper(),
+        "tipo": "compra",
         "cantidad": cantidad,
         "precio_compra": precio_compra,
         "precio_compra_currency": precio_compra_currency,
-        "nombre_personalizado": nombre_personalizado
-    }
-    supabase.table("portfolio").insert(data).execute()
+        "nombre_personalizado": nombre_personalizado,
+        "fecha_compra": fecha_compra.isoformat() if fecha_compra else None
+    }])
+
+def sell_portfolio_item(ticker, cantidad, precio_venta, user_id, fecha_venta=None):
+    """
+    Records a full or partial sale of a held ticker, priced in the currency
+    of its position. Raises ValueError when selling more than is held.
+    """
+    position = load_positions(user_id).get(ticker)
+    held = position.cantidad if position else 0.0
+    if cantidad > held + QUANTITY_EPSILON:
+        raise ValueError(f"Solo tienes {held:g} de {ticker}.")
+    # En las ventas, precio_compra y fecha_compra son el precio y la fecha de la venta
+    _record_trades(user_id, [{
+        "user_id": user_id,
+        "ticker": ticker,
+        "tipo": "venta",
+        "cantidad": cantidad,
+        "precio_compra": precio_venta,
+        "precio_compra_currency": position.precio_compra_currency,
+        "nombre_personalizado": None,
+        "fecha_compra": fecha_venta.isoformat() if fecha_venta else None
+    }])
 
 def delete_portfolio_item(ticker, user_id):
-    """Deletes all entries for a given stock or crypto from the user's portfolio."""
+    """Deletes every buy and sell of a given stock or crypto, and its position, from the user's portfolio."""
     supabase.table("portfolio").delete().eq("ticker", ticker).eq("user_id", user_id).execute()
+    supabase.table("positions").delete().eq("ticker", ticker).eq("user_id", user_id).execute()
+    _write_through(user_id, lambda positions: {t: p for t, p in positions.items() if t != ticker})
+
+def import_portfolio_csv(fileobj, user_id, chunk_size=IMPORT_CHUNK_SIZE, on_progress=None):
+    """
+    Imports buys and sells from a CSV upload with one multi-row insert per chunk.
+
+    Rows are parsed as a stream, and the tickers of each chunk are validated
+    against the metadata cache before inserting it. Sells are checked against
+    the quantity held at that point of the file. The positions are brought up
+    to date once at the end with whatever was inserted: if a chunk fails, the
+    previous ones stay imported and the failure is reported as one more error
+    at the first line of that chunk. Returns the number of imported rows and
+    a list of (line_number, error) for the rejected ones.
+    """
+    total_bytes = max(getattr(fileobj, "size", 0), 1)
+    rows = iter_import_rows(fileobj, BASE_CURRENCY, SUPPORTED_CURRENCIES)
+    positions = load_positions(user_id)
+    held = {ticker: position.cantidad for ticker, position in positions.items()}
+    currencies = {ticker: position.precio_compra_currency for ticker, position in positions.items()}
+    inserted, errors = [], []
+
+    chunk_line = 1
+    try:
+        for chunk in chunked(rows, chunk_size):
+            chunk_line = chunk[0][0]
+            ticker_details = get_ticker_details([row["ticker"] for _, row, _ in chunk if row])
+            batch = []
+            for line_number, row, error in chunk:
+                if row is not None and not ticker_details.get(row["ticker"], {}).get("currency"):
+                    error = f"ticker desconocido: {row['ticker']}"
+                elif row is not None and row["tipo"] == "venta":
+                    ticker = row["ticker"]
+                    # Sin divisa, la venta está en la de la posición
+                    row["precio_compra_currency"] = row["precio_compra_currency"] or currencies.get(ticker)
+                    if row["cantidad"] > held.get(ticker, 0.0) + QUANTITY_EPSILON:
+                        error = f"venta de {row['cantidad']:g} {ticker} con solo {held.get(ticker, 0.0):g} en cartera"
+                    elif row["precio_compra_currency"] != currencies.get(ticker):
+                        error = f"la venta de {ticker} debe estar en {currencies.get(ticker)}, la divisa de la posición"
+                if error:
+                    errors.append((line_number, error))
+                    continue
+                sign = -1 if row["tipo"] == "venta" else 1
+                held[row["ticker"]] = held.get(row["ticker"], 0.0) + sign * row["cantidad"]
+                currencies.setdefault(row["ticker"], row["precio_compra_currency"])
+                batch.append(dict(row, user_id=user_id))
+            if batch:
+                response = supabase.table("portfolio").insert(batch).execute()
+                inserted.extend(response.data)
+            if on_progress:
+                on_progress(min(fileobj.tell() / total_bytes, 1.0))
+    except Exception as e:
+        # Los bloques anteriores ya están guardados y se aplican igualmente a las posiciones
+        errors.append((chunk_line, f"no se pudo importar desde esta línea ({e}); {len(inserted)} movimientos ya guardados"))
+
+    if inserted:
+        _apply_inserted(user_id)
+    return len(inserted), errors
+
+def load_positions(user_id):
+    """
+    Positions of the user by ticker (see ledger.Position), one stored row
+    per ticker. The result is cached in the session and only re-read from
+    Supabase when another session of the same user has written since (or
+    after "Recargar datos" drops the cache).
+    """
+    version = get_portfolio_versions()["versions"].get(user_id, 0)
+    cache = st.session_state.get("portfolio_cache")
+    if cache and cache["user_id"] == user_id and cache["version"] == version:
+        return cache["positions"]
+
+    with TRACE.span("load_portfolio"):
+        if PORTFOLIO_AGGREGATION == "server":
+            # Una fila por ticker con el coste restante, sin el detalle de los lotes. Los movimientos
+            # que aún no estén en las posiciones guardadas se aplican solo en memoria: sin los lotes
+            # reales no se pueden volver a guardar
+            response = supabase.rpc("get_portfolio_positions", {"p_user_id": user_id}).execute()
+            positions = {row["ticker"]: Position.from_row(row) for row in response.data}
+            apply_new_trades(supabase, user_id, positions, COST_BASIS_METHOD)
+        else:
+            positions = _sync_positions(user_id)
+        _cache_positions(user_id, version, positions)
+    return positions
 
 def load_portfolio(user_id):
-    """Loads all items from the user's portfolio."""
+    """Open lots of the user's positions, one row per lot with the columns of a ledger buy."""
     if not user_id:
         return pd.DataFrame() # Devuelve un dataframe vacío si no hay ID de usuario
-    
-    # Filtra por el user_id para cargar solo los datos de ese usuario
-    response = supabase.table("portfolio").select("*").eq("user_id", user_id).execute()
-    return pd.DataFrame(response.data)
+    load_positions(user_id)
+    return st.session_state.portfolio_cache["df"]
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=64)
+def load_ledger(user_id, version):
+    """
+    Every buy and sell of the user in ledger order, for the value history.
+    `version` (see get_portfolio_versions) makes each write of this process
+    read them again.
+    """
+    response = supabase.table("portfolio").select(TRADE_COLUMNS).eq("user_id", user_id).order("id").execute()
+    return pd.DataFrame(response.data, columns=TRADE_COLUMNS.split(","))
 
 # -----------------------------------------------
 # DATA FETCHING & CALCULATION FUNCTIONS
 # -----------------------------------------------
-def calculate_portfolio_summary(user_id):
+def calculate_portfolio_summary(user_id, quotes=None):
     """
     Loads portfolio data, fetches current prices and exchange rates,
-    and calculates summary metrics in BASE_CURRENCY.
+    and calculates summary metrics in BASE_CURRENCY. With a `quotes` dict,
+    the quotes of the tickers and FX pairs it valued with are added to it.
     """
     df_portfolio = load_portfolio(user_id) # Pasa el user_id
     if df_portfolio.empty:
         return 0.0, 0.0, pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
-    rates = get_exchange_rates()
-    
-    total_invested_base = 0.0
-    total_market_value_base = 0.0
-    portfolio_details = []
+    with TRACE.span("exchange_rates"):
+        rates = get_exchange_rates(quotes=quotes)
 
     tickers = df_portfolio['ticker'].unique().tolist()
-    data = yf.download(tickers, period="1d", interval="1m")
+    with TRACE.span("quotes"):
+        ticker_quotes = get_quote_service().get_quotes(tickers)
+    if quotes is not None:
+        quotes.update(ticker_quotes)
+    prices = {ticker: quote[0] for ticker, quote in ticker_quotes.items()}
+    # Resuelve también los tickers introducidos como "Otro" la primera vez que aparecen
+    with TRACE.span("ticker_details"):
+        ticker_details = get_ticker_details(tickers)
+
+    # Coste de cada compra al tipo de cambio del día en que se hizo
+    with TRACE.span("purchase_fx"):
+        lot_rates = get_purchase_fx_rates(df_portfolio.reindex(columns=PURCHASE_FX_COLUMNS))
+
+    with TRACE.span("summarize"):
+        return summarize_portfolio(
+            df_portfolio, prices, rates, ticker_details, CRYPTO_TICKERS, BASE_CURRENCY, lot_rates=lot_rates
+        )
 
-    for ticker in tickers:
-        df_ticker_purchases = df_portfolio[df_portfolio['ticker'] == ticker]
-        
-        cantidad_total = df_ticker_purchases['cantidad'].sum()
-        
-        total_cost_per_ticker = (df_ticker_purchases['cantidad'] * df_ticker_purchases['precio_compra']).sum()
-        precio_compra_promedio = total_cost_per_ticker / cantidad_total if cantidad_total > 0 else 0
-        
-        compra_currency = df_ticker_purchases['precio_compra_currency'].iloc[0]
-        nombre_personalizado = df_ticker_purchases['nombre_personalizado'].iloc[0] or TICKER_DETAILS.get(ticker, {}).get('name')
-        
-        stock_currency = TICKER_DETAILS.get(ticker, {}).get('currency')
+def calculate_realized_pnl(user_id):
+    """Realized P&L of every sale so far, converted to BASE_CURRENCY at today's rates."""
+    realized = realized_by_currency(load_positions(user_id))
+    if not realized:
+        return 0.0
+    rates = get_exchange_rates()
+    return sum(amount * rates.get(currency, 1.0) for currency, amount in realized.items())
 
-        current_price = None
-        if not data.empty and ('Close', ticker) in data.columns:
-            ticker_close_data = data['Close'][ticker].dropna()
-            if not ticker_close_data.empty:
-                current_price = ticker_close_data.iloc[-1]
-        
-        # --- LÓGICA DE CONVERSIÓN MEJORADA ---
-        # Se obtiene la tasa de cambio de manera segura, con 1.0 como valor por defecto.
-        rate_compra_to_base = rates.get(compra_currency, 1.0)
-        rate_stock_to_base = rates.get(stock_currency, 1.0)
-        
-        invested_original = cantidad_total * precio_compra_promedio
-        invested_base = invested_original * rate_compra_to_base
-        
-        if pd.isna(current_price) or current_price is None or current_price == 0:
-            market_value_original = 0.0
-            market_value_base = 0.0
-            rentabilidad_porcentaje = 0.0
-            rentabilidad_valor_original = 0.0
-        else:
-            market_value_original = cantidad_total * current_price
-            market_value_base = market_value_original * rate_stock_to_base
-            
-            if float(invested_original) != 0:
-                rentabilidad_porcentaje = ((market_value_original - invested_original) / invested_original) * 100
-                rentabilidad_valor_original = market_value_original - invested_original
-            else:
-                rentabilidad_porcentaje = 0.0
-                rentabilidad_valor_original = 0.0
-        
-        total_invested_base += invested_base
-        total_market_value_base += market_value_base
-
-        portfolio_details.append({
-            "Ticker": ticker,
-            "Nombre": nombre_personalizado,
-            "Cantidad": cantidad_total,
-            "Divisa de Compra": compra_currency,
-            "Divisa de Activo": stock_currency,
-            f"Precio de Compra Promedio ({compra_currency})": precio_compra_promedio,
-            f"Precio Actual ({stock_currency})": current_price,
-            f"Valor de Mercado ({BASE_CURRENCY})": market_value_base,
-            f"Valor de Mercado Original ({stock_currency})": market_value_original,
-            f"Rentabilidad ({stock_currency})": rentabilidad_valor_original,
-            "Rentabilidad (%)": rentabilidad_porcentaje,
-            f"Inversión Inicial ({BASE_CURRENCY})": invested_base,
-            f"Inversión Inicial Original ({compra_currency})": invested_original,
-            "Tipo": "Criptoactivo" if ticker in CRYPTO_TICKERS else "Acción"
-        })
-    
-    df_details = pd.DataFrame(portfolio_details)
-    
-    numeric_cols = [
-        f'Valor de Mercado ({BASE_CURRENCY})',
-        'Rentabilidad (%)',
-        f'Inversión Inicial ({BASE_CURRENCY})'
-    ]
-    for col in numeric_cols:
-        if col in df_details.columns:
-            df_details[col] = pd.to_numeric(df_details[col], errors='coerce')
-    
-    df_acciones = df_details[df_details['Tipo'] == 'Acción'].copy()
-    df_cryptos = df_details[df_details['Tipo'] == 'Criptoactivo'].copy()
+@st.cache_data(ttl=3600, show_spinner=False)
+def refresh_price_history(tickers):
+    """Brings the local daily history of the given tickers up to date, at most once per hour."""
+    return get_price_history_store().refresh(list(tickers), interval="1d")
 
-    total_market_value_from_df = df_details[f'Valor de Mercado ({BASE_CURRENCY})'].sum()
-    if total_market_value_from_df > 0:
-        df_details['Peso en el Portfolio (%)'] = (df_details[f'Valor de Mercado ({BASE_CURRENCY})'] / total_market_value_from_df) * 100
-    else:
-        df_details['Peso en el Portfolio (%)'] = 0.0
+@st.cache_data(ttl=3600, show_spinner=False)
+def get_fx_history(start):
+    """
+    Daily value of one unit of every supported currency in BASE_CURRENCY
+    since `start`, from the FX pairs of the local price history. The pairs
+    are brought up to date first; without Yahoo the stored days are used.
+    """
+    try:
+        refresh_price_history(tuple(sorted(supported_fx_symbols().values())))
+    except Exception:
+        pass  # Se usan los días ya guardados; sin ellos, el tipo de cambio de hoy
+    return get_price_history_store().fx_to_base(SUPPORTED_CURRENCIES, BASE_CURRENCY, start)
 
-    if not df_acciones.empty:
-        total_market_value_acciones = df_acciones[f'Valor de Mercado ({BASE_CURRENCY})'].sum()
-        if total_market_value_acciones > 0:
-            df_acciones['Peso en el Portfolio (%)'] = (df_acciones[f'Valor de Mercado ({BASE_CURRENCY})'] / total_market_value_acciones) * 100
-        else:
-            df_acciones['Peso en el Portfolio (%)'] = 0.0
-    
-    if not df_cryptos.empty:
-        total_market_value_cryptos = df_cryptos[f'Valor de Mercado ({BASE_CURRENCY})'].sum()
-        if total_market_value_cryptos > 0:
-            df_cryptos['Peso en el Portfolio (%)'] = (df_cryptos[f'Valor de Mercado ({BASE_CURRENCY})'] / total_market_value_cryptos) * 100
-        else:
-            df_cryptos['Peso en el Portfolio (%)'] = 0.0
-    
-    return total_invested_base, total_market_value_base, df_details, df_acciones, df_cryptos
+# Columnas de las que depende el tipo de cambio de cada compra
+PURCHASE_FX_COLUMNS = ['created_at', 'fecha_compra', 'precio_compra_currency']
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=64)
+def get_purchase_fx_rates(df_lots):
+    """
+    Rate to BASE_CURRENCY of every lot on its purchase date (NaN where it is
+    unknown). Cached by the contents of the lots: parsing their dates costs
+    more than hashing them, and they only change when a purchase is added.
+    """
+    start = purchase_dates(df_lots).min()
+    if pd.isna(start):
+        return None
+    return lot_fx_rates(df_lots, get_fx_history(start))
+
+def calculate_portfolio_history(user_id):
+    """
+    Daily market value, invested capital and P&L in BASE_CURRENCY since the
+    first purchase, computed from the whole ledger and the local price history.
+    """
+    df_portfolio = load_ledger(user_id, get_portfolio_versions()["versions"].get(user_id, 0))
+    start = purchase_dates(df_portfolio).min() if not df_portfolio.empty else pd.NaT
+    if pd.isna(start):
+        return pd.DataFrame()
+
+    tickers = df_portfolio['ticker'].unique().tolist()
+    try:
+        # Los pares de divisas los pone al día get_fx_history
+        refresh_price_history(tuple(sorted(tickers)))
+    except Exception as e:
+        # Sin conexión con Yahoo se dibuja con las barras ya guardadas
+        st.warning(f"⚠️ No se pudo actualizar el histórico de precios ({e}). Se muestran los datos guardados.")
+
+    closes = get_price_history_store().closes(tickers, start=start)
+    fx_to_base = get_fx_history(start)
+    if fx_to_base.empty:
+        return pd.DataFrame()
+
+    ticker_currencies = {t: d.get('currency') for t, d in get_ticker_details(tickers).items()}
+    return portfolio_value_history(df_portfolio, closes, fx_to_base, ticker_currencies, method=COST_BASIS_METHOD)
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=16)
+def get_scenario_returns(tickers, currencies):
+    """
+    Daily log returns of the held tickers and currencies over the last
+    SCENARIO_LOOKBACK_DAYS, from the local price history, for the Monte
+    Carlo scenarios (see scenarios.daily_log_returns).
+    """
+    start = pd.Timestamp.now().normalize() - pd.Timedelta(days=SCENARIO_LOOKBACK_DAYS)
+    try:
+        refresh_price_history(tuple(sorted(tickers)))
+    except Exception:
+        pass  # Se usan los días ya guardados
+    closes = get_price_history_store().closes(list(tickers), start=start)
+    return daily_log_returns(closes, get_fx_history(start), tickers, currencies)
+
+# Columnas que necesitan los gráficos de distribución
+DISTRIBUTION_COLUMNS = ['Nombre', f'Valor de Mercado ({BASE_CURRENCY})', 'Rentabilidad (%)']
+
+# cache_resource en lugar de cache_data: deserializar una figura de plotly
+# cuesta casi lo mismo que construirla, así que se comparte el objeto
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_distribution_pie(df, value_column, title, **layout):
+    """
+    Distribution donut of a details frame. The cache key is the hash of the
+    frame's contents, so reruns with unchanged data reuse the same figure,
+    which must not be modified.
+    """
+    return distribution_pie(df, value_column, title, **layout)
 
 # -----------------------------------------------
 # STREAMLIT APP LAYOUT
 # -----------------------------------------------
-st.set_page_config(page_title="Gestor de Portfolio de Inversión", layout="wide")
 
 # --- Initialize session state for user authentication ---
 if 'logged_in' not in st.session_state:
@@ -441,6 +759,20 @@ if 'logged_in' not in st.session_state:
 if 'username' not in st.session_state:
     st.session_state.username = None
 
+# Traza de esta ejecución del script (no hace nada si el trazado está apagado)
+TRACE = get_tracer().trace(enabled=PERF_TRACING or st.session_state.get("show_timings", False))
+
+def start_session(username):
+    """Marks the session as logged in and issues its signed token."""
+    st.session_state.logged_in = True
+    st.session_state.username = username
+    st.session_state.auth_token = get_session_signer().issue(username)
+
+# La sesión solo sigue abierta con un token firmado, sin caducar y del mismo usuario
+if st.session_state.logged_in and get_session_signer().verify(st.session_state.get("auth_token")) != st.session_state.username:
+    st.session_state.logged_in = False
+    st.session_state.username = None
+
 # -----------------------------------------------
 # AUTHENTICATION FORM (En la página principal)
 # -----------------------------------------------
@@ -458,8 +790,7 @@ if not st.session_state.logged_in:
             if username and password:
                 success, message = login_user(username, password)
                 if success:
-                    st.session_state.logged_in = True
-                    st.session_state.username = username
+                    start_session(username)
                     st.success(message)
                     st.rerun()
                 else:
@@ -477,8 +808,7 @@ if not st.session_state.logged_in:
                 success, message = register_user(new_username, new_password)
                 if success:
                     # Inicia sesión automáticamente después de un registro exitoso
-                    st.session_state.logged_in = True
-                    st.session_state.username = new_username
+                    start_session(new_username)
                     st.success(message + " ¡Iniciando sesión automáticamente!")
                     st.rerun()
                 else:
@@ -494,7 +824,35 @@ else:
     if st.sidebar.button("Cerrar Sesión"):
         st.session_state.logged_in = False
         st.session_state.username = None
+        st.session_state.pop("auth_token", None)
+        st.session_state.pop("portfolio_cache", None)
         st.rerun()
+    if st.sidebar.button("🔄 Recargar datos"):
+        # La carga del dashboard, más abajo, vuelve a leer de Supabase
+        st.session_state.pop("portfolio_cache", None)
+
+# -----------------------------------------------
+# DASHBOARD IMPORTS
+# -----------------------------------------------
+# La página de inicio de sesión termina en st.stop() antes de llegar aquí, así
+# que nunca carga pandas, plotly ni yfinance. Python guarda los módulos ya
+# importados, por lo que en las siguientes ejecuciones esto no cuesta nada.
+import pandas as pd
+import plotly.express as px
+from charts import distribution_pie, scenario_histogram
+from display import format_details_table
+from ledger import (
+    QUANTITY_EPSILON, TRADE_COLUMNS, Position, apply_new_trades, open_lots, realized_by_currency, sync_positions
+)
+from market_data import (
+    QuotePrewarmer, QuoteService, TickerMetadataCache, cross_rate_matrix, fetch_fx_quotes, fetch_last_prices,
+    fx_symbol, is_market_open
+)
+from price_history import PriceHistoryStore
+from scenarios import MIN_HISTORY_DAYS, Exposure, daily_log_returns, risk_summary, simulate
+from snapshots import SnapshotStore
+from valuation import lot_fx_rates, portfolio_value_history, purchase_dates, summarize_portfolio
+from yahoo_client import default_client
 
 # -----------------------------------------------
 # GESTIÓN DEL PORTFOLIO (Only visible if logged in)
@@ -512,32 +870,39 @@ else:
     stock_tickers_in_portfolio = []
     crypto_tickers_in_portfolio = []
 
+# Registra los tickers de esta sesión para que el hilo de fondo los mantenga actualizados
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+get_quote_prewarmer().track(st.session_state.session_id, portfolio_tickers)
+
 # --- Formulario para Añadir Acciones ---
+# El buscador queda fuera del formulario para que los resultados cambien al escribir
+st.sidebar.subheader("Añadir Acciones")
+ticker_query = st.sidebar.text_input("Buscar Acción (ticker o nombre)", value="", key="ticker_search")
 with st.sidebar.form("acciones_form"):
-    st.subheader("Añadir Acciones")
-    ticker_choice = st.selectbox(
+    ticker_record = st.selectbox(
         "Selecciona un Ticker de Acción:",
-        options=["-- Selecciona uno --", "Otro"] + sorted(GLOBAL_DISPLAY_NAMES),
+        options=search_stock_symbols(ticker_query),
+        format_func=format_symbol_record,
+        index=None,
+        placeholder="-- Selecciona uno --" if ticker_query.strip() else "Escribe arriba para buscar",
         key="ticker_selector"
     )
-    ticker_manual = st.text_input("Escribe el Ticker de la Acción: (sólo si indicaste Otro)", value="", key="ticker_manual_input_key").upper()
-
-    ticker_to_add_accion = ""
-    if ticker_choice == "Otro":
-        ticker_to_add_accion = ticker_manual
-    elif ticker_choice != "-- Selecciona uno --":
-        match = re.search(r'\((.*?)\)', ticker_choice)
-        ticker_to_add_accion = match.group(1) if match else ""
+    ticker_to_add_accion = ticker_record["symbol"] if ticker_record else ""
     
     cantidad_input_accion = st.number_input("Cantidad", min_value=0.00000001, value=1.0, step=0.00000001, format="%.8f", key="cantidad_add_input_accion")
     precio_compra_input_accion = st.number_input("Precio de Compra por acción", min_value=0.01, value=100.0, format="%.2f", key="precio_add_input_accion")
     compra_currency_accion = st.selectbox("Divisa de Compra", options=SUPPORTED_CURRENCIES, key="currency_select_accion")
+    fecha_compra_accion = st.date_input("Fecha de Compra", value="today", max_value="today", format="DD/MM/YYYY", key="fecha_add_input_accion")
     nombre_personalizado_accion = st.text_input("Nombre Personalizado (Opcional)", key="nombre_add_input_accion")
     
     submitted_accion = st.form_submit_button("Añadir Acción")
     if submitted_accion:
-        if ticker_to_add_accion:
-            save_portfolio_item(ticker_to_add_accion, cantidad_input_accion, precio_compra_input_accion, compra_currency_accion, nombre_personalizado_accion, user_id)
+        # Un ticker escrito a mano que no está en el índice se comprueba con Yahoo, como en la importación
+        if ticker_record and ticker_record["name"] is None and not get_ticker_details([ticker_to_add_accion]).get(ticker_to_add_accion, {}).get("currency"):
+            st.error(f"❌ Yahoo Finance no reconoce el ticker '{ticker_to_add_accion}'.")
+        elif ticker_to_add_accion:
+            save_portfolio_item(ticker_to_add_accion, cantidad_input_accion, precio_compra_input_accion, compra_currency_accion, nombre_personalizado_accion, user_id, fecha_compra_accion)
             st.success(f"✔️ Activo '{ticker_to_add_accion}' añadido con éxito.")
             st.rerun()  
         else:
@@ -548,26 +913,26 @@ st.sidebar.markdown("---")
 # --- Formulario para Añadir Criptomonedas ---
 with st.sidebar.form("cripto_form"):
     st.subheader("Añadir Criptomonedas")
-    ticker_choice_cripto = st.selectbox(
+    crypto_names = {info["symbol_usd"]: info["name"] for info in CRYPTO_TICKERS_INFO.values()}
+    ticker_to_add_cripto = st.selectbox(
         "Selecciona una Criptomoneda:",
-        options=["-- Selecciona uno --"] + sorted(CRYPTO_DISPLAY_NAMES),
+        options=sorted(crypto_names, key=crypto_names.get),
+        format_func=lambda symbol: f"{crypto_names[symbol]} ({symbol})",
+        index=None,
+        placeholder="-- Selecciona uno --",
         key="crypto_selector"
-    )
-    
-    ticker_to_add_cripto = ""
-    if ticker_choice_cripto != "-- Selecciona uno --":
-        match = re.search(r'\((.*?)\)', ticker_choice_cripto)
-        ticker_to_add_cripto = match.group(1) if match else ""
+    ) or ""
     
     cantidad_input_cripto = st.number_input("Cantidad", min_value=0.00000001, value=1.0, step=0.00000001, format="%.8f", key="cantidad_add_input_cripto")
     precio_compra_input_cripto = st.number_input("Precio de Compra", min_value=0.01, value=100.0, format="%.2f", key="precio_add_input_cripto")
     compra_currency_cripto = st.selectbox("Divisa de Compra", options=["USD"], key="currency_select_cripto")
+    fecha_compra_cripto = st.date_input("Fecha de Compra", value="today", max_value="today", format="DD/MM/YYYY", key="fecha_add_input_cripto")
     nombre_personalizado_cripto = st.text_input("Nombre Personalizado (Opcional)", key="nombre_add_input_cripto")
     
     submitted_cripto = st.form_submit_button("Añadir Criptomoneda")
     if submitted_cripto:
         if ticker_to_add_cripto:
-            save_portfolio_item(ticker_to_add_cripto, cantidad_input_cripto, precio_compra_input_cripto, compra_currency_cripto, nombre_personalizado_cripto, user_id)
+            save_portfolio_item(ticker_to_add_cripto, cantidad_input_cripto, precio_compra_input_cripto, compra_currency_cripto, nombre_personalizado_cripto, user_id, fecha_compra_cripto)
             st.success(f"✔️ Activo '{ticker_to_add_cripto}' añadido con éxito.")
             st.rerun()  
         else:
@@ -575,17 +940,85 @@ with st.sidebar.form("cripto_form"):
 
 st.sidebar.markdown("---")
 
+# --- Formulario para Vender Activos ---
+with st.sidebar.form("vender_form"):
+    st.subheader("Vender Activo")
+    held_positions = {t: p for t, p in load_positions(user_id).items() if p.cantidad > 0}
+    ticker_to_sell = st.selectbox(
+        "Selecciona un ticker para vender:",
+        options=sorted(held_positions),
+        format_func=lambda t: f"{t} ({held_positions[t].cantidad:g} en cartera, {held_positions[t].precio_compra_currency})",
+        index=None,
+        placeholder="-- Selecciona uno --",
+        key="sell_ticker_select"
+    )
+    cantidad_input_venta = st.number_input("Cantidad", min_value=0.00000001, value=1.0, step=0.00000001, format="%.8f", key="cantidad_sell_input")
+    precio_venta_input = st.number_input("Precio de Venta (en la divisa de compra)", min_value=0.01, value=100.0, format="%.2f", key="precio_sell_input")
+    fecha_venta = st.date_input("Fecha de Venta", value="today", max_value="today", format="DD/MM/YYYY", key="fecha_sell_input")
+
+    submitted_sell = st.form_submit_button("Vender")
+    if submitted_sell:
+        if ticker_to_sell:
+            try:
+                sell_portfolio_item(ticker_to_sell, cantidad_input_venta, precio_venta_input, user_id, fecha_venta)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                st.success(f"✔️ Venta de '{ticker_to_sell}' registrada con éxito.")
+                st.rerun()
+        else:
+            st.warning("⚠️ Debes seleccionar un ticker para vender.")
+
+st.sidebar.markdown("---")
+
+# --- Formulario para Importar Compras desde CSV ---
+with st.sidebar.form("importar_form", clear_on_submit=True):
+    st.subheader("Importar Movimientos (CSV)")
+    uploaded_csv = st.file_uploader(
+        "Archivo CSV",
+        type=["csv"],
+        help="Columnas: ticker, cantidad, precio_compra y, opcionalmente, tipo (compra o venta), precio_compra_currency, nombre_personalizado y fecha_compra. En las ventas, precio_compra y fecha_compra son los de la venta.",
+        key="import_csv_uploader"
+    )
+    submitted_import = st.form_submit_button("Importar")
+
+    if submitted_import:
+        if uploaded_csv is not None:
+            import_progress = st.progress(0.0, text="Importando movimientos...")
+            try:
+                imported_count, import_errors = import_portfolio_csv(
+                    uploaded_csv, user_id, on_progress=lambda fraction: import_progress.progress(fraction, text="Importando movimientos...")
+                )
+            except Exception as e:
+                import_progress.empty()
+                st.error(f"❌ Error al importar los movimientos: {e}")
+            else:
+                import_progress.empty()
+                if import_errors:
+                    st.warning(
+                        f"⚠️ {imported_count} movimientos importados, {len(import_errors)} filas descartadas:\n\n"
+                        + "\n".join(f"- Línea {line}: {error}" for line, error in import_errors[:20])
+                    )
+                else:
+                    st.success(f"✔️ {imported_count} movimientos importados con éxito.")
+                    st.rerun()
+        else:
+            st.error("❌ Debes seleccionar un archivo CSV.")
+
+st.sidebar.markdown("---")
+
 # --- Formulario para Eliminar Activos ---
 with st.sidebar.form("eliminar_form"):
     st.subheader("Eliminar Activo")
-    tickers_in_portfolio = sorted(portfolio_tickers)
+    # También los activos ya vendidos del todo, que conservan sus movimientos
+    tickers_in_portfolio = sorted(load_positions(user_id))
     ticker_to_delete = st.selectbox("Selecciona un ticker para eliminar:", options=["-- Selecciona uno --"] + tickers_in_portfolio, key="delete_ticker_select")
     submitted_delete = st.form_submit_button("Eliminar")
 
     if submitted_delete:
         if ticker_to_delete and ticker_to_delete != "-- Selecciona uno --":
             delete_portfolio_item(ticker_to_delete, user_id)
-            st.success(f"✔️ Todas las compras del activo '{ticker_to_delete}' eliminadas.")
+            st.success(f"✔️ Todos los movimientos del activo '{ticker_to_delete}' eliminados.")
             st.rerun()  
         else:
             st.warning("⚠️ Debes seleccionar un ticker para eliminar.")
@@ -593,20 +1026,84 @@ with st.sidebar.form("eliminar_form"):
 st.sidebar.markdown("---")
 st.sidebar.info(f"El valor total se calcula en {BASE_CURRENCY}.")
 
+live_mode = st.sidebar.toggle(
+    "📡 Modo en directo",
+    key="live_mode",
+    help="Actualiza solo las cotizaciones, el resumen y los gráficos sin recargar la página. Se pausa con los mercados cerrados si no tienes criptomonedas."
+)
+live_interval = st.sidebar.selectbox(
+    "Actualizar cada",
+    options=LIVE_REFRESH_OPTIONS,
+    index=LIVE_REFRESH_OPTIONS.index(60),
+    format_func=lambda seconds: f"{seconds} s" if seconds < 60 else f"{seconds // 60} min",
+    key="live_interval",
+    disabled=not live_mode
+)
+
 # --- MAIN CONTENT: Dashboard ---
 st.title("💰 Dashboard de Portfolio de Inversión")
 st.markdown("Revisa el rendimiento de tu portfolio en tiempo real y gestiona tus inversiones.")
 
-total_invested_base, total_market_value_base, df_details, df_acciones, df_cryptos = calculate_portfolio_summary(user_id)
+# Modo en directo: solo se vuelve a ejecutar el resumen, y solo mientras algún activo cotiza
+live_every = live_interval if live_mode and live_tickers(portfolio_tickers) else None
+
+if live_mode and live_every is None and portfolio_tickers:
+    @st.fragment(run_every=LIVE_PAUSED_CHECK_SECONDS)
+    def watch_markets():
+        """While live mode is paused, waits for a market of the held tickers to open."""
+        if live_tickers(portfolio_tickers):
+            st.rerun(scope="app")
+        st.caption("⏸️ Modo en directo en pausa: los mercados de tus activos están cerrados.")
+
+    watch_markets()
+
+@st.fragment(run_every=live_every)
+def render_portfolio_summary():
+    """
+    Metrics, distribution charts and details table. In live mode this
+    fragment is the only part of the page that reruns on every tick.
+    """
+    if live_every is not None:
+        tickers_now_live = live_tickers(portfolio_tickers)
+        if not tickers_now_live:
+            # Han cerrado los mercados: una ejecución completa pone el modo en pausa
+            st.rerun(scope="app")
+        get_quote_service().refresh_older_than(tickers_now_live, live_every)
+
+    # Antigüedad y avisos a partir de las cotizaciones con las que se ha valorado, no de las que
+    # haya ahora en el servicio: un refresco en segundo plano puede haber terminado entretanto
+    quotes = {}
+    total_invested_base, total_market_value_base, df_details, df_acciones, df_cryptos = calculate_portfolio_summary(user_id, quotes)
+    fx_names = {symbol: f"{currency}/USD" for currency, symbol in supported_fx_symbols().items()}
+    held_tickers = df_details['Ticker'].tolist() if not df_details.empty else []
+    rendered = {symbol: quotes[symbol] for symbol in [*held_tickers, *fx_names] if symbol in quotes}
+    last_known = {symbol: fetched_at for symbol, (_, fetched_at, stale) in rendered.items() if stale}
+    st.session_state.rendered_last_known = list(last_known)
+    if df_details.empty:
+        st.info("ℹ️ Tu portfolio está vacío. Usa la barra lateral para añadir tus primeros activos.")
+        return
 
-if not df_details.empty:
     st.markdown("### Resumen del Portfolio")
+    priced_at = [fetched_at for price, fetched_at, _ in rendered.values() if price is not None]
+    now = datetime.now().timestamp()
+    if priced_at:
+        st.caption(f"🕒 Datos a las {datetime.fromtimestamp(min(priced_at)):%d/%m/%Y %H:%M:%S} ({format_age(now - min(priced_at))})")
+    if last_known:
+        st.warning(
+            f"⏳ Mostrando el último precio guardado de {', '.join(sorted(fx_names.get(s, s) for s in last_known))} "
+            f"(el más antiguo, {format_age(now - min(last_known.values()))}). Se actualizará en cuanto responda Yahoo Finance."
+        )
+    without_price = [t for t in held_tickers if quotes.get(t, (None,))[0] is None]
+    if without_price:
+        st.warning(f"⚠️ Sin cotización para {', '.join(without_price)}: su valor de mercado cuenta como 0.")
     total_invested_base_float = float(total_invested_base)
     total_market_value_base_float = float(total_market_value_base)
     rentabilidad_total = total_market_value_base_float - total_invested_base_float
     rentabilidad_porcentaje = (rentabilidad_total / total_invested_base_float) * 100 if total_invested_base_float != 0 else 0
 
-    col1, col2, col3 = st.columns(3)
+    rentabilidad_realizada = calculate_realized_pnl(user_id)
+
+    col1, col2, col3, col4 = st.columns(4)
     
     col1.metric(f"Valor Total del Portfolio ({BASE_CURRENCY})", f"${total_market_value_base_float:,.2f}")
     col2.metric(f"Inversión Inicial ({BASE_CURRENCY})", f"${total_invested_base_float:,.2f}")
@@ -616,180 +1113,230 @@ if not df_details.empty:
         "Rentabilidad Total",
         f"${rentabilidad_total:,.2f}",
         f"{rentabilidad_porcentaje:,.2f}%",
-        delta_color=delta_color
+        delta_color=delta_color,
+        help="De los activos en cartera; lo ganado con las ventas cuenta en la rentabilidad realizada."
+    )
+    col4.metric(
+        f"Rentabilidad Realizada ({BASE_CURRENCY})",
+        f"${rentabilidad_realizada:,.2f}",
+        help=f"Ganancia de las ventas frente al coste de las compras que cierran ({'coste medio' if COST_BASIS_METHOD == 'average' else 'FIFO'}), al tipo de cambio de hoy."
     )
 
     st.markdown("---")
     
     st.markdown("### Distribución del Portfolio")
-    col_pies_1, col_pies_2 = st.columns(2)
-    
-    # --- LÓGICA DE COLORES CENTRALIZADA Y ROBUSTA ---
-    red = (255, 0, 0)
-    yellow = (255, 255, 128)
-    green = (0, 128, 0)
-
-    def interpolate_color_bipolar_robust(val, min_neg, max_pos):
-        def interpolate_two_colors(color1, color2, ratio):
-            r = int(color1[0] * (1 - ratio) + color2[0] * ratio)
-            g = int(color1[1] * (1 - ratio) + color2[1] * ratio)
-            b = int(color1[2] * (1 - ratio) + color2[2] * ratio)
-            return f'rgb({r}, {g}, {b})'
-        
-        if val is None or pd.isna(val):
-            return 'rgb(192, 192, 192)'
-
-        if val < 0:
-            if min_neg is None or min_neg == 0:
-                return f'rgb({yellow[0]}, {yellow[1]}, {yellow[2]})'
-            ratio = min(1.0, abs(val) / abs(min_neg))
-            return interpolate_two_colors(yellow, red, ratio)
-        else:
-            if max_pos is None or max_pos == 0:
-                return f'rgb({yellow[0]}, {yellow[1]}, {yellow[2]})'
-            ratio = min(1.0, val / max_pos)
-            return interpolate_two_colors(yellow, green, ratio)
-    
-    # --- GRÁFICO DE ACCIONES ---
-    with col_pies_1:
-        df_acciones_positivas = df_acciones[df_acciones[f'Valor de Mercado ({BASE_CURRENCY})'] > 0].copy()
-        if not df_acciones_positivas.empty:
-            df_acciones_sorted = df_acciones_positivas.sort_values(by='Rentabilidad (%)')
-            min_neg_rent_acciones = df_acciones_sorted['Rentabilidad (%)'][df_acciones_sorted['Rentabilidad (%)'] < 0].min()
-            max_pos_rent_acciones = df_acciones_sorted['Rentabilidad (%)'][df_acciones_sorted['Rentabilidad (%)'] > 0].max()
-            
-            custom_colors_acciones = [
-                interpolate_color_bipolar_robust(val, min_neg_rent_acciones, max_pos_rent_acciones) 
-                for val in df_acciones_sorted['Rentabilidad (%)']
-            ]
-            
-            fig_acciones = px.pie(
-                df_acciones_sorted,
-                values=f'Valor de Mercado ({BASE_CURRENCY})',
-                names='Nombre',
-                title='Distribución de Acciones',
-                hole=0.4,
-                color='Nombre',
-                color_discrete_map={name: color for name, color in zip(df_acciones_sorted['Nombre'], custom_colors_acciones)}
+    with TRACE.span("pie_charts"):
+        col_pies_1, col_pies_2 = st.columns(2)
+
+        # --- GRÁFICO DE ACCIONES ---
+        with col_pies_1:
+            fig_acciones = get_distribution_pie(
+                df_acciones[DISTRIBUTION_COLUMNS], f'Valor de Mercado ({BASE_CURRENCY})', 'Distribución de Acciones'
             )
-            fig_acciones.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(fig_acciones, use_container_width=True)
-        else:
-            st.info("ℹ️ No hay acciones con valor de mercado positivo.")
-
-    # --- GRÁFICO DE CRIPTOMONEDAS ---
-    with col_pies_2:
-        df_cryptos_positivas = df_cryptos[df_cryptos[f'Valor de Mercado ({BASE_CURRENCY})'] > 0].copy()
-        if not df_cryptos_positivas.empty:
-            df_cryptos_sorted = df_cryptos_positivas.sort_values(by='Rentabilidad (%)')
-            min_neg_rent_cryptos = df_cryptos_sorted['Rentabilidad (%)'][df_cryptos_sorted['Rentabilidad (%)'] < 0].min()
-            max_pos_rent_cryptos = df_cryptos_sorted['Rentabilidad (%)'][df_cryptos_sorted['Rentabilidad (%)'] > 0].max()
-
-            custom_colors_cryptos = [
-                interpolate_color_bipolar_robust(val, min_neg_rent_cryptos, max_pos_rent_cryptos) 
-                for val in df_cryptos_sorted['Rentabilidad (%)']
-            ]
-
-            fig_cryptos = px.pie(
-                df_cryptos_sorted,
-                values=f'Valor de Mercado ({BASE_CURRENCY})',
-                names='Nombre',
-                title='Distribución de Criptomonedas',
-                hole=0.4,
-                color='Nombre',
-                color_discrete_map={name: color for name, color in zip(df_cryptos_sorted['Nombre'], custom_colors_cryptos)}
+            if fig_acciones is not None:
+                st.plotly_chart(fig_acciones, use_container_width=True)
+            else:
+                st.info("ℹ️ No hay acciones con valor de mercado positivo.")
+
+        # --- GRÁFICO DE CRIPTOMONEDAS ---
+        with col_pies_2:
+            fig_cryptos = get_distribution_pie(
+                df_cryptos[DISTRIBUTION_COLUMNS], f'Valor de Mercado ({BASE_CURRENCY})', 'Distribución de Criptomonedas'
             )
-            fig_cryptos.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(fig_cryptos, use_container_width=True)
-        else:
-            st.info("ℹ️ No hay criptomonedas con valor de mercado positivo.")
-    
-    # --- GRÁFICO TOTAL DEL PORTFOLIO ---
-    df_details_positivos = df_details[df_details[f'Valor de Mercado ({BASE_CURRENCY})'] > 0].copy()
-    if not df_details_positivos.empty:
-        df_sorted = df_details_positivos.sort_values(by='Rentabilidad (%)')
-        
-        min_neg_rent_total = df_sorted['Rentabilidad (%)'][df_sorted['Rentabilidad (%)'] < 0].min()
-        max_pos_rent_total = df_sorted['Rentabilidad (%)'][df_sorted['Rentabilidad (%)'] > 0].max()
+            if fig_cryptos is not None:
+                st.plotly_chart(fig_cryptos, use_container_width=True)
+            else:
+                st.info("ℹ️ No hay criptomonedas con valor de mercado positivo.")
 
-        custom_colors = [
-            interpolate_color_bipolar_robust(val, min_neg_rent_total, max_pos_rent_total) 
-            for val in df_sorted['Rentabilidad (%)']
-        ]
-        
-        fig_total = px.pie(
-            df_sorted,
-            values=f'Valor de Mercado ({BASE_CURRENCY})',
-            names='Nombre',
-            title='Distribución Total del Portfolio',
-            hole=0.4,
-            color='Nombre',
-            color_discrete_map={name: color for name, color in zip(df_sorted['Nombre'], custom_colors)}
+        # --- GRÁFICO TOTAL DEL PORTFOLIO ---
+        fig_total = get_distribution_pie(
+            df_details[DISTRIBUTION_COLUMNS], f'Valor de Mercado ({BASE_CURRENCY})', 'Distribución Total del Portfolio',
+            height=600, width=800
         )
-
-        fig_total.update_layout(height=600, width=800)
-        fig_total.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig_total, use_container_width=False)
-    else:
-        st.warning("⚠️ No hay activos con un valor de mercado positivo para mostrar en el gráfico.")
+        if fig_total is not None:
+            st.plotly_chart(fig_total, use_container_width=False)
+        else:
+            st.warning("⚠️ No hay activos con un valor de mercado positivo para mostrar en el gráfico.")
     
     st.markdown("---")
     
     st.markdown("### Detalles de los Activos")
     
-    df_display = df_details.copy()
-
-    def format_currency_symbol(currency_code):
-        return CURRENCY_SYMBOLS.get(currency_code, "")
-
-    def format_rentabilidad(row):
-        currency_code = TICKER_DETAILS.get(row['Ticker'], {}).get('currency')
-        value = row[f'Rentabilidad ({currency_code})']
-        symbol = format_currency_symbol(currency_code)
-        if pd.isna(value) or value is None:
-            return "N/A"
-        return f"{symbol}{value:,.2f}"
-
-    def format_valor_mercado(row):
-        currency_code = TICKER_DETAILS.get(row['Ticker'], {}).get('currency')
-        value = row[f'Valor de Mercado Original ({currency_code})']
-        symbol = format_currency_symbol(currency_code)
-        if pd.isna(value) or value is None:
-            return "N/A"
-        return f"{symbol}{value:,.2f}"
-
-    def format_price(value, currency_code):
-        symbol = format_currency_symbol(currency_code)
-        if pd.isna(value) or value is None:
-            return "N/A"
-        return f"{symbol}{value:,.2f}"
-    
-    def format_inversion_inicial(row):
-        currency_code = row['Divisa de Compra']
-        value = row[f'Inversión Inicial Original ({currency_code})']
-        symbol = format_currency_symbol(currency_code)
-        if pd.isna(value) or value is None:
-            return "N/A"
-        return f"{symbol}{value:,.2f}"
-
-    df_display['Valor de Mercado'] = df_display.apply(format_valor_mercado, axis=1)
-    df_display['Rentabilidad'] = df_display.apply(format_rentabilidad, axis=1)
-    df_display['Rentabilidad (%)'] = df_display['Rentabilidad (%)'].apply(lambda x: f'{x:.2f}%' if pd.notna(x) else 'N/A')
-    df_display['Inversión Inicial'] = df_display.apply(format_inversion_inicial, axis=1)
-    df_display['Peso en el Portfolio (%)'] = df_display['Peso en el Portfolio (%)'].apply(lambda x: f'{x:.2f}%' if pd.notna(x) else '0.00%')
-    df_display['Precio de Compra Promedio'] = df_display.apply(
-        lambda row: format_price(row[f'Precio de Compra Promedio ({row["Divisa de Compra"]})'], row["Divisa de Compra"]), axis=1
-    )
-    df_display['Precio Actual'] = df_display.apply(
-        lambda row: format_price(row[f'Precio Actual ({TICKER_DETAILS.get(row["Ticker"], {}).get("currency")})'], TICKER_DETAILS.get(row["Ticker"], {}).get("currency")), axis=1
-    )
-    
-    display_cols = [
-        'Nombre', 'Ticker', 'Tipo', 'Divisa de Activo', 'Cantidad', 'Precio de Compra Promedio', 'Precio Actual',
-        'Valor de Mercado', 'Rentabilidad', 'Rentabilidad (%)',
-        'Inversión Inicial', 'Peso en el Portfolio (%)'
-    ]
-    st.dataframe(df_display[display_cols], use_container_width=True)
+    with TRACE.span("details_table"):
+        df_display, details_column_config = format_details_table(df_details, CURRENCY_SYMBOLS)
+        st.dataframe(df_display, column_config=details_column_config, use_container_width=True)
+
+render_portfolio_summary()
+
+# Tras pintar desde la copia local, se vuelve a pintar una vez en cuanto llegan los precios nuevos:
+# los que se pintaron como último precio guardado y aún se están refrescando o ya tienen uno más nuevo
+rendered_last_known = set(st.session_state.get("rendered_last_known", []))
+snapshot_symbols = [
+    (service, [s for s in symbols if s in rendered_last_known])
+    for service, symbols in ((get_quote_service(), portfolio_tickers), (get_fx_service(), list(supported_fx_symbols().values())))
+]
+if not st.session_state.get("snapshot_refreshed") and any(
+    symbols and (service.refreshing(symbols) or len(service.last_known(symbols)) < len(symbols))
+    for service, symbols in snapshot_symbols
+):
+    @st.fragment(run_every=1)
+    def watch_snapshot_refresh():
+        """Reruns the page once the refresh of the prices restored from disk finishes."""
+        if not any(service.refreshing(symbols) for service, symbols in snapshot_symbols):
+            st.session_state.snapshot_refreshed = True
+            st.rerun(scope="app")
+
+    watch_snapshot_refresh()
+
+quote_stats = get_quote_service().stats()
+st.sidebar.caption(
+    f"📡 Caché de cotizaciones: {quote_stats['hits']} aciertos · {quote_stats['stale']} obsoletas · {quote_stats['misses']} fallos · "
+    f"{quote_stats['coalesced']} agrupadas · {quote_stats['fetches']} descargas"
+)
 
-else:
-    st.info("ℹ️ Tu portfolio está vacío. Usa la barra lateral para añadir tus primeros activos.")
\ No newline at end of file
+if not df_portfolio.empty:
+    st.markdown("---")
+
+    st.markdown("### Evolución del Portfolio")
+    with TRACE.span("history"):
+        with st.spinner("Cargando histórico de precios..."):
+            df_history = calculate_portfolio_history(user_id)
+        if not df_history.empty:
+            fig_history = px.line(
+                df_history,
+                y=["Valor de Mercado", "Capital Invertido"],
+                labels={"value": BASE_CURRENCY, "variable": "", "ts": "Fecha"},
+                title=f"Valor del Portfolio en {BASE_CURRENCY}"
+            )
+            st.plotly_chart(fig_history, use_container_width=True)
+        else:
+            st.info("ℹ️ Todavía no hay histórico suficiente para mostrar la evolución del portfolio.")
+
+    st.markdown("---")
+
+    st.markdown("### Escenarios y Pruebas de Estrés")
+
+    @st.fragment
+    def render_scenarios():
+        """What-if form and its results; submitting the form reruns only this fragment."""
+        _, _, df_details, _, _ = calculate_portfolio_summary(user_id)
+        exposure = Exposure.from_details(df_details, BASE_CURRENCY)
+        if not exposure.tickers:
+            return
+
+        with st.form("escenarios_form"):
+            st.caption(
+                f"Cambio (%) del precio de cada activo y del valor en {BASE_CURRENCY} de cada divisa. "
+                f"Con escenarios Monte Carlo se suman a movimientos de mercado sacados al azar de los últimos {SCENARIO_LOOKBACK_DAYS} días."
+            )
+            col_precios, col_divisas = st.columns([2, 1])
+            with col_precios:
+                price_editor = st.data_editor(
+                    pd.DataFrame({"Activo": exposure.tickers, "Cambio (%)": 0.0}),
+                    hide_index=True, disabled=["Activo"], use_container_width=True, key="price_shocks_editor"
+                )
+            with col_divisas:
+                fx_editor = st.data_editor(
+                    pd.DataFrame({"Divisa": exposure.currencies[1:], "Cambio (%)": 0.0}),
+                    hide_index=True, disabled=["Divisa"], use_container_width=True, key="fx_shocks_editor"
+                )
+            col_n, col_horizon = st.columns(2)
+            n_scenarios = col_n.number_input(
+                "Escenarios Monte Carlo", min_value=0, max_value=50000, value=10000, step=1000,
+                help="Con 0 solo se aplican los cambios indicados.", key="scenario_count"
+            )
+            horizon = col_horizon.number_input("Horizonte (días de mercado)", min_value=1, max_value=250, value=20, key="scenario_horizon")
+            if st.form_submit_button("Calcular escenarios"):
+                st.session_state.scenarios_requested = True
+
+        if not st.session_state.get("scenarios_requested"):
+            return
+        price_shocks = dict(zip(price_editor["Activo"], price_editor["Cambio (%)"].fillna(0.0) / 100))
+        fx_shocks = dict(zip(fx_editor["Divisa"], fx_editor["Cambio (%)"].fillna(0.0) / 100))
+
+        with TRACE.span("scenarios"):
+            fixed_pnl = float(simulate(exposure, price_shocks=price_shocks, fx_shocks=fx_shocks)[0])
+            daily = get_scenario_returns(tuple(exposure.tickers), tuple(exposure.currencies)) if n_scenarios else None
+            # Semilla fija: volver a pintar la página no cambia los escenarios
+            pnl = (
+                simulate(exposure, daily, n_scenarios, horizon, price_shocks, fx_shocks, seed=0)
+                if daily is not None and len(daily) >= MIN_HISTORY_DAYS else None
+            )
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric(
+            f"Valor con los Cambios ({BASE_CURRENCY})", f"${exposure.value + fixed_pnl:,.2f}", f"{fixed_pnl:,.2f}",
+            help="Valor actual con solo los cambios indicados, sin movimientos de mercado."
+        )
+        if pnl is None:
+            if n_scenarios:
+                st.info("ℹ️ Todavía no hay histórico de precios suficiente para generar escenarios Monte Carlo.")
+            return
+        summary = risk_summary(pnl)
+        col2.metric(
+            "Resultado Medio", f"${summary['mean']:,.2f}",
+            help=f"Probabilidad de pérdida: {summary['p_loss'] * 100:.1f}%"
+        )
+        col3.metric(
+            "VaR 95%", f"${summary['var_95']:,.2f}",
+            help=f"Pérdida que solo se supera en el 5% de los escenarios (VaR 99%: ${summary['var_99']:,.2f})."
+        )
+        col4.metric(
+            "Pérdida Esperada (ES 95%)", f"${summary['es_95']:,.2f}",
+            help=f"Pérdida media del 5% de peores escenarios (ES 99%: ${summary['es_99']:,.2f})."
+        )
+        st.plotly_chart(scenario_histogram(pnl, BASE_CURRENCY, summary["var_95"]), use_container_width=True)
+        st.caption(f"{n_scenarios:,} escenarios de {horizon} días de mercado sacados de {len(daily)} días de histórico.")
+
+    render_scenarios()
+
+# -----------------------------------------------
+# PANEL DE TIEMPOS
+# -----------------------------------------------
+TRACE.finish()
+with st.sidebar.expander("⏱️ Tiempos de carga"):
+    st.checkbox("Medir cada ejecución", key="show_timings")
+    if TRACE.enabled:
+        stage_stats = get_tracer().percentiles()
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "Fase": name,
+                        "Última (ms)": round(seconds * 1000, 1),
+                        "p50 (ms)": round(stage_stats[name]["p50"] * 1000, 1),
+                        "p95 (ms)": round(stage_stats[name]["p95"] * 1000, 1),
+                    }
+                    for name, seconds in TRACE.spans
+                ]
+            ),
+            hide_index=True,
+            use_container_width=True
+        )
+        yahoo_stats = default_client().stats()
+        if yahoo_stats:
+            st.caption(f"Peticiones a Yahoo Finance (circuito: {default_client().breaker.state})")
+            st.dataframe(
+                pd.DataFrame(
+                    [
+                        {
+                            "Operación": operation,
+                            "Peticiones": counters["requests"],
+                            "Errores": counters["errors"],
+                            "Reintentos": counters["retries"],
+                            "Rechazadas": counters["rejected"],
+                            "p50 (ms)": None if counters["p50"] is None else round(counters["p50"] * 1000, 1),
+                            "p95 (ms)": None if counters["p95"] is None else round(counters["p95"] * 1000, 1),
+                        }
+                        for operation, counters in sorted(yahoo_stats.items())
+                    ]
+                ),
+                hide_index=True,
+                use_container_width=True
+            )
+        st.download_button(
+            "Exportar (Prometheus)",
+            get_tracer().prometheus_text(),
+            file_name="portfolio_timings.prom",
+            mime="text/plain"
+        )
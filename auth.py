@@ -0,0 +1,91 @@
+import base64
+import hashlib
+import hmac
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt  # type: ignore
+
+
+BCRYPT_COST_PATTERN = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+def hash_cost(hashed_password):
+    """Returns the bcrypt cost factor stored in a hash, or None if it is not a bcrypt hash."""
+    match = BCRYPT_COST_PATTERN.match(hashed_password or "")
+    return int(match.group(1)) if match else None
+
+
+# -----------------------------------------------
+# PASSWORD HASHING
+# -----------------------------------------------
+class PasswordHasher:
+    """
+    bcrypt hashing with a configurable cost, run on a bounded worker pool.
+
+    bcrypt releases the GIL while hashing, so the pool caps how many
+    hashes run at once instead of letting a burst of logins occupy every
+    core and stall the script threads of other sessions.
+    """
+
+    def __init__(self, rounds=12, max_workers=2):
+        self.rounds = rounds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+
+    def hash(self, password):
+        """Hashes a password with the configured cost."""
+        future = self._pool.submit(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds))
+        return future.result().decode('utf-8')
+
+    def verify(self, password, hashed_password):
+        """Verifies a password against a stored hash."""
+        future = self._pool.submit(bcrypt.checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+        return future.result()
+
+    def needs_rehash(self, hashed_password):
+        """True when a stored hash was made with a different cost than the configured one."""
+        return hash_cost(hashed_password) != self.rounds
+
+
+# -----------------------------------------------
+# SESSION TOKENS
+# -----------------------------------------------
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionSigner:
+    """
+    HMAC-signed session tokens of the form '<username>.<expires>.<signature>'.
+
+    Checking a token is a single HMAC, so reruns can trust the session
+    without ever going back to bcrypt.
+    """
+
+    def __init__(self, secret, max_age=12 * 3600):
+        self._key = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.max_age = max_age
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._key, payload.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, username):
+        """Returns a token for `username` valid for max_age seconds."""
+        payload = f"{_b64encode(username.encode('utf-8'))}.{int(time.time()) + self.max_age}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        """Returns the username of a valid, unexpired token, or None."""
+        try:
+            encoded_username, expires, signature = token.split(".")
+            payload = f"{encoded_username}.{expires}"
+            if not hmac.compare_digest(signature, self._sign(payload)) or int(expires) < time.time():
+                return None
+            return _b64decode(encoded_username).decode('utf-8')
+        except (AttributeError, ValueError, UnicodeDecodeError):
+            return None
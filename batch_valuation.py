@@ -0,0 +1,315 @@
+"""
+Values every portfolio in one run, without Streamlit (e.g. nightly from cron).
+
+Reads the materialized `positions` table from Supabase in pages, with the
+open lots of every position, and resolves the prices, FX rates and ticker
+details of the distinct tickers of all users once. It values the portfolios
+on a process pool with valuation.summarize_users (the totals of the
+dashboard's summarize_portfolio, computed for many users at once) and upserts
+one row per user and day into `portfolio_summaries`, with the realized P&L
+of the sells. Prints a JSON report with the time of each stage and the
+throughput in users per second.
+
+    python batch_valuation.py
+    python batch_valuation.py --workers 8 --dry-run
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from ledger import LOT_COLUMNS
+from market_data import (
+    QuoteService, TickerMetadataCache, cross_rate_matrix, fetch_fx_quotes, fetch_last_prices, fetch_ticker_details,
+    fx_symbol
+)
+from portfolio_import import chunked
+from price_history import PriceHistoryStore
+from snapshots import SnapshotStore
+from valuation import lot_fx_rates, purchase_dates, summarize_users
+
+
+logger = logging.getLogger("portfolio.batch_valuation")
+
+# -----------------------------------------------
+# CONFIGURATION
+# -----------------------------------------------
+# La misma configuración que la app: comparten la caché de nombres y las copias de precios
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+METADATA_CACHE_PATH = os.environ.get(
+    "TICKER_METADATA_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "ticker_metadata.json")
+)
+METADATA_TTL_SECONDS = int(os.environ.get("TICKER_METADATA_TTL_SECONDS", str(7 * 24 * 3600)))
+SNAPSHOT_PATH = os.environ.get(
+    "SNAPSHOT_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "snapshots.db")
+)
+PRICE_HISTORY_PATH = os.environ.get(
+    "PRICE_HISTORY_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "price_history.db")
+)
+BASE_CURRENCY = "USD"
+# Columnas de cada posición que hacen falta para valorarla
+POSITION_COLUMNS = "id,user_id,ticker,realizado,precio_compra_currency,nombre_personalizado,lotes"
+SUMMARY_TABLE = "portfolio_summaries"
+
+
+# -----------------------------------------------
+# LOADING
+# -----------------------------------------------
+def iter_position_pages(client, page_size=1000):
+    """
+    Yields the rows of the `positions` table in pages of `page_size`.
+
+    Pages are read by id (WHERE id > last seen id), so every page is one
+    index range scan no matter how deep into the table it is.
+    """
+    last_id = 0
+    while True:
+        rows = (
+            client.table("positions").select(POSITION_COLUMNS).gt("id", last_id).order("id").limit(page_size).execute().data
+        )
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+def load_all_lots(client, page_size=1000):
+    """
+    Every open lot of every user, sorted by user so each user is one
+    contiguous slice, and the realized P&L of every user per currency.
+    Returns (df_lots, df_realized).
+    """
+    lots, realized = [], []
+    for rows in iter_position_pages(client, page_size):
+        for row in rows:
+            lots.extend(
+                dict(lot, user_id=row["user_id"], ticker=row["ticker"], nombre_personalizado=row["nombre_personalizado"])
+                for lot in row["lotes"]
+            )
+            if row["realizado"]:
+                realized.append((row["user_id"], row["precio_compra_currency"], row["realizado"]))
+    df_lots = pd.DataFrame(lots, columns=["user_id", *LOT_COLUMNS])
+    df_realized = pd.DataFrame(realized, columns=["user_id", "currency", "realizado"])
+    return df_lots.sort_values("user_id", kind="stable", ignore_index=True), df_realized
+
+
+def realized_by_user(df_realized, rates):
+    """Realized P&L of every user in the base currency of `rates`, at today's rates."""
+    amounts = df_realized["realizado"] * df_realized["currency"].map(lambda c: rates.get(c, 1.0)).astype(float)
+    return amounts.groupby(df_realized["user_id"]).sum().to_dict()
+
+
+def fetch_market_data(tickers, purchase_currencies, base_currency=BASE_CURRENCY, snapshots=None, metadata=None):
+    """
+    Ticker details, last prices and FX rates to base_currency for all the
+    given tickers, each fetched in one batch. Prices and rates that cannot be
+    fetched fall back to their snapshot. Returns (prices, rates, ticker_details).
+    """
+    metadata = metadata or TickerMetadataCache(
+        METADATA_CACHE_PATH, partial(fetch_ticker_details, default_currency=base_currency), ttl=METADATA_TTL_SECONDS
+    )
+    ticker_details = metadata.get_many(tickers)
+    prices = QuoteService(fetch_last_prices, snapshots=snapshots).get_prices(tickers, stale_ok=False)
+
+    currencies = sorted(
+        {base_currency, *purchase_currencies} | {d["currency"] for d in ticker_details.values() if d.get("currency")}
+    )
+    symbols = {currency: fx_symbol(currency) for currency in currencies if currency != "USD"}
+    fx_prices = QuoteService(fetch_fx_quotes, snapshots=snapshots).get_prices(list(symbols.values()), stale_ok=False)
+    usd_rates = {"USD": 1.0, **{c: fx_prices[s] for c, s in symbols.items() if fx_prices.get(s)}}
+
+    rates = {}
+    for currency, rate in cross_rate_matrix(usd_rates, currencies)[base_currency].items():
+        if pd.isna(rate):
+            logger.warning("Sin tipo de cambio para %s: sus importes no se convierten", currency)
+            rate = 1.0
+        rates[currency] = float(rate)
+    return prices, rates, ticker_details
+
+
+def fetch_purchase_rates(df_lots, base_currency=BASE_CURRENCY, history=None):
+    """
+    Rate to base_currency of every lot on its purchase date, from the daily FX
+    series of the price history (brought up to date first). NaN where it is
+    unknown, which the valuation replaces with today's rate.
+    """
+    start = purchase_dates(df_lots).min()
+    if pd.isna(start):
+        return np.full(len(df_lots), np.nan)
+    history = history or PriceHistoryStore(PRICE_HISTORY_PATH)
+    currencies = sorted({base_currency, *df_lots["precio_compra_currency"].dropna().unique()})
+    try:
+        history.refresh([fx_symbol(c) for c in currencies if c != "USD"], interval="1d")
+    except Exception as e:
+        logger.warning("No se pudo actualizar el histórico de tipos de cambio (%s): se usan los días guardados", e)
+    return lot_fx_rates(df_lots, history.fx_to_base(currencies, base_currency, start))
+
+
+# -----------------------------------------------
+# VALUATION
+# -----------------------------------------------
+# Datos de mercado de cada proceso del pool: se envían una vez al arrancarlo, no con cada tarea
+_MARKET = None
+
+
+def _init_worker(market):
+    global _MARKET
+    _MARKET = market
+
+
+def value_users(df_lots):
+    """Summary rows of every user in `df_lots`, which holds whole users only."""
+    prices, rates, ticker_details, base_currency, valued_at = _MARKET
+    lot_rates = df_lots["fx_rate"].to_numpy(dtype=float) if "fx_rate" in df_lots.columns else None
+    df_summary = summarize_users(df_lots, prices, rates, ticker_details, base_currency, lot_rates=lot_rates)
+    pnl = df_summary["market_value"] - df_summary["invested"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pnl_pct = np.where(df_summary["invested"] != 0, pnl / df_summary["invested"] * 100, 0.0)
+    return pd.DataFrame({
+        "user_id": df_summary.index,
+        "valued_on": valued_at[:10],
+        "base_currency": base_currency,
+        "invested": df_summary["invested"].to_numpy(),
+        "market_value": df_summary["market_value"].to_numpy(),
+        "pnl": pnl.to_numpy(),
+        "pnl_pct": pnl_pct,
+        "positions": df_summary["positions"].to_numpy(),
+        "unpriced_positions": df_summary["unpriced_positions"].to_numpy(),
+        "valued_at": valued_at,
+    }).to_dict("records")
+
+
+def closed_user_row(user_id, base_currency, valued_at):
+    """Summary row of a user without open positions, who only has realized P&L."""
+    return {
+        "user_id": user_id,
+        "valued_on": valued_at[:10],
+        "base_currency": base_currency,
+        "invested": 0.0,
+        "market_value": 0.0,
+        "pnl": 0.0,
+        "pnl_pct": 0.0,
+        "positions": 0,
+        "unpriced_positions": 0,
+        "valued_at": valued_at,
+    }
+
+
+def split_by_user(df_lots, users_per_task):
+    """Cuts lots sorted by user into slices of at most `users_per_task` whole users."""
+    if df_lots.empty:
+        return []
+    user_starts = np.flatnonzero(np.r_[True, df_lots["user_id"].to_numpy()[1:] != df_lots["user_id"].to_numpy()[:-1]])
+    bounds = np.r_[user_starts[::users_per_task], len(df_lots)]
+    return [df_lots.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def value_all(df_lots, market, workers=None, users_per_task=500):
+    """Values every user in `df_lots` on `workers` processes (inline with one worker)."""
+    tasks = split_by_user(df_lots, users_per_task)
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(market)
+        return [row for task in tasks for row in value_users(task)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(market,)) as pool:
+        return [row for rows in pool.map(value_users, tasks) for row in rows]
+
+
+def upsert_summaries(client, rows, batch_size=500):
+    """Writes the summary rows in multi-row upserts; a rerun on the same day overwrites them."""
+    for batch in chunked(rows, batch_size):
+        client.table(SUMMARY_TABLE).upsert(batch, on_conflict="user_id,valued_on").execute()
+
+
+# -----------------------------------------------
+# ENTRY POINT
+# -----------------------------------------------
+def run(client, workers=None, page_size=1000, users_per_task=500, upsert_size=500,
+        base_currency=BASE_CURRENCY, snapshots=None, metadata=None, history=None, dry_run=False):
+    """Runs the whole job and returns its report: counts, seconds per stage and users per second."""
+    timings = {}
+    started = time.perf_counter()
+
+    df_lots, df_realized = load_all_lots(client, page_size)
+    timings["load"] = time.perf_counter() - started
+    tickers = df_lots["ticker"].unique().tolist()
+    logger.info("%d lotes abiertos de %d usuarios, %d tickers distintos", len(df_lots), df_lots["user_id"].nunique(), len(tickers))
+
+    stage = time.perf_counter()
+    prices, rates, ticker_details = fetch_market_data(
+        tickers, {*df_lots["precio_compra_currency"].dropna(), *df_realized["currency"]}, base_currency, snapshots, metadata
+    )
+    # El coste de cada compra se convierte al tipo de cambio del día en que se hizo
+    df_lots["fx_rate"] = fetch_purchase_rates(df_lots, base_currency, history)
+    timings["market_data"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    valued_at = datetime.now(timezone.utc).isoformat()
+    rows = value_all(df_lots, (prices, rates, ticker_details, base_currency, valued_at), workers, users_per_task)
+    realized = realized_by_user(df_realized, rates)
+    # Quien lo ha vendido todo no tiene lotes abiertos, pero su resultado realizado también cuenta
+    valued = {row["user_id"] for row in rows}
+    rows.extend(closed_user_row(user_id, base_currency, valued_at) for user_id in sorted(realized) if user_id not in valued)
+    for row in rows:
+        row["realized"] = realized.get(row["user_id"], 0.0)
+    timings["valuation"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    if not dry_run:
+        upsert_summaries(client, rows, upsert_size)
+    timings["upsert"] = time.perf_counter() - stage
+    timings["total"] = time.perf_counter() - started
+
+    return {
+        "users": len(rows),
+        "lots": len(df_lots),
+        "tickers": len(tickers),
+        "unpriced_tickers": sum(prices.get(t) is None for t in tickers),
+        "workers": workers or os.cpu_count(),
+        "dry_run": dry_run,
+        "seconds": {name: round(seconds, 3) for name, seconds in timings.items()},
+        "users_per_second": round(len(rows) / timings["total"], 1) if timings["total"] else None,
+        "valuation_users_per_second": round(len(rows) / timings["valuation"], 1) if timings["valuation"] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="valuation processes (1: no pool)")
+    parser.add_argument("--page-size", type=int, default=1000, help="rows per read of the positions table")
+    parser.add_argument("--users-per-task", type=int, default=500, help="users valued per pool task")
+    parser.add_argument("--upsert-size", type=int, default=500, help="summary rows per upsert")
+    parser.add_argument("--base-currency", default=BASE_CURRENCY)
+    parser.add_argument("--dry-run", action="store_true", help="value everything but write nothing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    from supabase import create_client
+
+    report = run(
+        create_client(SUPABASE_URL, SUPABASE_KEY),
+        workers=args.workers,
+        page_size=args.page_size,
+        users_per_task=args.users_per_task,
+        upsert_size=args.upsert_size,
+        base_currency=args.base_currency,
+        snapshots=SnapshotStore(SNAPSHOT_PATH),
+        history=PriceHistoryStore(PRICE_HISTORY_PATH),
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""Offline benchmarks for the portfolio app. Run each module with `python -m bench.<name>`."""
+import os
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "PORTFOLIO.py")
+
+# Yahoo Finance está simulado: su límite de peticiones por segundo solo añadiría esperas.
+# Los procesos hijos (bench.startup) lo heredan.
+os.environ.setdefault("YF_REQUESTS_PER_SECOND", "0")
+
+
+def current_commit():
+    """Short hash of HEAD, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,56 @@
+"""
+Streamlit script of bench.portfolio: PORTFOLIO.py plus timings of its entry points.
+
+Renders the app as it is. When st.session_state["bench_repeat"] is set, it
+then calls the app's own calculate_portfolio_summary and get_exchange_rates,
+in the same script run, so their caches, tracing spans and session state
+are the real ones. Each is timed cold and then `bench_repeat` times warm.
+The timings (seconds) are left in st.session_state["bench_timings"].
+"""
+import runpy
+import sys
+import time
+
+import streamlit as st
+
+from bench import APP_PATH, REPO_ROOT
+
+# Streamlit pone delante la carpeta de este script: los módulos de la app (scenarios...)
+# deben resolverse en la raíz, como cuando PORTFOLIO.py es el script principal
+sys.path.insert(0, REPO_ROOT)
+app = runpy.run_path(APP_PATH)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def time_entry_point(fn, reset, repeat):
+    """[cold], [warm...] timings of fn, with reset() run before the cold call."""
+    reset()
+    cold = [timed(fn)]
+    return cold, [timed(fn) for _ in range(repeat)]
+
+
+def reset_summary():
+    # Como tras reiniciar el servidor: sin cachés de datos, sin la copia de la sesión y sin
+    # cotizaciones ni tipos de cambio en memoria (los metadatos siguen en disco)
+    st.cache_data.clear()
+    st.session_state.pop("portfolio_cache", None)
+    app["get_quote_service"].clear()
+    app["get_fx_service"].clear()
+
+
+repeat = st.session_state.get("bench_repeat")
+if repeat:
+    user_id = app["user_id"]
+    timings = {}
+    timings["calculate_portfolio_summary_cold"], timings["calculate_portfolio_summary_warm"] = time_entry_point(
+        lambda: app["calculate_portfolio_summary"](user_id), reset_summary, repeat
+    )
+    timings["get_exchange_rates_cold"], timings["get_exchange_rates_warm"] = time_entry_point(
+        app["get_exchange_rates"], app["get_fx_service"].clear, repeat
+    )
+    st.session_state["bench_timings"] = timings
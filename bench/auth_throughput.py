@@ -0,0 +1,58 @@
+"""
+Login throughput at several bcrypt cost settings.
+
+Simulates a burst of concurrent logins (one thread per session, as the
+Streamlit server does) against PasswordHasher and reports logins per second
+and per-login latency for each cost. Results are printed as JSON.
+
+    python -m bench.auth_throughput --rounds 8 10 12 --logins 32 --sessions 16 --workers 2
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from auth import PasswordHasher
+
+
+def run_burst(hasher, stored_hash, logins, sessions):
+    """Verifies `logins` passwords from `sessions` concurrent threads; returns per-login latencies."""
+    def login(_):
+        start = time.perf_counter()
+        assert hasher.verify("contraseña-de-prueba", stored_hash)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        return list(pool.map(login, range(logins)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[8, 10, 12])
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent logins")
+    parser.add_argument("--workers", type=int, default=2, help="PasswordHasher pool size")
+    args = parser.parse_args()
+
+    results = []
+    for rounds in args.rounds:
+        hasher = PasswordHasher(rounds=rounds, max_workers=args.workers)
+        stored_hash = hasher.hash("contraseña-de-prueba")
+        start = time.perf_counter()
+        latencies = run_burst(hasher, stored_hash, args.logins, args.sessions)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "rounds": rounds,
+            "workers": args.workers,
+            "sessions": args.sessions,
+            "logins": args.logins,
+            "logins_per_second": round(args.logins / elapsed, 2),
+            "latency_p50_ms": round(statistics.median(latencies) * 1000, 1),
+            "latency_max_ms": round(max(latencies) * 1000, 1),
+        })
+    print(json.dumps({"benchmark": "auth_throughput", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Throughput of the nightly batch valuation on synthetic users.
+
+Spreads synthetic lots (see bench.synthetic) over many users, serves their
+positions from an in-memory Supabase with Yahoo Finance faked as well, and runs
+batch_valuation.run() for every size and worker count. Prints its reports as
+JSON tagged with the current commit; users_per_second covers the whole job
+and valuation_users_per_second only the pool.
+
+    python -m bench.batch_valuation --sizes 10000:200000:2000 --workers 1 4
+"""
+import argparse
+import json
+import os
+import tempfile
+from functools import partial
+
+import numpy as np
+
+from bench import current_commit, fakes
+from bench.synthetic import synthetic_lots, synthetic_market, synthetic_positions, synthetic_tickers
+
+
+def synthetic_users(n_users, n_lots, n_tickers, seed=0):
+    """Returns (position rows, market) with the lots of `n_users` users over a shared ticker universe."""
+    tickers, currencies, _ = synthetic_tickers(n_tickers, seed)
+    user_ids = np.char.add("user", np.random.default_rng(seed).integers(0, n_users, size=n_lots).astype(str))
+    df_lots = synthetic_lots(tickers, currencies, n_lots, seed, user_id=user_ids.astype(object))
+    return synthetic_positions(df_lots), synthetic_market(tickers, currencies, seed)
+
+
+def parse_size(text):
+    users, lots, tickers = (int(part) for part in text.split(":"))
+    return users, lots, tickers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[(10000, 200000, 2000)],
+                        help="USERS:LOTS:TICKERS per run")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, os.cpu_count()])
+    parser.add_argument("--users-per-task", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from batch_valuation import run
+    from market_data import TickerMetadataCache, fetch_ticker_details
+    from price_history import PriceHistoryStore
+
+    results = []
+    for n_users, n_lots, n_tickers in args.sizes:
+        rows, market = synthetic_users(n_users, n_lots, n_tickers, args.seed)
+        fakes.install_market(market)
+        for workers in args.workers:
+            client = fakes.FakeSupabase({"positions": list(rows)})
+            with tempfile.TemporaryDirectory() as workdir:
+                metadata = TickerMetadataCache(
+                    os.path.join(workdir, "ticker_metadata.json"), partial(fetch_ticker_details, default_currency="USD")
+                )
+                history = PriceHistoryStore(os.path.join(workdir, "price_history.db"))
+                report = run(
+                    client, workers=workers, users_per_task=args.users_per_task, metadata=metadata, history=history
+                )
+            report["supabase_calls"] = len(client.calls)
+            results.append(report)
+
+    print(json.dumps({"benchmark": "batch_valuation", "commit": current_commit(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+In-memory stand-ins for Yahoo Finance and Supabase.
+
+install() patches yfinance.download, yfinance.Ticker and
+supabase.create_client so the app and its helpers run without network.
+Prices are deterministic per symbol, so repeated runs see the same data.
+"""
+import bisect
+import zlib
+
+import numpy as np
+import pandas as pd
+
+
+def _default_price(symbol):
+    return float(zlib.crc32(symbol.encode("utf-8")) % 500 + 5)
+
+
+# -----------------------------------------------
+# YAHOO FINANCE
+# -----------------------------------------------
+class FakeMarket:
+    """Serves yf.download frames and yf.Ticker info from fixed prices and currencies."""
+
+    def __init__(self, prices=None, currencies=None, names=None, bars=30):
+        self.prices = dict(prices or {})
+        self.currencies = dict(currencies or {})
+        self.names = dict(names or {})
+        self.bars = bars
+        self.calls = []
+
+    def download(self, tickers, period=None, interval=None, start=None, end=None, **kwargs):
+        """Same shape as yf.download with several tickers: (Price, Ticker) MultiIndex columns."""
+        self.calls.append({"tickers": len(tickers), "period": period, "interval": interval})
+        tickers = tickers.split() if isinstance(tickers, str) else list(tickers)
+        freq = "min" if interval in ("1m", "5m") else "D"
+        index = pd.date_range(end=pd.Timestamp.now(tz="UTC").floor(freq), periods=self.bars, freq=freq)
+        last = np.array([self.prices.get(t) or _default_price(t) for t in tickers])
+        # Serie lineal que termina en el precio fijado para cada ticker
+        closes = np.outer(np.linspace(0.9, 1.0, self.bars), last)
+        frames = {"Close": closes, "Open": closes, "Volume": np.full_like(closes, 1000.0)}
+        columns = pd.MultiIndex.from_product([list(frames), tickers], names=["Price", "Ticker"])
+        return pd.DataFrame(np.hstack(list(frames.values())), index=index, columns=columns)
+
+    def quote(self, symbols):
+        """Same rows as yahoo_client.request_quotes: symbol and last price."""
+        self.calls.append({"tickers": len(symbols), "quote": True})
+        return [{"symbol": s, "regularMarketPrice": self.prices.get(s) or _default_price(s)} for s in symbols]
+
+    def ticker(self, symbol):
+        """Replacement for yf.Ticker; only `info` is used by the app."""
+        info = {
+            "longName": self.names.get(symbol, f"{symbol} Holdings"),
+            "currency": self.currencies.get(symbol, "USD"),
+        }
+        return type("FakeTicker", (), {"ticker": symbol, "info": info})()
+
+
+# -----------------------------------------------
+# SUPABASE
+# -----------------------------------------------
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.op = "select"
+        self.payload = None
+        self.filters = []
+        self.bounds = None
+        self.after_id = None
+        self.on_conflict = None
+
+    def select(self, *args, **kwargs):
+        self.op = "select"
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict=None, **kwargs):
+        self.op, self.payload, self.on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload, **kwargs):
+        self.op, self.payload = "update", payload
+        return self
+
+    def delete(self, **kwargs):
+        self.op = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, lambda v: v == value))
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append((column, lambda v: v in values))
+        return self
+
+    def gt(self, column, value):
+        if column == "id":
+            # Paginación por id: las filas están en orden de id, así que basta una búsqueda binaria
+            self.after_id = value
+        else:
+            self.filters.append((column, lambda v: v is not None and v > value))
+        return self
+
+    def order(self, *args, **kwargs):
+        # Las filas ya están en orden de inserción, que es el orden de id
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end + 1)
+        return self
+
+    def limit(self, count):
+        self.bounds = (0, count)
+        return self
+
+    def _matches(self, row):
+        return all(accepts(row.get(column)) for column, accepts in self.filters)
+
+    def execute(self):
+        rows = self.client.tables.setdefault(self.table, [])
+        self.client.calls.append((self.table, self.op))
+        if self.op == "select":
+            if self.after_id is not None:
+                rows = rows[bisect.bisect_right(rows, self.after_id, key=lambda row: row["id"]):]
+            found = [dict(row) for row in rows if self._matches(row)]
+            return _Response(found[slice(*self.bounds)] if self.bounds else found)
+        if self.op in ("insert", "upsert"):
+            new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            if self.on_conflict:
+                # Las filas con la misma clave se sustituyen
+                key_columns = self.on_conflict.split(",")
+                keys = {tuple(row.get(c) for c in key_columns) for row in new_rows}
+                rows[:] = [row for row in rows if tuple(row.get(c) for c in key_columns) not in keys]
+            inserted = []
+            for row in new_rows:
+                # Ids crecientes aunque una sustitución haya quitado filas, como una secuencia de Postgres
+                row = {"id": rows[-1]["id"] + 1 if rows else 1, "created_at": pd.Timestamp.now(tz="UTC").isoformat(), **row}
+                rows.append(row)
+                inserted.append(row)
+            return _Response(inserted)
+        matched = [row for row in rows if self._matches(row)]
+        if self.op == "update":
+            for row in matched:
+                row.update(self.payload)
+        else:
+            rows[:] = [row for row in rows if not self._matches(row)]
+        return _Response(matched)
+
+
+class FakeSupabase:
+    """Minimal supabase-py client over in-memory tables ({name: [row, ...]})."""
+
+    def __init__(self, tables=None):
+        self.tables = tables if tables is not None else {}
+        self.calls = []
+
+    def table(self, name):
+        return _Query(self, name)
+
+
+def install_market(market):
+    """Routes yf.download, yf.Ticker and the batch quote requests to `market`."""
+    import yfinance
+
+    import yahoo_client
+
+    yfinance.download = market.download
+    yfinance.Ticker = market.ticker
+    yahoo_client.request_quotes = market.quote
+
+
+def install_supabase(client):
+    """Makes supabase.create_client return `client`."""
+    import supabase
+
+    supabase.create_client = lambda url, key, *args, **kwargs: client
+
+
+def install(market, client):
+    """Routes every yfinance and Supabase call of this process to the fakes."""
+    install_market(market)
+    install_supabase(client)
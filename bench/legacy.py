@@ -0,0 +1,65 @@
+"""
+Row-wise formatting of the asset details table, as the app did before
+display.format_details_table kept the table numeric. Only used as the
+baseline of bench.portfolio.
+"""
+import pandas as pd
+
+
+LEGACY_DISPLAY_COLUMNS = [
+    'Nombre', 'Ticker', 'Tipo', 'Divisa de Activo', 'Cantidad', 'Precio de Compra Promedio', 'Precio Actual',
+    'Valor de Mercado', 'Rentabilidad', 'Rentabilidad (%)',
+    'Inversión Inicial', 'Peso en el Portfolio (%)'
+]
+
+
+def format_details_table_rowwise(df_details, currency_symbols):
+    """Formats every amount as a string with its currency symbol, one row at a time."""
+    df_display = df_details.copy()
+
+    def format_currency_symbol(currency_code):
+        return currency_symbols.get(currency_code, "")
+
+    def format_rentabilidad(row):
+        currency_code = row['Divisa de Activo']
+        value = row[f'Rentabilidad ({currency_code})']
+        symbol = format_currency_symbol(currency_code)
+        if pd.isna(value) or value is None:
+            return "N/A"
+        return f"{symbol}{value:,.2f}"
+
+    def format_valor_mercado(row):
+        currency_code = row['Divisa de Activo']
+        value = row[f'Valor de Mercado Original ({currency_code})']
+        symbol = format_currency_symbol(currency_code)
+        if pd.isna(value) or value is None:
+            return "N/A"
+        return f"{symbol}{value:,.2f}"
+
+    def format_price(value, currency_code):
+        symbol = format_currency_symbol(currency_code)
+        if pd.isna(value) or value is None:
+            return "N/A"
+        return f"{symbol}{value:,.2f}"
+
+    def format_inversion_inicial(row):
+        currency_code = row['Divisa de Compra']
+        value = row[f'Inversión Inicial Original ({currency_code})']
+        symbol = format_currency_symbol(currency_code)
+        if pd.isna(value) or value is None:
+            return "N/A"
+        return f"{symbol}{value:,.2f}"
+
+    df_display['Valor de Mercado'] = df_display.apply(format_valor_mercado, axis=1)
+    df_display['Rentabilidad'] = df_display.apply(format_rentabilidad, axis=1)
+    df_display['Rentabilidad (%)'] = df_display['Rentabilidad (%)'].apply(lambda x: f'{x:.2f}%' if pd.notna(x) else 'N/A')
+    df_display['Inversión Inicial'] = df_display.apply(format_inversion_inicial, axis=1)
+    df_display['Peso en el Portfolio (%)'] = df_display['Peso en el Portfolio (%)'].apply(lambda x: f'{x:.2f}%' if pd.notna(x) else '0.00%')
+    df_display['Precio de Compra Promedio'] = df_display.apply(
+        lambda row: format_price(row[f'Precio de Compra Promedio ({row["Divisa de Compra"]})'], row["Divisa de Compra"]), axis=1
+    )
+    df_display['Precio Actual'] = df_display.apply(
+        lambda row: format_price(row[f'Precio Actual ({row["Divisa de Activo"]})'], row["Divisa de Activo"]), axis=1
+    )
+
+    return df_display[LEGACY_DISPLAY_COLUMNS]
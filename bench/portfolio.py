@@ -0,0 +1,185 @@
+"""
+End-to-end timings of the dashboard on synthetic portfolios.
+
+Times a full AppTest run of PORTFOLIO.py (cold and warm), the app's own
+calculate_portfolio_summary and get_exchange_rates called inside that run
+(cold and warm, with their caches and tracing; see bench.app_entry_points)
+and, as a breakdown, the pure stages behind them (valuation, FX,
+details-table formatting, also in its old row-wise form, and the
+distribution pie) for several portfolio sizes, with Yahoo Finance and
+Supabase replaced by in-memory fakes. Results are printed as JSON tagged
+with the current commit; --compare adds the speedup against a previous
+result file.
+
+    python -m bench.portfolio --sizes 10000:1000 100000:2000 --output results.json
+    python -m bench.portfolio --compare results.json
+    python -m bench.portfolio --tracing   # con PERF_TRACING=1
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from bench import REPO_ROOT, current_commit, fakes
+from bench.synthetic import CURRENCIES, CURRENCY_SYMBOLS, synthetic_portfolio, synthetic_positions
+
+
+def time_call(fn, repeat):
+    """Runs fn `repeat` times; returns (last result, timings in seconds)."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+
+def stage_result(stage, n_lots, n_tickers, timings):
+    return {
+        "stage": stage,
+        "lots": n_lots,
+        "tickers": n_tickers,
+        "runs": len(timings),
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "min_ms": round(min(timings) * 1000, 2),
+    }
+
+
+def bench_functions(df_lots, market, crypto, repeat):
+    """Times the pure stages of a render; returns {stage: timings}."""
+    from bench.legacy import format_details_table_rowwise
+    from charts import distribution_pie
+    from display import format_details_table
+    from market_data import cross_rate_matrix, fetch_usd_rates
+    from valuation import summarize_portfolio
+
+    matrix, fx_timings = time_call(lambda: cross_rate_matrix(fetch_usd_rates(CURRENCIES), CURRENCIES), repeat)
+    rates = matrix["USD"].to_dict()
+    details = {t: {"name": f"{t} Holdings", "currency": c} for t, c in market.currencies.items()}
+    prices = {t: market.prices[t] for t in market.currencies}
+
+    summary, summary_timings = time_call(
+        lambda: summarize_portfolio(df_lots, prices, rates, details, crypto, "USD"), repeat
+    )
+    _, display_timings = time_call(lambda: format_details_table(summary[2], CURRENCY_SYMBOLS), repeat)
+    _, rowwise_timings = time_call(lambda: format_details_table_rowwise(summary[2], CURRENCY_SYMBOLS), repeat)
+    _, pie_timings = time_call(lambda: distribution_pie(summary[2], "Valor de Mercado (USD)", "Distribución"), repeat)
+    return {
+        "fx": fx_timings,
+        "summarize_portfolio": summary_timings,
+        "format_details_table": display_timings,
+        "format_details_table_rowwise": rowwise_timings,
+        "distribution_pie": pie_timings,
+    }
+
+
+def bench_app(client, user_id, workdir, repeat, tracing=False):
+    """
+    Renders PORTFOLIO.py twice for a logged-in user, then a third time timing
+    its entry points; returns ({stage: timings}, {stage: Supabase calls}).
+    """
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    from auth import SessionSigner
+
+    os.environ.update({
+        "SUPABASE_URL": "http://bench.invalid",
+        "SUPABASE_KEY": "bench",
+        "SESSION_SECRET": "bench",
+        "TICKER_METADATA_CACHE": os.path.join(workdir, "ticker_metadata.json"),
+        "PRICE_HISTORY_DB": os.path.join(workdir, "price_history.db"),
+        "SNAPSHOT_DB": os.path.join(workdir, "snapshots.db"),
+        # El refresco en segundo plano no debe competir con las renderizaciones medidas
+        "CRYPTO_REFRESH_SECONDS": "86400",
+        "OPEN_MARKET_REFRESH_SECONDS": "86400",
+        "CLOSED_MARKET_REFRESH_SECONDS": "86400",
+        "PERF_TRACING": "1" if tracing else "0",
+    })
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+    app = AppTest.from_file(os.path.join(REPO_ROOT, "bench", "app_entry_points.py"), default_timeout=600)
+    app.session_state["logged_in"] = True
+    app.session_state["username"] = user_id
+    app.session_state["auth_token"] = SessionSigner("bench").issue(user_id)
+
+    timings, supabase_calls = {}, {}
+    for stage in ("app_cold", "app_warm"):
+        calls_before = len(client.calls)
+        start = time.perf_counter()
+        app.run()
+        timings[stage] = [time.perf_counter() - start]
+        supabase_calls[stage] = len(client.calls) - calls_before
+        if app.exception:
+            raise RuntimeError(f"{stage}: {app.exception[0].message}")
+
+    app.session_state["bench_repeat"] = repeat
+    app.run()
+    if app.exception:
+        raise RuntimeError(f"entry points: {app.exception[0].message}")
+    timings.update(app.session_state["bench_timings"])
+    return timings, supabase_calls
+
+
+def compare(results, baseline_path):
+    """Adds baseline_ms and speedup to every stage also present in the baseline file."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["stage"], r["lots"], r["tickers"]): r["median_ms"] for r in baseline["results"]}
+    for result in results:
+        before = previous.get((result["stage"], result["lots"], result["tickers"]))
+        if before is not None:
+            result["baseline_ms"] = before
+            result["speedup"] = round(before / result["median_ms"], 2) if result["median_ms"] else None
+    return baseline.get("commit")
+
+
+def parse_size(text):
+    n_lots, _, n_tickers = text.partition(":")
+    return int(n_lots), int(n_tickers or max(1, int(n_lots) // 50))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[(10000, 1000), (100000, 2000)],
+                        metavar="LOTS:TICKERS")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per function stage")
+    parser.add_argument("--skip-app", action="store_true", help="only time the pure functions")
+    parser.add_argument("--tracing", action="store_true", help="render with PERF_TRACING=1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON to this file")
+    parser.add_argument("--compare", help="previous JSON output to compare against")
+    args = parser.parse_args()
+
+    results = []
+    for n_lots, n_tickers in args.sizes:
+        df_lots, market, crypto = synthetic_portfolio(n_lots, n_tickers, seed=args.seed)
+        client = fakes.FakeSupabase({"portfolio": df_lots.to_dict("records"), "positions": synthetic_positions(df_lots)})
+        fakes.install(market, client)
+
+        for stage, timings in bench_functions(df_lots, market, crypto, args.repeat).items():
+            results.append(stage_result(stage, n_lots, n_tickers, timings))
+        if not args.skip_app:
+            with tempfile.TemporaryDirectory() as workdir:
+                app_timings, supabase_calls = bench_app(client, "bench", workdir, args.repeat, args.tracing)
+            for stage, timings in app_timings.items():
+                result = stage_result(stage, n_lots, n_tickers, timings)
+                if stage in supabase_calls:
+                    result["supabase_calls"] = supabase_calls[stage]
+                results.append(result)
+
+    report = {"benchmark": "portfolio", "commit": current_commit(), "tracing": args.tracing, "results": results}
+    if args.compare:
+        report["baseline_commit"] = compare(results, args.compare)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Time of the scenario engine behind the stress-test section of the dashboard.
+
+Builds the exposure of a synthetic portfolio (tickers of bench.synthetic with
+made-up market values) and a year of made-up daily returns, then times
+scenarios.simulate with a fixed shock on every ticker and currency for each
+requested number of scenarios and tickers. Results are printed as JSON
+tagged with the current commit, in milliseconds.
+
+    python -m bench.scenarios --sizes 10000:500 50000:500 10000:2000
+    python -m bench.scenarios --days 500 --horizon 60
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from bench import current_commit
+from bench.synthetic import CURRENCIES, synthetic_tickers
+from scenarios import Exposure, simulate
+
+
+def synthetic_exposure(n_tickers, base_currency="USD", seed=0):
+    rng = np.random.default_rng(seed)
+    tickers, currencies, _ = synthetic_tickers(n_tickers, seed)
+    values = rng.lognormal(8, 1.5, size=n_tickers)
+    return Exposure(tickers, [currencies[t] for t in tickers], values, base_currency)
+
+
+def synthetic_daily_returns(exposure, n_days, seed=0):
+    """Daily log returns with a common market factor, 2% volatility for prices and 0.5% for FX."""
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0, 0.01, size=(n_days, 1))
+    prices = market + rng.normal(0, 0.017, size=(n_days, len(exposure.tickers)))
+    fx = rng.normal(0, 0.005, size=(n_days, len(exposure.currencies)))
+    fx[:, 0] = 0.0
+    return np.hstack([prices, fx]).astype(np.float32)
+
+
+def time_simulation(n_scenarios, n_tickers, n_days, horizon, repeat, seed):
+    exposure = synthetic_exposure(n_tickers, seed=seed)
+    daily = synthetic_daily_returns(exposure, n_days, seed)
+    price_shocks = {t: -0.1 for t in exposure.tickers[::10]}
+    fx_shocks = {c: 0.05 for c in CURRENCIES}
+
+    timings = []
+    for i in range(repeat + 1):
+        start = time.perf_counter()
+        simulate(exposure, daily, n_scenarios, horizon, price_shocks, fx_shocks, seed=seed + i)
+        timings.append(time.perf_counter() - start)
+    # La primera vuelta calienta numpy y no cuenta
+    timings = timings[1:]
+    return {
+        "scenarios": n_scenarios,
+        "tickers": n_tickers,
+        "median_ms": round(statistics.median(timings) * 1000, 1),
+        "max_ms": round(max(timings) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", nargs="+", default=["1000:50", "10000:500", "50000:500"],
+                        help="scenarios:tickers pairs to time")
+    parser.add_argument("--days", type=int, default=250, help="days of history the scenarios are drawn from")
+    parser.add_argument("--horizon", type=int, default=20, help="market days of every scenario")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        n_scenarios, n_tickers = (int(part) for part in size.split(":"))
+        results.append(time_simulation(n_scenarios, n_tickers, args.days, args.horizon, args.repeat, args.seed))
+
+    print(json.dumps({
+        "benchmark": "scenarios",
+        "commit": current_commit(),
+        "days": args.days,
+        "horizon": args.horizon,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Cold-start time of the app: first render of the login page and of the dashboard.
+
+Every run is a fresh Python process, so module imports and process-wide
+caches start empty as after a server restart. The login page runs against
+the real (offline) Supabase client; the dashboard runs with the fakes of
+bench.fakes, which import yfinance and pandas before the clock starts.
+Also reports which heavy modules each render imported (AppTest itself
+already loads plotly, so it never shows up).
+
+    python -m bench.startup --repeat 5
+    python -m bench.startup --app /otro/checkout/PORTFOLIO.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import APP_PATH, REPO_ROOT, current_commit
+
+HEAVY_MODULES = ["yfinance", "plotly", "pandas", "numpy"]
+
+
+def configure_env(workdir):
+    os.environ.update({
+        "SUPABASE_URL": "http://bench.invalid",
+        "SUPABASE_KEY": "bench",
+        "SESSION_SECRET": "bench",
+        "TICKER_METADATA_CACHE": os.path.join(workdir, "ticker_metadata.json"),
+        "PRICE_HISTORY_DB": os.path.join(workdir, "price_history.db"),
+        "SNAPSHOT_DB": os.path.join(workdir, "snapshots.db"),
+        "CRYPTO_REFRESH_SECONDS": "86400",
+        "OPEN_MARKET_REFRESH_SECONDS": "86400",
+        "CLOSED_MARKET_REFRESH_SECONDS": "86400",
+    })
+
+
+def run_child(scenario, app_path, workdir):
+    """Renders the app once in this process and prints the result as JSON."""
+    configure_env(workdir)
+    if scenario == "dashboard":
+        from bench import fakes
+        from bench.synthetic import synthetic_portfolio, synthetic_positions
+
+        df_lots, market, _ = synthetic_portfolio(500, 100)
+        fakes.install(market, fakes.FakeSupabase({"portfolio": df_lots.to_dict("records"), "positions": synthetic_positions(df_lots)}))
+
+    from streamlit.testing.v1 import AppTest
+
+    from auth import SessionSigner
+
+    app = AppTest.from_file(app_path, default_timeout=120)
+    if scenario == "dashboard":
+        app.session_state["logged_in"] = True
+        app.session_state["username"] = "bench"
+        app.session_state["auth_token"] = SessionSigner("bench").issue("bench")
+
+    already_loaded = {name for name in HEAVY_MODULES if name in sys.modules}
+    start = time.perf_counter()
+    app.run()
+    elapsed = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    print(json.dumps({
+        "seconds": elapsed,
+        "imported": [name for name in HEAVY_MODULES if name in sys.modules and name not in already_loaded],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--app", default=APP_PATH, help="PORTFOLIO.py to measure")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes per scenario")
+    parser.add_argument("--child", choices=["login", "dashboard"], help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, os.path.abspath(args.app), args.workdir)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # El dashboard va primero: deja en disco la caché de nombres, como en un servidor ya usado
+        for scenario in ("dashboard", "login"):
+            runs = []
+            for _ in range(args.repeat):
+                child = subprocess.run(
+                    [sys.executable, "-m", "bench.startup", "--child", scenario, "--app", args.app, "--workdir", workdir],
+                    cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+                )
+                runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+            timings = [run["seconds"] for run in runs]
+            results.append({
+                "scenario": scenario,
+                "runs": len(runs),
+                "median_ms": round(statistics.median(timings) * 1000, 1),
+                "min_ms": round(min(timings) * 1000, 1),
+                "imported": runs[-1]["imported"],
+            })
+    print(json.dumps({"benchmark": "startup", "commit": current_commit(), "app": args.app, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
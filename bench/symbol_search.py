@@ -0,0 +1,120 @@
+"""
+Latency of the symbol search behind the stock picker.
+
+Builds a synthetic universe of listings (made-up symbols with the exchange
+suffixes of bench.synthetic and names drawn from a small vocabulary), then
+times exact lookups and prefix, substring, misspelt and unmatched searches. Results
+are printed as JSON tagged with the current commit, in microseconds.
+
+    python -m bench.symbol_search --listings 50000 --queries 500
+    python -m bench.symbol_search --symbols /ruta/a/listado.csv
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from bench import current_commit
+from bench.synthetic import LISTINGS
+from symbol_index import SymbolIndex
+
+WORDS = [
+    "Global", "Energy", "Holdings", "Bank", "Technologies", "Pharma", "Motors", "Industries", "Capital",
+    "Systems", "Foods", "Mining", "Telecom", "Software", "Airlines", "Retail", "Insurance", "Logistics",
+    "Nestlé", "Société", "Générale", "Solar", "Networks", "Biotech", "Steel", "Media", "Realty", "Chemicals",
+]
+MARKETS = {"": "US", ".PA": "EU", ".DE": "EU", ".L": "EU", ".SW": "EU", ".T": "JP", "-USD": "CRYPTO"}
+
+
+def synthetic_listings(n_listings, seed=0):
+    """Records for `n_listings` made-up symbols, shaped like the rows of data/symbols.csv."""
+    rng = np.random.default_rng(seed)
+    weights = np.array([share for _, _, share in LISTINGS])
+    listing = rng.choice(len(LISTINGS), size=n_listings, p=weights / weights.sum())
+    letters = rng.integers(0, 26, size=(n_listings, 4))
+    words = rng.integers(0, len(WORDS), size=(n_listings, 3))
+    records = []
+    for i, k in enumerate(listing):
+        suffix, currency, _ = LISTINGS[k]
+        root = "".join(chr(65 + c) for c in letters[i]) + f"{i % 100:02d}"
+        records.append({
+            "symbol": root + suffix,
+            "name": " ".join(WORDS[w] for w in words[i]),
+            "currency": currency,
+            "market": MARKETS[suffix],
+        })
+    return records
+
+
+def queries_for(index, n_queries, seed=0):
+    """Query strings of every kind, picked from the symbols and names actually in `index`."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(index), size=n_queries)
+    records = [index._record(int(row)) for row in rows]
+    return {
+        "exact": [r["symbol"] for r in records],
+        "prefix": [r["symbol"][:2] for r in records],
+        "substring": [r["name"].split()[0][:5].lower() for r in records],
+        "typo": [word[:2] + word[3:] for word in (r["name"].split()[-1] for r in records)],
+        "no_match": [f"zq{i}x" for i in range(n_queries)],
+    }
+
+
+def time_queries(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - start)
+    return {
+        "queries": len(queries),
+        "p50_us": round(statistics.median(timings) * 1e6, 1),
+        "p95_us": round(float(np.percentile(timings, 95)) * 1e6, 1),
+        "max_us": round(max(timings) * 1e6, 1),
+    }
+
+
+def index_bytes(index):
+    """Memory of the index: its arrays plus the joined names and search lines."""
+    arrays = [value for value in vars(index).values() if isinstance(value, np.ndarray)]
+    return sum(a.nbytes for a in arrays) + sys.getsizeof(index._names) + sys.getsizeof(index._lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--listings", type=int, default=50000, help="size of the synthetic universe")
+    parser.add_argument("--symbols", help="CSV listing to index instead of the synthetic universe")
+    parser.add_argument("--queries", type=int, default=500, help="queries of each kind")
+    parser.add_argument("--limit", type=int, default=20, help="results per search, as SYMBOL_SEARCH_LIMIT")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.symbols:
+        start = time.perf_counter()
+        index = SymbolIndex.from_csv(args.symbols)
+    else:
+        records = synthetic_listings(args.listings, args.seed)
+        start = time.perf_counter()
+        index = SymbolIndex(records)
+    build_seconds = time.perf_counter() - start
+
+    queries = queries_for(index, args.queries, args.seed)
+    results = [{"kind": "get", **time_queries(index.get, queries["exact"])}]
+    for kind, kind_queries in queries.items():
+        results.append({"kind": kind, **time_queries(lambda q: index.search(q, limit=args.limit), kind_queries)})
+
+    print(json.dumps({
+        "benchmark": "symbol_search",
+        "commit": current_commit(),
+        "listings": len(index),
+        "build_ms": round(build_seconds * 1000, 1),
+        "index_mb": round(index_bytes(index) / 2**20, 2),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Synthetic portfolios for the benchmarks.
+
+Tickers are spread over the app's supported currencies (exchange suffix
+included, so market detection works as with real symbols) plus a share of
+cryptocurrencies. About one lot in ten is bought in a currency other than
+the asset's, so valuation has to cross currencies like real portfolios do.
+"""
+import numpy as np
+import pandas as pd
+
+from bench.fakes import FakeMarket
+
+
+CURRENCIES = ["EUR", "USD", "GBP", "CHF", "JPY"]
+CURRENCY_SYMBOLS = {"USD": "$", "EUR": "€", "GBP": "£", "CHF": "CHF ", "JPY": "¥"}
+USD_RATES = {"USD": 1.0, "EUR": 1.08, "GBP": 1.27, "CHF": 1.12, "JPY": 0.0067}
+
+# (sufijo, divisa, proporción de tickers)
+LISTINGS = [
+    ("", "USD", 0.45),
+    (".PA", "EUR", 0.15),
+    (".DE", "EUR", 0.10),
+    (".L", "GBP", 0.10),
+    (".SW", "CHF", 0.05),
+    (".T", "JPY", 0.05),
+    ("-USD", "USD", 0.10),
+]
+
+
+def synthetic_tickers(n_tickers, seed=0):
+    """Returns (tickers, currencies, crypto_tickers) for `n_tickers` made-up symbols."""
+    rng = np.random.default_rng(seed)
+    weights = np.array([share for _, _, share in LISTINGS])
+    listing = rng.choice(len(LISTINGS), size=n_tickers, p=weights / weights.sum())
+    tickers, currencies, crypto = [], {}, []
+    for i, k in enumerate(listing):
+        suffix, currency, _ = LISTINGS[k]
+        ticker = f"S{i:05d}{suffix}"
+        tickers.append(ticker)
+        currencies[ticker] = currency
+        if suffix == "-USD":
+            crypto.append(ticker)
+    return tickers, currencies, crypto
+
+
+def synthetic_lots(tickers, currencies, n_lots, seed=0, user_id="bench"):
+    """Purchase lots as the app reads them from the `portfolio` table."""
+    rng = np.random.default_rng(seed)
+    picked = rng.integers(0, len(tickers), size=n_lots)
+    lot_tickers = np.array(tickers, dtype=object)[picked]
+    lot_currency = np.array([currencies[t] for t in lot_tickers], dtype=object)
+    crossed = rng.random(n_lots) < 0.1
+    lot_currency[crossed] = rng.choice(CURRENCIES, size=int(crossed.sum()))
+    created_at = pd.Timestamp("2020-01-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 6 * 365, size=n_lots), unit="D")
+    return pd.DataFrame({
+        "id": np.arange(1, n_lots + 1),
+        "user_id": user_id,
+        "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+        "ticker": lot_tickers,
+        "cantidad": rng.integers(1, 200, size=n_lots).astype(float),
+        "precio_compra": rng.uniform(5, 500, size=n_lots).round(2),
+        "precio_compra_currency": lot_currency,
+        "nombre_personalizado": np.where(rng.random(n_lots) < 0.05, "Mi posición", None),
+    })
+
+
+def synthetic_market(tickers, currencies, seed=0):
+    """FakeMarket quoting every ticker and the USD rate of every currency."""
+    rng = np.random.default_rng(seed)
+    prices = dict(zip(tickers, rng.uniform(5, 600, size=len(tickers)).round(2)))
+    prices.update({f"{c}USD=X": rate for c, rate in USD_RATES.items() if c != "USD"})
+    return FakeMarket(prices=prices, currencies=currencies)
+
+
+def synthetic_portfolio(n_lots, n_tickers, seed=0, user_id="bench"):
+    """Returns (df_lots, market, crypto_tickers) for one benchmark size."""
+    tickers, currencies, crypto = synthetic_tickers(n_tickers, seed)
+    df_lots = synthetic_lots(tickers, currencies, n_lots, seed, user_id)
+    return df_lots, synthetic_market(tickers, currencies, seed), crypto
+
+
+def synthetic_positions(df_lots, method="fifo"):
+    """Rows of the `positions` table materialized from the lots, as the app stores them."""
+    from ledger import replay
+
+    positions = {}
+    for trade in df_lots.to_dict("records"):
+        positions.setdefault(trade["user_id"], []).append(trade)
+    rows = []
+    for user_id, trades in positions.items():
+        user_positions = {}
+        replay(trades, user_positions, method)
+        rows.extend(position.to_row(user_id) for position in user_positions.values())
+    return [dict(row, id=i) for i, row in enumerate(rows, start=1)]
@@ -0,0 +1,99 @@
+import numpy as np
+import plotly.express as px
+
+
+# -----------------------------------------------
+# BIPOLAR COLOR SCALE
+# -----------------------------------------------
+RED = (255, 0, 0)
+YELLOW = (255, 255, 128)
+GREEN = (0, 128, 0)
+GREY = 'rgb(192, 192, 192)'
+
+
+def bipolar_colors(values):
+    """
+    Colors for a column of returns: yellow at 0, towards red down to the
+    worst loss and towards green up to the best gain. Missing values are grey.
+
+    The whole column is interpolated in one NumPy expression; the result
+    matches the per-row version it replaces, truncating channels with int().
+    """
+    values = np.asarray(values, dtype=float)
+    negatives = values[values < 0]
+    positives = values[values > 0]
+    min_neg = negatives.min() if negatives.size else np.nan
+    max_pos = positives.max() if positives.size else np.nan
+
+    is_negative = values < 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # fmin toma 1.0 cuando el cociente es NaN, igual que min(1.0, nan) en Python
+        ratio = np.where(
+            is_negative,
+            np.fmin(1.0, np.abs(values) / abs(min_neg)),
+            np.fmin(1.0, values / max_pos),
+        )
+    target = np.where(is_negative[:, None], RED, GREEN)
+    channels = np.array(YELLOW) * (1 - ratio)[:, None] + target * ratio[:, None]
+    channels = np.where(np.isnan(channels), 0, channels).astype(int)
+
+    return [
+        GREY if np.isnan(value) else f'rgb({r}, {g}, {b})'
+        for value, (r, g, b) in zip(values, channels.tolist())
+    ]
+
+
+# -----------------------------------------------
+# DISTRIBUTION PIE CHARTS
+# -----------------------------------------------
+def distribution_pie(df, value_column, title, **layout):
+    """
+    Donut of `value_column` per 'Nombre' for the rows with a positive value,
+    colored by 'Rentabilidad (%)'. Returns None when no row is positive.
+    """
+    df_positive = df[df[value_column] > 0]
+    if df_positive.empty:
+        return None
+    df_sorted = df_positive.sort_values(by='Rentabilidad (%)')
+    colors = bipolar_colors(df_sorted['Rentabilidad (%)'])
+
+    fig = px.pie(
+        df_sorted,
+        values=value_column,
+        names='Nombre',
+        title=title,
+        hole=0.4,
+        color='Nombre',
+        color_discrete_map={name: color for name, color in zip(df_sorted['Nombre'], colors)}
+    )
+    if layout:
+        fig.update_layout(**layout)
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    return fig
+
+
+# -----------------------------------------------
+# SCENARIO DISTRIBUTION
+# -----------------------------------------------
+def scenario_histogram(pnl, base_currency, value_at_risk=None, bins=60):
+    """
+    Histogram of the P&L of a batch of scenarios, binned with NumPy so the
+    figure carries `bins` bars instead of every scenario. Losses are red and
+    gains green; `value_at_risk` (a positive loss) is drawn as a dashed line.
+    """
+    counts, edges = np.histogram(np.asarray(pnl, dtype=float), bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    fig = px.bar(
+        x=centers,
+        y=counts,
+        labels={"x": f"Ganancia / pérdida ({base_currency})", "y": "Escenarios"},
+        title="Distribución de escenarios",
+    )
+    fig.update_traces(
+        marker_color=np.where(centers < 0, 'rgb(214, 39, 40)', 'rgb(44, 160, 44)').tolist(),
+        width=float(edges[1] - edges[0]),
+    )
+    if value_at_risk is not None:
+        fig.add_vline(x=-value_at_risk, line_dash="dash", annotation_text="VaR")
+    fig.update_layout(bargap=0)
+    return fig
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+# -----------------------------------------------
+# ASSET DETAILS TABLE
+# -----------------------------------------------
+DETAILS_DISPLAY_COLUMNS = [
+    'Nombre', 'Ticker', 'Tipo', 'Divisa de Activo', 'Divisa de Compra', 'Cantidad', 'Precio de Compra Promedio',
+    'Precio Actual', 'Valor de Mercado', 'Rentabilidad', 'Rentabilidad (%)',
+    'Inversión Inicial', 'Peso en el Portfolio (%)'
+]
+
+# Columna mostrada -> (columna por divisa de df_details, columna con la divisa de cada fila)
+AMOUNT_COLUMNS = {
+    'Precio de Compra Promedio': ('Precio de Compra Promedio ({})', 'Divisa de Compra'),
+    'Precio Actual': ('Precio Actual ({})', 'Divisa de Activo'),
+    'Valor de Mercado': ('Valor de Mercado Original ({})', 'Divisa de Activo'),
+    'Rentabilidad': ('Rentabilidad ({})', 'Divisa de Activo'),
+    'Inversión Inicial': ('Inversión Inicial Original ({})', 'Divisa de Compra'),
+}
+
+# Formatos de Streamlit con separador de miles para las divisas que los tienen
+NUMBER_FORMAT_PRESETS = {"USD": "dollar", "EUR": "euro", "JPY": "yen"}
+
+
+def _pick_by_currency(df_details, template, currency_column):
+    """
+    Takes each row's value from the per-currency column matching its
+    currency. Rows without a currency stay NaN: an amount in an unknown
+    currency is shown as N/A.
+    """
+    currencies = df_details[currency_column]
+    values = np.full(len(df_details), np.nan)
+    for currency in pd.unique(currencies.dropna()):
+        column = template.format(currency)
+        if column in df_details.columns:
+            rows = (currencies == currency).to_numpy()
+            values[rows] = pd.to_numeric(df_details[column].to_numpy()[rows], errors='coerce')
+    return values
+
+
+def _amount_format(currency, currency_symbols):
+    """Number format for a column whose rows are all in `currency`."""
+    return NUMBER_FORMAT_PRESETS.get(currency) or f"{currency_symbols.get(currency, currency + ' ')}%.2f"
+
+
+def _format_amounts(values, currencies, currency_symbols):
+    """Each amount as text with the symbol of its own row's currency, as in '€1,234.56'."""
+    return [
+        "N/A" if np.isnan(value) or pd.isna(currency) else f"{currency_symbols.get(currency, f'{currency} ')}{value:,.2f}"
+        for value, currency in zip(values, currencies)
+    ]
+
+
+def format_details_table(df_details, currency_symbols):
+    """
+    Builds the "Detalles de los Activos" table and its st.column_config.
+
+    Amounts are in each row's own currency (also shown in the 'Divisa de
+    Activo' and 'Divisa de Compra' columns). A column whose rows share one
+    currency stays numeric, with that currency's symbol, so the table sorts
+    by value; a column mixing currencies is shown as text with each row's
+    own symbol, since sorting amounts in different currencies by their
+    number would be meaningless anyway. Returns (df_display, column_config).
+    """
+    df_display = df_details[['Nombre', 'Ticker', 'Tipo', 'Divisa de Activo', 'Divisa de Compra', 'Cantidad']].copy()
+    column_config = {}
+    for column, (template, currency_column) in AMOUNT_COLUMNS.items():
+        values = _pick_by_currency(df_details, template, currency_column)
+        currencies = df_details[currency_column]
+        if currencies.notna().all() and currencies.nunique() == 1:
+            df_display[column] = values
+            column_config[column] = st.column_config.NumberColumn(column, format=_amount_format(currencies.iloc[0], currency_symbols))
+        else:
+            df_display[column] = _format_amounts(values, currencies.to_numpy(), currency_symbols)
+            column_config[column] = st.column_config.TextColumn(column)
+
+    df_display['Rentabilidad (%)'] = df_details['Rentabilidad (%)']
+    df_display['Peso en el Portfolio (%)'] = df_details['Peso en el Portfolio (%)'].fillna(0.0)
+    for column in ['Rentabilidad (%)', 'Peso en el Portfolio (%)']:
+        column_config[column] = st.column_config.NumberColumn(column, format="%.2f%%")
+
+    return df_display[DETAILS_DISPLAY_COLUMNS], column_config
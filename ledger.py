@@ -0,0 +1,253 @@
+"""
+Transaction ledger of the `portfolio` table and the positions built from it.
+
+Every ledger row is a buy ('compra') or a sell ('venta') of one ticker; for a
+sell, precio_compra holds the sale price per unit. A Position keeps the queue
+of the open lots of one ticker plus running totals (quantity, remaining cost
+and realized P&L) that each trade updates incrementally, so the positions can
+be stored and read one row per ticker instead of replaying every trade.
+Sells are matched FIFO (oldest lots first) or at average cost (every open lot
+shrinks in proportion).
+"""
+import logging
+from collections import deque
+
+import pandas as pd
+
+
+logger = logging.getLogger("portfolio.ledger")
+
+METHODS = ("fifo", "average")
+# Cantidades por debajo de esto cuentan como cero (restos de coma flotante al vender por partes)
+QUANTITY_EPSILON = 1e-9
+# Campos de cada lote abierto: los de la compra que lo abrió
+LOT_FIELDS = ("id", "created_at", "cantidad", "precio_compra", "precio_compra_currency", "fecha_compra")
+# Columnas del DataFrame de lotes abiertos: las mismas que las filas de compra del libro
+LOT_COLUMNS = ["id", "created_at", "ticker", "cantidad", "precio_compra", "precio_compra_currency", "nombre_personalizado", "fecha_compra"]
+# Columnas que se leen de las tablas `portfolio` (el libro) y `positions`
+TRADE_COLUMNS = "id,created_at,ticker,tipo,cantidad,precio_compra,precio_compra_currency,nombre_personalizado,fecha_compra"
+POSITION_COLUMNS = "ticker,cantidad,coste,realizado,precio_compra_currency,nombre_personalizado,metodo,lotes,ultimo_id"
+
+
+def is_sell(trade):
+    return trade.get("tipo") == "venta"
+
+
+class Position:
+    """
+    Open lots and running totals of one ticker.
+
+    The purchase currency and the custom name are those of the first buy, as
+    in the rest of the app. Realized P&L is kept in that currency: sells are
+    priced in it and matched against the cost of the lots they close.
+    """
+
+    def __init__(self, ticker, precio_compra_currency, nombre_personalizado=None, method="fifo"):
+        if method not in METHODS:
+            raise ValueError(f"Método de casado desconocido: {method} (usa {' o '.join(METHODS)})")
+        self.ticker = ticker
+        self.precio_compra_currency = precio_compra_currency
+        self.nombre_personalizado = nombre_personalizado
+        self.method = method
+        self.lots = deque()
+        self.cantidad = 0.0
+        self.coste = 0.0
+        self.realizado = 0.0
+        # Id del último movimiento del libro aplicado a la posición
+        self.ultimo_id = 0
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Position stored in the `positions` table. Rows without `lotes` (those
+        of the portfolio_positions view) get a single lot at the average price.
+        """
+        position = cls(row["ticker"], row["precio_compra_currency"], row.get("nombre_personalizado"), row.get("metodo") or "fifo")
+        position.cantidad = float(row["cantidad"])
+        position.coste = float(row["coste"])
+        position.realizado = float(row.get("realizado") or 0.0)
+        position.ultimo_id = row.get("ultimo_id") or 0
+        lots = row.get("lotes")
+        if lots is None and position.cantidad > QUANTITY_EPSILON:
+            lots = [{
+                "id": None,
+                "created_at": row.get("created_at"),
+                "cantidad": position.cantidad,
+                "precio_compra": position.coste / position.cantidad,
+                "precio_compra_currency": position.precio_compra_currency,
+                "fecha_compra": row.get("fecha_compra"),
+            }]
+        position.lots = deque(lots or [])
+        return position
+
+    def to_row(self, user_id):
+        """Row of the `positions` table for this position."""
+        return {
+            "user_id": user_id,
+            "ticker": self.ticker,
+            "cantidad": self.cantidad,
+            "coste": self.coste,
+            "realizado": self.realizado,
+            "precio_compra_currency": self.precio_compra_currency,
+            "nombre_personalizado": self.nombre_personalizado,
+            "metodo": self.method,
+            "lotes": list(self.lots),
+            "ultimo_id": self.ultimo_id,
+        }
+
+    def apply(self, trade):
+        """
+        Applies one ledger row. Returns the (lot id, quantity) pairs a sell
+        closed, or [] for a buy. A sell of more than the open quantity raises
+        ValueError and leaves the position untouched.
+        """
+        if is_sell(trade):
+            matches = self._sell(float(trade["cantidad"]), float(trade["precio_compra"]))
+        else:
+            self._buy(trade)
+            matches = []
+        self.ultimo_id = trade["id"]
+        return matches
+
+    def _buy(self, trade):
+        lot = {field: trade.get(field) for field in LOT_FIELDS}
+        lot["cantidad"] = float(lot["cantidad"])
+        lot["precio_compra"] = float(lot["precio_compra"])
+        self.lots.append(lot)
+        self.cantidad += lot["cantidad"]
+        self.coste += lot["cantidad"] * lot["precio_compra"]
+
+    def _sell(self, cantidad, precio):
+        if cantidad > self.cantidad + QUANTITY_EPSILON:
+            raise ValueError(f"venta de {cantidad:g} {self.ticker} con solo {self.cantidad:g} en cartera")
+
+        if self.method == "fifo":
+            matches, coste_vendido, pending = [], 0.0, cantidad
+            while pending > QUANTITY_EPSILON and self.lots:
+                lot = self.lots[0]
+                taken = min(lot["cantidad"], pending)
+                matches.append((lot["id"], taken))
+                coste_vendido += taken * lot["precio_compra"]
+                pending -= taken
+                if lot["cantidad"] - taken <= QUANTITY_EPSILON:
+                    self.lots.popleft()
+                else:
+                    lot["cantidad"] -= taken
+        else:
+            # Coste medio: cada lote abierto vende la misma fracción y conserva su fecha
+            fraction = min(cantidad / self.cantidad, 1.0)
+            matches = [(lot["id"], lot["cantidad"] * fraction) for lot in self.lots]
+            coste_vendido = self.coste * fraction
+            for lot in self.lots:
+                lot["cantidad"] -= lot["cantidad"] * fraction
+
+        self.cantidad -= cantidad
+        self.coste -= coste_vendido
+        self.realizado += cantidad * precio - coste_vendido
+        if self.cantidad <= QUANTITY_EPSILON:
+            self.cantidad, self.coste = 0.0, 0.0
+            self.lots.clear()
+        return matches
+
+
+def replay(trades, positions=None, method="fifo", matches=None):
+    """
+    Applies ledger rows in id order to `positions` ({ticker: Position}, a new
+    one is created for each unseen ticker) and returns the set of tickers
+    that changed. Rows a position has already seen are skipped, so replaying
+    a tail of the ledger that overlaps the stored positions is harmless.
+    Sells of more than the open quantity are logged and ignored. With a
+    `matches` list, the (sell id, lot id, quantity) of every closed lot is
+    appended to it.
+    """
+    positions = {} if positions is None else positions
+    changed = set()
+    for trade in sorted(trades, key=lambda trade: trade["id"]):
+        position = positions.get(trade["ticker"])
+        if position is None:
+            position = positions[trade["ticker"]] = Position(
+                trade["ticker"], trade["precio_compra_currency"], trade.get("nombre_personalizado"), method
+            )
+        if trade["id"] <= position.ultimo_id:
+            continue
+        try:
+            closed = position.apply(trade)
+        except ValueError as e:
+            logger.warning("Movimiento %s ignorado: %s", trade["id"], e)
+            position.ultimo_id = trade["id"]
+        else:
+            if matches is not None:
+                matches.extend((trade["id"], lot_id, quantity) for lot_id, quantity in closed)
+        changed.add(trade["ticker"])
+    return changed
+
+
+def sync_positions(client, user_id, method="fifo"):
+    """
+    Reads the user's stored positions through a Supabase `client`, applies
+    to them the ledger rows they have not seen yet and stores the positions
+    that changed. Positions stored with another method are rebuilt from the
+    whole ledger. Returns {ticker: Position}.
+    """
+    rows = client.table("positions").select(POSITION_COLUMNS).eq("user_id", user_id).execute().data
+    positions = {row["ticker"]: Position.from_row(row) for row in rows}
+    stale = [ticker for ticker, position in positions.items() if position.method != method]
+    for ticker in stale:
+        del positions[ticker]
+
+    changed = apply_new_trades(client, user_id, positions, method, since=0 if stale else None)
+    if changed:
+        client.table("positions").upsert(
+            [positions[ticker].to_row(user_id) for ticker in sorted(changed)], on_conflict="user_id,ticker"
+        ).execute()
+    return positions
+
+
+def apply_new_trades(client, user_id, positions, method="fifo", since=None):
+    """
+    Applies to `positions` the user's ledger rows after id `since` and
+    returns the tickers that changed.
+
+    By default the ledger is read from the oldest `ultimo_id` of all
+    positions, not the newest: every position row is upserted on its own,
+    so two sessions of the same user can leave one ticker behind another (a
+    session that read the ledger up to id 7 overwrites a row another one had
+    stored at 8). Starting from the oldest one brings the lagging position
+    back up to date and replay() skips the rows the others already include.
+
+    Every position then moves up to the last id read, traded or not (none of
+    the rows read was for it), and counts as changed: otherwise a ticker
+    that has not traded for a long time would keep the next read starting
+    at its last trade, and each sync would re-read most of the ledger.
+    """
+    if since is None:
+        since = min((position.ultimo_id for position in positions.values()), default=0)
+    trades = client.table("portfolio").select(TRADE_COLUMNS).eq("user_id", user_id).gt("id", since).order("id").execute().data
+    changed = replay(trades, positions, method)
+    if trades:
+        last_id = max(trade["id"] for trade in trades)
+        for ticker, position in positions.items():
+            if position.ultimo_id < last_id:
+                position.ultimo_id = last_id
+                changed.add(ticker)
+    return changed
+
+
+def open_lots(positions):
+    """Open lots of every position as one frame, one row per lot with the columns of a ledger buy."""
+    rows = [
+        dict(lot, ticker=position.ticker, nombre_personalizado=position.nombre_personalizado)
+        for position in positions.values()
+        for lot in position.lots
+    ]
+    return pd.DataFrame(rows, columns=LOT_COLUMNS)
+
+
+def realized_by_currency(positions):
+    """Realized P&L of all positions, summed per purchase currency."""
+    realized = {}
+    for position in positions.values():
+        if position.realizado:
+            currency = position.precio_compra_currency
+            realized[currency] = realized.get(currency, 0.0) + position.realizado
+    return realized
@@ -0,0 +1,467 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, time as dt_time, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+from yahoo_client import CircuitOpenError, default_client
+
+
+# -----------------------------------------------
+# PRICE EXTRACTION HELPERS
+# -----------------------------------------------
+def last_closes(data, tickers):
+    """Returns the last non-null close per ticker from a yf.download frame."""
+    prices = {}
+    if data is None or data.empty:
+        return prices
+
+    for ticker in tickers:
+        if isinstance(data.columns, pd.MultiIndex):
+            if ('Close', ticker) not in data.columns:
+                continue
+            close = data['Close'][ticker].dropna()
+        elif 'Close' in data.columns and len(tickers) == 1:
+            close = data['Close'].dropna()
+        else:
+            continue
+        if not close.empty:
+            prices[ticker] = float(close.iloc[-1])
+    return prices
+
+
+def fetch_quotes(tickers, fallback):
+    """
+    Last price of every ticker from batched quote requests, which carry a
+    couple of fields per symbol. Only the tickers missing from them, or all of
+    them if the quote requests fail, are priced with `fallback` (a bar download).
+    """
+    tickers = list(tickers)
+    try:
+        prices = default_client().quotes(tickers)
+    except CircuitOpenError:
+        raise
+    except Exception:
+        prices = {}
+    missing = [ticker for ticker in tickers if ticker not in prices]
+    if missing:
+        prices.update(fallback(missing))
+    return prices
+
+
+def fetch_minute_closes(tickers):
+    """Downloads today's minute bars for all tickers in one call and keeps the last close."""
+    data = default_client().download(list(tickers), period="1d", interval="1m", progress=False)
+    return last_closes(data, tickers)
+
+
+def fetch_last_prices(tickers):
+    """Current price of every ticker: a quote, or the last minute bar for the tickers without one."""
+    return fetch_quotes(tickers, fetch_minute_closes)
+
+
+def fetch_daily_closes(tickers):
+    """
+    Last daily close of every ticker from one download of the last few days.
+
+    Used for FX pairs: daily bars still return data on weekends, when the FX
+    market is closed and there are no minute bars.
+    """
+    data = default_client().download(list(tickers), period="5d", interval="1d", progress=False)
+    return last_closes(data, tickers)
+
+
+def fetch_fx_quotes(symbols):
+    """Current rate of every FX pair: a quote, or the last daily close for the pairs without one."""
+    return fetch_quotes(symbols, fetch_daily_closes)
+
+
+# -----------------------------------------------
+# EXCHANGE RATES
+# -----------------------------------------------
+def fx_symbol(currency):
+    """Yahoo Finance symbol quoting one unit of `currency` in USD."""
+    return f"{currency}USD=X"
+
+
+def fetch_usd_rates(currencies):
+    """
+    USD value of one unit of each currency, from a single batched download.
+    """
+    symbols = {currency: fx_symbol(currency) for currency in currencies if currency != "USD"}
+    rates = {"USD": 1.0}
+    if symbols:
+        closes = fetch_fx_quotes(list(symbols.values()))
+        rates.update({currency: closes[symbol] for currency, symbol in symbols.items() if symbol in closes})
+    return rates
+
+
+def cross_rate_matrix(usd_rates, currencies):
+    """NxN frame where matrix.loc[a, b] is the value of one unit of `a` expressed in `b`."""
+    usd = np.array([usd_rates.get(currency, np.nan) for currency in currencies], dtype=float)
+    return pd.DataFrame(np.outer(usd, 1.0 / usd), index=currencies, columns=currencies)
+
+
+# -----------------------------------------------
+# SHARED QUOTE SERVICE
+# -----------------------------------------------
+class QuoteService:
+    """
+    Process-wide latest-price cache shared by every Streamlit session.
+
+    Fresh quotes are served from memory. Stale quotes are served as well while
+    a background refresh runs (stale-while-revalidate), so renders only block
+    on tickers that were never fetched. Tickers that another session is
+    already downloading are awaited instead of being fetched again
+    (single-flight), and the remaining misses go out as one batched request.
+
+    With a SnapshotStore, every fetched price is saved to it, and a ticker
+    this process has never fetched starts from its saved price, served as
+    stale while it refreshes. A fetch that fails or misses a ticker keeps
+    its last known price (with the time it was fetched) instead of dropping it.
+    """
+
+    def __init__(self, fetch, ttl=60, snapshots=None):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._snapshots = snapshots
+        self._lock = threading.Lock()
+        self._quotes = {}    # ticker -> (price, fetched_at)
+        self._checked = {}   # ticker -> time of the last fetch that completed for it
+        self._inflight = {}  # ticker -> Future of the batch fetching it
+        self._stats = {"hits": 0, "stale": 0, "misses": 0, "coalesced": 0, "fetches": 0, "errors": 0, "restored": 0}
+
+    def get_quotes(self, tickers, stale_ok=True):
+        """
+        Returns {ticker: (price or None, fetched_at or None, last_known)} for
+        the requested tickers. last_known is True when the price was served
+        from an older price the last fetch did not confirm (see last_known()),
+        as it stood when the quote was taken, so a caller can tell how stale
+        what it shows is even if a background refresh finishes right after.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        if self._snapshots is not None:
+            self._restore(tickers)
+        now = time.time()
+        quotes, waiting, to_fetch, to_revalidate = {}, {}, [], []
+
+        with self._lock:
+            for ticker in tickers:
+                cached = self._quotes.get(ticker)
+                if cached is not None and now - self._checked.get(ticker, 0) < self.ttl:
+                    quotes[ticker] = self._served(ticker, cached)
+                    self._stats["hits"] += 1
+                elif cached is not None and stale_ok:
+                    quotes[ticker] = self._served(ticker, cached)
+                    self._stats["stale"] += 1
+                    if ticker not in self._inflight:
+                        to_revalidate.append(ticker)
+                elif ticker in self._inflight:
+                    waiting[ticker] = self._inflight[ticker]
+                    self._stats["coalesced"] += 1
+                else:
+                    to_fetch.append(ticker)
+                    self._stats["misses"] += 1
+            batch = self._start_batch(to_fetch)
+            background = self._start_batch(to_revalidate)
+
+        if background is not None:
+            threading.Thread(target=self._fetch_batch, args=(to_revalidate, background), daemon=True).start()
+        if batch is not None:
+            fetched = self._fetch_batch(to_fetch, batch)
+            with self._lock:
+                quotes.update({ticker: self._served(ticker, quote) for ticker, quote in fetched.items()})
+
+        for ticker, future in waiting.items():
+            try:
+                future.result()
+            except Exception:
+                pass
+            with self._lock:
+                quotes[ticker] = self._served(ticker, self._quotes.get(ticker, (None, None)))
+        return quotes
+
+    def get_prices(self, tickers, stale_ok=True):
+        """Returns {ticker: price or None} for the requested tickers."""
+        return {ticker: quote[0] for ticker, quote in self.get_quotes(tickers, stale_ok).items()}
+
+    def refresh(self, tickers):
+        """Fetches the given tickers now, skipping those another caller is already fetching."""
+        with self._lock:
+            to_fetch = [t for t in dict.fromkeys(tickers) if t not in self._inflight]
+            batch = self._start_batch(to_fetch)
+        if batch is not None:
+            self._fetch_batch(to_fetch, batch)
+
+    def refresh_older_than(self, tickers, max_age):
+        """Fetches now the tickers not fetched within the last `max_age` seconds."""
+        now = time.time()
+        with self._lock:
+            stale = [t for t in tickers if now - self._checked.get(t, 0) >= max_age]
+        if stale:
+            self.refresh(stale)
+
+    def fetched_at(self, tickers):
+        """Returns {ticker: time of its last completed fetch} for the tickers fetched by this process."""
+        with self._lock:
+            return {t: self._checked[t] for t in tickers if t in self._checked}
+
+    def priced_at(self, tickers):
+        """Returns {ticker: time its current price was fetched} for the tickers with a price."""
+        with self._lock:
+            return {t: self._quotes[t][1] for t in tickers if self._quotes.get(t, (None,))[0] is not None}
+
+    def last_known(self, tickers):
+        """
+        Tickers served from an older price because the last fetch did not
+        confirm it (restored from the snapshot store or missed by Yahoo),
+        as {ticker: time that price was fetched}.
+        """
+        with self._lock:
+            served = {ticker: self._served(ticker, self._quotes.get(ticker, (None, None))) for ticker in tickers}
+        return {ticker: fetched_at for ticker, (_, fetched_at, last_known) in served.items() if last_known}
+
+    def refreshing(self, tickers):
+        """True while a fetch of any of the tickers is in flight."""
+        with self._lock:
+            return any(t in self._inflight for t in tickers)
+
+    def _restore(self, tickers):
+        """Seeds the tickers never seen by this process with their saved snapshot, if any."""
+        with self._lock:
+            unseen = [t for t in tickers if t not in self._quotes]
+        if not unseen:
+            return
+        saved = self._snapshots.load(unseen)
+        with self._lock:
+            for ticker, quote in saved.items():
+                if ticker not in self._quotes:
+                    self._quotes[ticker] = quote
+                    self._stats["restored"] += 1
+
+    def _served(self, ticker, quote):
+        # Must be called with self._lock held
+        price, fetched_at = quote
+        last_known = price is not None and (ticker not in self._checked or fetched_at < self._checked[ticker])
+        return price, fetched_at, last_known
+
+    def _start_batch(self, tickers):
+        # Must be called with self._lock held
+        if not tickers:
+            return None
+        batch = Future()
+        for ticker in tickers:
+            self._inflight[ticker] = batch
+        self._stats["fetches"] += 1
+        return batch
+
+    def _fetch_batch(self, tickers, batch):
+        try:
+            fetched = self._fetch(tickers)
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                for ticker in tickers:
+                    self._inflight.pop(ticker, None)
+            batch.set_exception(e)
+            return {ticker: self._quotes.get(ticker, (None, None)) for ticker in tickers}
+
+        with self._lock:
+            fetched_at = time.time()
+            for ticker in tickers:
+                # Missing tickers are cached as None too, so a bad symbol does
+                # not trigger a new download on every rerun; a ticker that
+                # already had a price keeps it.
+                if fetched.get(ticker) is not None or ticker not in self._quotes:
+                    self._quotes[ticker] = (fetched.get(ticker), fetched_at)
+                self._checked[ticker] = fetched_at
+                self._inflight.pop(ticker, None)
+            quotes = {ticker: self._quotes[ticker] for ticker in tickers}
+        batch.set_result(fetched)
+        if self._snapshots is not None:
+            try:
+                self._snapshots.save({t: fetched.get(t) for t in tickers}, fetched_at)
+            except Exception:
+                pass  # Sin copia en disco la cotización sigue sirviéndose desde memoria
+        return quotes
+
+    def stats(self):
+        """Returns a snapshot of the hit/stale/miss/coalesced counters."""
+        with self._lock:
+            return dict(self._stats, cached=len(self._quotes))
+
+
+# -----------------------------------------------
+# BACKGROUND PRE-WARMING
+# -----------------------------------------------
+# Horario de negociación de cada mercado: (zona horaria, apertura, cierre)
+MARKET_HOURS = {
+    "US": ("America/New_York", dt_time(9, 30), dt_time(16, 0)),
+    "EU": ("Europe/Paris", dt_time(9, 0), dt_time(17, 30)),
+    "JP": ("Asia/Tokyo", dt_time(9, 0), dt_time(15, 30)),
+    "COMMODITY": ("America/New_York", dt_time(0, 0), dt_time(23, 59, 59)),
+}
+
+
+def is_market_open(market, now=None):
+    """True if `market` is trading at `now` (weekdays within MARKET_HOURS)."""
+    tz_name, opens, closes = MARKET_HOURS.get(market, MARKET_HOURS["US"])
+    local_now = (now or datetime.now(timezone.utc)).astimezone(ZoneInfo(tz_name))
+    return local_now.weekday() < 5 and opens <= local_now.time() <= closes
+
+
+class QuotePrewarmer(threading.Thread):
+    """
+    Daemon thread that keeps the QuoteService warm for every active session.
+
+    It refreshes the union of the tickers held by sessions seen in the last
+    `session_ttl` seconds plus a fixed base universe. Crypto trades 24/7 and is
+    refreshed every `crypto_every` seconds; other tickers every `open_every`
+    seconds while their market is open and every `closed_every` otherwise.
+    """
+
+    def __init__(self, service, base_tickers, is_crypto, is_open,
+                 crypto_every=60, open_every=60, closed_every=1800, session_ttl=900, tick=5):
+        super().__init__(name="quote-prewarmer", daemon=True)
+        self.service = service
+        self.base_tickers = list(base_tickers)
+        self.is_crypto = is_crypto
+        self.is_open = is_open
+        self.crypto_every = crypto_every
+        self.open_every = open_every
+        self.closed_every = closed_every
+        self.session_ttl = session_ttl
+        self.tick = tick
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> (tickers, last_seen)
+        self._stop_event = threading.Event()
+
+    def track(self, session_id, tickers):
+        """Registers the tickers a session is currently looking at."""
+        with self._lock:
+            self._sessions[session_id] = (tuple(tickers), time.time())
+
+    def tracked_tickers(self):
+        now = time.time()
+        with self._lock:
+            self._sessions = {s: v for s, v in self._sessions.items() if now - v[1] < self.session_ttl}
+            held = [t for tickers, _ in self._sessions.values() for t in tickers]
+        return list(dict.fromkeys(self.base_tickers + held))
+
+    def due_tickers(self, now=None):
+        """Tickers whose last fetch is older than their refresh cadence."""
+        now = now or time.time()
+        tickers = self.tracked_tickers()
+        fetched_at = self.service.fetched_at(tickers)
+        due = []
+        for ticker in tickers:
+            if self.is_crypto(ticker):
+                every = self.crypto_every
+            elif self.is_open(ticker):
+                every = self.open_every
+            else:
+                every = self.closed_every
+            if now - (fetched_at.get(ticker) or 0) >= every:
+                due.append(ticker)
+        return due
+
+    def run(self):
+        while not self._stop_event.is_set():
+            due = self.due_tickers()
+            if due:
+                try:
+                    self.service.refresh(due)
+                except Exception:
+                    pass  # El siguiente ciclo lo vuelve a intentar
+            self._stop_event.wait(self.tick)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# -----------------------------------------------
+# TICKER METADATA CACHE
+# -----------------------------------------------
+def fetch_ticker_details(ticker_symbol, default_currency=None):
+    """
+    Gets the full name and trading currency of a single ticker using yfinance.
+    Raises LookupError for a symbol Yahoo does not know (no name, no currency),
+    so the metadata cache records it as a failed lookup instead of defaulting it.
+    """
+    info = default_client().info(ticker_symbol)
+    if not (info.get('longName') or info.get('shortName') or info.get('currency')):
+        raise LookupError(f"Yahoo Finance no conoce el ticker {ticker_symbol}")
+    name = info.get('longName') or info.get('shortName') or ticker_symbol
+    return {'name': name, 'currency': info.get('currency') or default_currency}
+
+
+class TickerMetadataCache:
+    """
+    Ticker names and currencies persisted to a JSON file with per-entry timestamps.
+
+    Entries are served from memory; only missing or expired tickers are looked
+    up, concurrently on a bounded thread pool, and written back to disk.
+    Failed lookups are kept in memory for a short while but never persisted.
+    """
+
+    def __init__(self, path, fetch, ttl=7 * 24 * 3600, max_workers=8, retry_failed_after=300):
+        self.path = path
+        self._fetch = fetch
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.retry_failed_after = retry_failed_after
+        self._lock = threading.Lock()
+        self._entries = self._load()  # ticker -> {'name', 'currency', 'fetched_at'}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        entries = {t: e for t, e in self._entries.items() if not e.get('failed')}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def _is_fresh(self, entry, now):
+        max_age = self.retry_failed_after if entry.get('failed') else self.ttl
+        return now - entry.get('fetched_at', 0) < max_age
+
+    def _lookup(self, ticker):
+        try:
+            details = self._fetch(ticker)
+            return {'name': details['name'], 'currency': details['currency'], 'fetched_at': time.time()}
+        except Exception:
+            return {'name': ticker, 'currency': None, 'fetched_at': time.time(), 'failed': True}
+
+    def get_many(self, tickers):
+        """Returns {ticker: {'name', 'currency'}}, fetching only missing or expired entries."""
+        now = time.time()
+        with self._lock:
+            to_fetch = [t for t in dict.fromkeys(tickers)
+                        if t not in self._entries or not self._is_fresh(self._entries[t], now)]
+
+        if to_fetch:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(to_fetch))) as pool:
+                fetched = dict(zip(to_fetch, pool.map(self._lookup, to_fetch)))
+            with self._lock:
+                self._entries.update(fetched)
+                if any(not e.get('failed') for e in fetched.values()):
+                    try:
+                        self._save()
+                    except OSError:
+                        pass  # A read-only disk only costs us the warm start
+
+        with self._lock:
+            return {t: {'name': self._entries[t]['name'], 'currency': self._entries[t]['currency']}
+                    for t in tickers if t in self._entries}
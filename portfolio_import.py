@@ -0,0 +1,119 @@
+import csv
+import io
+from datetime import date, datetime
+from itertools import islice
+
+
+# Columnas aceptadas en el CSV de importación; las cuatro últimas son opcionales
+REQUIRED_COLUMNS = ["ticker", "cantidad", "precio_compra"]
+OPTIONAL_COLUMNS = ["tipo", "precio_compra_currency", "nombre_personalizado", "fecha_compra"]
+# Valores de tipo: compra (por defecto) o venta; en las ventas precio_compra es el precio de venta
+TRADE_TYPES = ["compra", "venta"]
+# Formatos de fecha_compra: ISO o día/mes/año
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"]
+
+
+def parse_number(value):
+    """Parses '1234.5', '1234,5' or '1.234,5' into a float."""
+    value = value.strip().replace(" ", "")
+    if "," in value and "." in value:
+        # El último separador es el decimal
+        if value.rfind(",") > value.rfind("."):
+            value = value.replace(".", "").replace(",", ".")
+        else:
+            value = value.replace(",", "")
+    elif "," in value:
+        value = value.replace(",", ".")
+    return float(value)
+
+
+def parse_date(value):
+    """Parses '2024-03-15', '15/03/2024' or '15-03-2024' into a date."""
+    value = value.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"fecha no válida: {value}")
+
+
+def iter_import_rows(fileobj, default_currency, supported_currencies):
+    """
+    Streams the rows of a CSV upload without loading the whole file.
+
+    Yields (line_number, row, error) where row is a dict ready to insert
+    (without user_id) or None when the line is invalid. Sells without a
+    currency have precio_compra_currency None: the caller fills in the one of
+    their position. The delimiter (',', ';' or tab) is the one that appears
+    most in the header line.
+    """
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        yield from _iter_rows(text, default_currency, supported_currencies)
+    finally:
+        # Deja abierto el archivo subido para que quien llama pueda consultar su posición
+        text.detach()
+
+
+def _iter_rows(text, default_currency, supported_currencies):
+    header_line = text.readline()
+    text.seek(0)
+    delimiter = max(",;\t", key=header_line.count)
+
+    reader = csv.reader(text, delimiter=delimiter)
+    header = [column.strip().lower() for column in next(reader, [])]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        yield 1, None, f"Faltan columnas obligatorias: {', '.join(missing)}"
+        return
+    positions = {column: header.index(column) for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if column in header}
+
+    # line_num cuenta líneas físicas: un campo entre comillas puede ocupar varias
+    next_line = reader.line_num + 1
+    for values in reader:
+        line_number, next_line = next_line, reader.line_num + 1
+        if not any(value.strip() for value in values):
+            continue
+        fields = {column: values[i].strip() if i < len(values) else "" for column, i in positions.items()}
+        try:
+            cantidad = parse_number(fields["cantidad"])
+            precio_compra = parse_number(fields["precio_compra"])
+        except ValueError:
+            yield line_number, None, "cantidad o precio_compra no es un número"
+            continue
+        tipo = (fields.get("tipo") or "compra").lower()
+        # Una venta sin divisa se hace en la de su posición, que se resuelve al importarla
+        currency = (fields.get("precio_compra_currency") or ("" if tipo == "venta" else default_currency)).upper()
+        try:
+            fecha_compra = parse_date(fields["fecha_compra"]) if fields.get("fecha_compra") else None
+        except ValueError:
+            yield line_number, None, "fecha_compra no es una fecha (AAAA-MM-DD o DD/MM/AAAA)"
+            continue
+        if not fields["ticker"]:
+            yield line_number, None, "ticker vacío"
+        elif tipo not in TRADE_TYPES:
+            yield line_number, None, f"tipo no válido: {tipo} (compra o venta)"
+        elif cantidad <= 0 or precio_compra <= 0:
+            yield line_number, None, "cantidad y precio_compra deben ser positivos"
+        elif currency and currency not in supported_currencies:
+            yield line_number, None, f"divisa no soportada: {currency}"
+        elif fecha_compra is not None and fecha_compra > date.today():
+            yield line_number, None, "fecha_compra no puede ser futura"
+        else:
+            yield line_number, {
+                "ticker": fields["ticker"].upper(),
+                "tipo": tipo,
+                "cantidad": cantidad,
+                "precio_compra": precio_compra,
+                "precio_compra_currency": currency or None,
+                "nombre_personalizado": fields.get("nombre_personalizado", ""),
+                "fecha_compra": fecha_compra.isoformat() if fecha_compra else None,
+            }, None
+
+
+def chunked(iterable, size):
+    """Yields lists of at most `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from yahoo_client import default_client
+
+
+# Cuánto historial se descarga la primera vez que aparece un ticker, por intervalo.
+# Yahoo solo sirve barras de 1 minuto de los últimos 7 días.
+DEFAULT_LOOKBACK = {
+    "1d": timedelta(days=3650),
+    "1h": timedelta(days=729),
+    "5m": timedelta(days=59),
+    "1m": timedelta(days=7),
+}
+
+# Los tickers ya guardados se descargan juntos si su última barra cae en el mismo
+# periodo: un ticker atrasado no obliga a los demás a repetir todo su hueco
+REFRESH_GROUPING = {"1d": "D", "1h": "h", "5m": "h", "1m": "h"}
+
+BAR_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+def _to_epoch_seconds(index):
+    """Converts a bar index (naive or tz-aware) to UTC epoch seconds."""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    return (index.as_unit("s").asi8).tolist()
+
+
+class PriceHistoryStore:
+    """
+    Append-only local store of OHLCV bars kept in SQLite.
+
+    Bars are clustered by (ticker, interval, ts), so every ticker is its own
+    contiguous partition and its last stored timestamp is a single index seek.
+    refresh() only downloads what is missing since that timestamp.
+    """
+
+    def __init__(self, path, download=None):
+        self.path = path
+        self._download = download or default_client().download
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bars (
+                    ticker TEXT NOT NULL,
+                    interval TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    open REAL, high REAL, low REAL, close REAL, volume REAL,
+                    PRIMARY KEY (ticker, interval, ts)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def last_timestamps(self, tickers, interval="1d"):
+        """Returns {ticker: last stored bar as a naive UTC Timestamp} for tickers with data."""
+        if not tickers:
+            return {}
+        placeholders = ",".join("?" * len(tickers))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT ticker, MAX(ts) FROM bars WHERE interval = ? AND ticker IN ({placeholders}) GROUP BY ticker",
+                [interval, *tickers],
+            ).fetchall()
+        return {ticker: pd.Timestamp(ts, unit="s") for ticker, ts in rows}
+
+    def append(self, data, tickers, interval="1d"):
+        """Stores the bars of a yf.download frame and returns how many rows were written."""
+        if data is None or data.empty:
+            return 0
+
+        timestamps = _to_epoch_seconds(data.index)
+        rows = []
+        for ticker in tickers:
+            if isinstance(data.columns, pd.MultiIndex):
+                if ("Close", ticker) not in data.columns:
+                    continue
+                bars = data.xs(ticker, axis=1, level=1)
+            elif len(tickers) == 1:
+                bars = data
+            else:
+                continue
+            bars = bars.reindex(columns=BAR_FIELDS)
+            for ts, values in zip(timestamps, bars.itertuples(index=False, name=None)):
+                if pd.isna(values[3]):
+                    continue
+                rows.append((ticker, interval, ts, *(None if pd.isna(v) else float(v) for v in values)))
+
+        # INSERT OR REPLACE: la última barra puede seguir formándose y se sobrescribe
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def refresh(self, tickers, interval="1d"):
+        """
+        Downloads only the bars missing since the last stored timestamp.
+
+        Tickers already in the store are grouped by the day (the hour for
+        intraday intervals) of their last timestamp, and each group is fetched
+        together from the oldest timestamp in it; tickers never seen before are
+        fetched together with the default lookback for the interval.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        last = self.last_timestamps(tickers, interval)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+        batches = {}
+        groups = {}
+        for ticker in tickers:
+            if ticker in last:
+                groups.setdefault(last[ticker].floor(REFRESH_GROUPING.get(interval, "D")), []).append(ticker)
+        for group in groups.values():
+            batches[min(last[t] for t in group).to_pydatetime()] = group
+        new = [t for t in tickers if t not in last]
+        if new:
+            batches.setdefault(now - DEFAULT_LOOKBACK.get(interval, DEFAULT_LOOKBACK["1d"]), []).extend(new)
+
+        written = 0
+        for start, batch in batches.items():
+            data = self._download(batch, start=start, interval=interval, progress=False)
+            written += self.append(data, batch, interval)
+        return written
+
+    def closes(self, tickers, interval="1d", start=None):
+        """Returns a dates x tickers frame of stored close prices."""
+        if not tickers:
+            return pd.DataFrame()
+        placeholders = ",".join("?" * len(tickers))
+        params = [interval, *tickers]
+        query = f"SELECT ts, ticker, close FROM bars WHERE interval = ? AND ticker IN ({placeholders})"
+        if start is not None:
+            query += " AND ts >= ?"
+            params.append(int(pd.Timestamp(start).timestamp()))
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+        if df.empty:
+            return pd.DataFrame(columns=list(tickers), dtype=float)
+        df["ts"] = pd.to_datetime(df["ts"], unit="s")
+        return df.pivot(index="ts", columns="ticker", values="close").sort_index()
+
+    def fx_to_base(self, currencies, base_currency, start=None):
+        """
+        Dates x currencies frame with the value of one unit of each currency
+        in base_currency, from the stored daily closes of the pairs against
+        USD. Empty when the base currency has no stored pair.
+        """
+        from market_data import fx_symbol
+
+        symbols = {fx_symbol(c): c for c in currencies if c != "USD"}
+        if start is not None:
+            # Una semana antes: una compra en fin de semana usa el cierre del viernes anterior
+            start = pd.Timestamp(start) - timedelta(days=7)
+        fx_usd = self.closes(list(symbols), interval="1d", start=start).rename(columns=symbols)
+        fx_usd["USD"] = 1.0
+        if base_currency not in fx_usd.columns:
+            return pd.DataFrame()
+        return fx_usd.div(fx_usd[base_currency], axis=0)
@@ -0,0 +1,148 @@
+"""
+What-if valuation of the current holdings under price and FX shocks.
+
+The holdings are reduced to a tickers x currencies exposure matrix W whose
+column c holds the base-currency value of every asset quoted in currency c.
+A batch of S scenarios is a matrix of price returns P (S x tickers) plus one
+of FX returns F (S x currencies), and their values are
+((1 + P) @ W * (1 + F)).sum(axis=1): one matrix product, whatever the number
+of scenarios. Fixed shocks (NVDA -30%, EUR +5%...) scale the rows of W and
+the FX factors, so they stack on top of any batch for free.
+
+Monte Carlo scenarios bootstrap historical days: each one adds up `horizon`
+daily log returns drawn at random from the history, for prices and FX at
+once so their joint moves are kept. Counting how many times every scenario
+draws every day turns that sum into a (scenarios x days) @ (days x symbols)
+matrix product too.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Días de histórico por debajo de los cuales el bootstrap no dice nada útil
+MIN_HISTORY_DAYS = 20
+
+
+# -----------------------------------------------
+# EXPOSURE
+# -----------------------------------------------
+class Exposure:
+    """Base-currency value of the held assets, by ticker and by the currency each one is quoted in."""
+
+    def __init__(self, tickers, ticker_currencies, values, base_currency):
+        self.tickers = list(tickers)
+        # La divisa base va siempre la primera; su tipo de cambio no se mueve
+        self.currencies = list(dict.fromkeys([base_currency, *ticker_currencies]))
+        self.values = np.asarray(values, dtype=np.float32)
+        columns = pd.Index(self.currencies).get_indexer(list(ticker_currencies))
+        self.matrix = np.zeros((len(self.tickers), len(self.currencies)), dtype=np.float32)
+        self.matrix[np.arange(len(self.tickers)), columns] = self.values
+
+    @classmethod
+    def from_details(cls, df_details, base_currency):
+        """Exposure of the details table of summarize_portfolio; assets without a currency count as base."""
+        if df_details.empty:
+            return cls([], [], [], base_currency)
+        currencies = df_details['Divisa de Activo'].fillna(base_currency).tolist()
+        values = df_details[f'Valor de Mercado ({base_currency})'].fillna(0.0).to_numpy(dtype=float)
+        return cls(df_details['Ticker'].tolist(), currencies, values, base_currency)
+
+    @property
+    def value(self):
+        return float(self.values.sum(dtype=np.float64))
+
+    def shock_vectors(self, price_shocks=None, fx_shocks=None):
+        """
+        Price returns by ticker and FX returns by currency, aligned with the
+        exposure, from {ticker: return} and {currency: return} (0.05 = +5%).
+        Symbols that are not held are ignored; the base currency never moves.
+        """
+        price = np.array([(price_shocks or {}).get(t, 0.0) for t in self.tickers], dtype=np.float32)
+        fx = np.array([(fx_shocks or {}).get(c, 0.0) for c in self.currencies], dtype=np.float32)
+        fx[0] = 0.0
+        return price, fx
+
+
+def revalue(exposure, price_returns, fx_returns, price_shock=None, fx_shock=None):
+    """
+    Value of the holdings under every scenario: rows of price_returns
+    (S x tickers) and fx_returns (S x currencies). The optional fixed
+    shocks (see Exposure.shock_vectors) compound with every scenario.
+    """
+    matrix = exposure.matrix if price_shock is None else exposure.matrix * (1 + price_shock)[:, None]
+    # (1 + P) @ W sin materializar 1 + P: P @ W más el valor de cada divisa
+    by_currency = price_returns @ matrix + matrix.sum(axis=0)
+    fx_factor = 1 + fx_returns if fx_shock is None else (1 + fx_returns) * (1 + fx_shock)
+    return (by_currency * fx_factor).sum(axis=1, dtype=np.float64)
+
+
+# -----------------------------------------------
+# MONTE CARLO
+# -----------------------------------------------
+def daily_log_returns(closes, fx_to_base, tickers, currencies):
+    """
+    (days x (tickers + currencies)) float32 matrix of the daily log returns
+    of the given tickers (columns of `closes`) and currencies (columns of
+    `fx_to_base`), on the weekdays of `closes`; crypto weekends fold into
+    Monday. Days without a price for a symbol, such as those before it
+    listed, count as no move.
+    """
+    prices = closes.reindex(columns=list(tickers))
+    prices = prices[prices.index.dayofweek < 5]
+    if len(prices) < 2:
+        return np.zeros((0, len(tickers) + len(currencies)), dtype=np.float32)
+    fx = fx_to_base.reindex(fx_to_base.index.union(prices.index)).sort_index().ffill().reindex(prices.index)
+    fx = fx.reindex(columns=list(currencies))
+
+    levels = np.hstack([prices.ffill().to_numpy(dtype=float), fx.to_numpy(dtype=float)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(np.log(levels), axis=0)
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0).astype(np.float32)
+
+
+def bootstrap_returns(daily, n_scenarios, horizon, rng):
+    """
+    Simple returns over `horizon` days of n_scenarios scenarios, each the sum
+    of `horizon` rows of `daily` drawn with replacement. Costs one
+    (n_scenarios x days) @ (days x symbols) product.
+    """
+    n_days = len(daily)
+    picks = rng.integers(0, n_days, size=(n_scenarios, horizon))
+    # Veces que cada escenario toma cada día
+    flat = (np.arange(n_scenarios)[:, None] * n_days + picks).ravel()
+    counts = np.bincount(flat, minlength=n_scenarios * n_days).reshape(n_scenarios, n_days).astype(np.float32)
+    return np.expm1(counts @ daily)
+
+
+def simulate(exposure, daily=None, n_scenarios=10000, horizon=20, price_shocks=None, fx_shocks=None, seed=None):
+    """
+    P&L of the holdings in the base currency under the fixed shocks
+    ({symbol: return}), alone (one scenario, when there is no history in
+    `daily`) or on top of n_scenarios Monte Carlo scenarios of `horizon`
+    market days.
+    """
+    price_shock, fx_shock = exposure.shock_vectors(price_shocks, fx_shocks)
+    n_tickers = len(exposure.tickers)
+    if daily is None or len(daily) == 0 or not n_scenarios:
+        price_returns = np.zeros((1, n_tickers), dtype=np.float32)
+        fx_returns = np.zeros((1, len(exposure.currencies)), dtype=np.float32)
+    else:
+        returns = bootstrap_returns(daily, n_scenarios, horizon, np.random.default_rng(seed))
+        price_returns, fx_returns = returns[:, :n_tickers], returns[:, n_tickers:]
+    return revalue(exposure, price_returns, fx_returns, price_shock, fx_shock) - exposure.value
+
+
+def risk_summary(pnl, levels=(0.95, 0.99)):
+    """
+    Mean P&L, probability of a loss and, for every confidence level, the
+    value at risk and the expected shortfall (average loss beyond the VaR),
+    both as positive losses.
+    """
+    pnl = np.sort(np.asarray(pnl, dtype=float))
+    summary = {"mean": float(pnl.mean()), "p_loss": float((pnl < 0).mean())}
+    for level in levels:
+        tail = pnl[: max(1, int(np.floor(len(pnl) * (1 - level))))]
+        label = f"{level * 100:g}"
+        summary[f"var_{label}"] = float(-np.quantile(pnl, 1 - level))
+        summary[f"es_{label}"] = float(-tail.mean())
+    return summary
@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+
+class SnapshotStore:
+    """
+    Last successfully fetched price of every symbol, kept in SQLite.
+
+    Quotes and FX rates share the table (their Yahoo symbols never collide).
+    It survives restarts, so a new process can render from the last known
+    prices right away and fall back to them when a fetch fails.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    symbol TEXT PRIMARY KEY,
+                    price REAL NOT NULL,
+                    fetched_at REAL NOT NULL
+                ) WITHOUT ROWID
+                """
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def save(self, prices, fetched_at):
+        """Stores {symbol: price} as fetched at `fetched_at` (epoch seconds); None prices are skipped."""
+        rows = [(symbol, float(price), fetched_at) for symbol, price in prices.items() if price is not None]
+        if not rows:
+            return 0
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def load(self, symbols):
+        """Returns {symbol: (price, fetched_at)} for the symbols with a snapshot."""
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+        placeholders = ",".join("?" * len(symbols))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT symbol, price, fetched_at FROM snapshots WHERE symbol IN ({placeholders})", symbols
+            ).fetchall()
+        return {symbol: (price, fetched_at) for symbol, price, fetched_at in rows}
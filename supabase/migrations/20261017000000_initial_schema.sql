@@ -0,0 +1,22 @@
+-- Esquema base que usa la aplicación (idempotente: no toca tablas ya existentes).
+-- Permite levantar una base de datos local con `psql -f` o `supabase db reset`.
+
+create table if not exists public.users (
+    id bigint generated by default as identity primary key,
+    created_at timestamptz not null default now(),
+    username text not null unique,
+    password text not null
+);
+
+create table if not exists public.portfolio (
+    id bigint generated by default as identity primary key,
+    created_at timestamptz not null default now(),
+    user_id text not null,
+    ticker text not null,
+    cantidad double precision not null,
+    precio_compra double precision not null,
+    precio_compra_currency text not null,
+    nombre_personalizado text
+);
+
+create index if not exists portfolio_user_id_ticker_idx on public.portfolio (user_id, ticker);
@@ -0,0 +1,32 @@
+-- Agregación de posiciones en el servidor: una fila por usuario y ticker en
+-- lugar de enviar cada compra al cliente. La divisa y el nombre se toman de
+-- la primera compra, igual que en calculate_portfolio_summary.
+
+-- drop + create en lugar de create or replace: volver a aplicar todas las migraciones
+-- sobre una base ya migrada encuentra la vista con otras columnas (ver _ledger.sql)
+drop view if exists public.portfolio_positions cascade;
+
+create view public.portfolio_positions
+with (security_invoker = true) as
+select
+    user_id,
+    ticker,
+    sum(cantidad) as cantidad,
+    case
+        when sum(cantidad) > 0 then sum(cantidad * precio_compra) / sum(cantidad)
+        else 0
+    end as precio_compra,
+    (array_agg(precio_compra_currency order by created_at, id))[1] as precio_compra_currency,
+    (array_agg(nombre_personalizado order by created_at, id))[1] as nombre_personalizado,
+    min(created_at) as created_at,
+    count(*) as lotes
+from public.portfolio
+group by user_id, ticker;
+
+create or replace function public.get_portfolio_positions(p_user_id text)
+returns setof public.portfolio_positions
+language sql
+stable
+as $$
+    select * from public.portfolio_positions where user_id = p_user_id;
+$$;
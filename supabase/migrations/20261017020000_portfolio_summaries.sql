@@ -0,0 +1,18 @@
+-- Valoración diaria de cada portfolio que escribe batch_valuation.py.
+-- Una fila por usuario y día: volver a lanzar el proceso el mismo día la sobrescribe.
+
+create table if not exists public.portfolio_summaries (
+    user_id text not null,
+    valued_on date not null,
+    base_currency text not null,
+    invested double precision not null,
+    market_value double precision not null,
+    pnl double precision not null,
+    pnl_pct double precision not null,
+    positions integer not null,
+    unpriced_positions integer not null default 0,
+    valued_at timestamptz not null default now(),
+    primary key (user_id, valued_on)
+);
+
+create index if not exists portfolio_summaries_valued_on_idx on public.portfolio_summaries (valued_on);
@@ -0,0 +1,33 @@
+-- Fecha de cada compra, para convertir su coste al tipo de cambio de ese día.
+-- Es opcional: las filas sin ella (las anteriores a esta migración) usan el día de created_at.
+
+alter table public.portfolio add column if not exists fecha_compra date;
+
+-- Con la agregación en el servidor cada posición se convierte a la fecha de su primera compra
+drop view if exists public.portfolio_positions cascade;
+
+create view public.portfolio_positions
+with (security_invoker = true) as
+select
+    user_id,
+    ticker,
+    sum(cantidad) as cantidad,
+    case
+        when sum(cantidad) > 0 then sum(cantidad * precio_compra) / sum(cantidad)
+        else 0
+    end as precio_compra,
+    (array_agg(precio_compra_currency order by created_at, id))[1] as precio_compra_currency,
+    (array_agg(nombre_personalizado order by created_at, id))[1] as nombre_personalizado,
+    min(created_at) as created_at,
+    count(*) as lotes,
+    min(coalesce(fecha_compra, (created_at at time zone 'utc')::date)) as fecha_compra
+from public.portfolio
+group by user_id, ticker;
+
+create or replace function public.get_portfolio_positions(p_user_id text)
+returns setof public.portfolio_positions
+language sql
+stable
+as $$
+    select * from public.portfolio_positions where user_id = p_user_id;
+$$;
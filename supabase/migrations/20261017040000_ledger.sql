@@ -0,0 +1,99 @@
+-- Libro de movimientos: cada fila de portfolio es una compra o una venta.
+-- En las ventas, precio_compra es el precio de venta por unidad, en la divisa de la posición.
+
+alter table public.portfolio add column if not exists tipo text not null default 'compra';
+
+do $$
+begin
+    if not exists (select 1 from pg_constraint where conname = 'portfolio_tipo_check') then
+        alter table public.portfolio add constraint portfolio_tipo_check check (tipo in ('compra', 'venta'));
+    end if;
+end
+$$;
+
+-- Lectura de los movimientos de un usuario posteriores a los ya aplicados a sus posiciones
+create index if not exists portfolio_user_id_id_idx on public.portfolio (user_id, id);
+
+-- Posiciones materializadas: una fila por usuario y ticker que la aplicación
+-- actualiza con cada movimiento (ledger.py). `lotes` es la cola de compras
+-- abiertas, `coste` su coste restante y `realizado` la ganancia de las ventas,
+-- ambos en la divisa de la posición. `ultimo_id` es el último movimiento aplicado.
+create table if not exists public.positions (
+    id bigint generated by default as identity primary key,
+    user_id text not null,
+    ticker text not null,
+    cantidad double precision not null,
+    coste double precision not null,
+    realizado double precision not null default 0,
+    precio_compra_currency text not null,
+    nombre_personalizado text,
+    metodo text not null default 'fifo',
+    lotes jsonb not null default '[]'::jsonb,
+    ultimo_id bigint not null default 0,
+    updated_at timestamptz not null default now(),
+    unique (user_id, ticker)
+);
+
+-- Las filas anteriores a esta migración son todas compras: cada posición es la suma de sus lotes
+insert into public.positions (
+    user_id, ticker, cantidad, coste, precio_compra_currency, nombre_personalizado, lotes, ultimo_id
+)
+select
+    user_id,
+    ticker,
+    sum(cantidad),
+    sum(cantidad * precio_compra),
+    (array_agg(precio_compra_currency order by id))[1],
+    (array_agg(nombre_personalizado order by id))[1],
+    jsonb_agg(
+        jsonb_build_object(
+            'id', id,
+            'created_at', created_at,
+            'cantidad', cantidad,
+            'precio_compra', precio_compra,
+            'precio_compra_currency', precio_compra_currency,
+            'fecha_compra', fecha_compra
+        )
+        order by id
+    ),
+    max(id)
+from public.portfolio
+where tipo = 'compra'
+group by user_id, ticker
+on conflict (user_id, ticker) do nothing;
+
+-- La agregación en el servidor lee ahora las posiciones materializadas en lugar de sumar las compras.
+-- La vista cambia de columnas, así que se vuelve a crear junto con su función.
+drop function if exists public.get_portfolio_positions(text);
+drop view if exists public.portfolio_positions;
+
+create view public.portfolio_positions
+with (security_invoker = true) as
+select
+    user_id,
+    ticker,
+    cantidad,
+    coste,
+    realizado,
+    precio_compra_currency,
+    nombre_personalizado,
+    metodo,
+    ultimo_id,
+    (lotes -> 0 ->> 'created_at')::timestamptz as created_at,
+    jsonb_array_length(lotes) as lotes_abiertos,
+    coalesce(
+        (lotes -> 0 ->> 'fecha_compra')::date,
+        ((lotes -> 0 ->> 'created_at')::timestamptz at time zone 'utc')::date
+    ) as fecha_compra
+from public.positions;
+
+create function public.get_portfolio_positions(p_user_id text)
+returns setof public.portfolio_positions
+language sql
+stable
+as $$
+    select * from public.portfolio_positions where user_id = p_user_id;
+$$;
+
+-- Ganancia realizada de cada usuario en la valoración diaria de batch_valuation.py
+alter table public.portfolio_summaries add column if not exists realized double precision not null default 0;
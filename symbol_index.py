@@ -0,0 +1,166 @@
+import csv
+import unicodedata
+
+import numpy as np
+
+
+def _fold(text):
+    """Upper-cases and strips accents, so 'nestle' finds 'Nestlé'."""
+    text = unicodedata.normalize("NFKD", text.upper())
+    return text.encode("ascii", "ignore").decode("ascii")
+
+
+# Código de cada carácter en los trigramas: espacio 0, letras 1-26, dígitos 27-36, el resto 37
+_ALPHABET = 38
+_CHAR_CODES = np.full(256, _ALPHABET - 1, dtype=np.int32)
+_CHAR_CODES[ord(" ")] = 0
+_CHAR_CODES[np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)] = np.arange(1, 27)
+_CHAR_CODES[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(27, 37)
+
+
+def _trigram_codes(text):
+    """Integer code of every trigram of an ASCII string, in order."""
+    chars = _CHAR_CODES[np.frombuffer(text.encode("ascii"), dtype=np.uint8)]
+    return chars[:-2] * _ALPHABET ** 2 + chars[1:-1] * _ALPHABET + chars[2:]
+
+
+# -----------------------------------------------
+# SYMBOL INDEX
+# -----------------------------------------------
+class SymbolIndex:
+    """
+    Read-only index of listings (symbol, name, currency, market) for the ticker picker.
+
+    Everything lives in a handful of NumPy arrays and two strings instead of
+    one object per listing:
+
+    * symbols, sorted in a fixed-width bytes array: exact and prefix lookups
+      are binary searches;
+    * names, joined in one string with an array of offsets;
+    * currencies and markets as uint8 codes into small label lists;
+    * a trigram posting list in CSR form (for every trigram code, the rows
+      whose accent-folded " SYMBOL NAME" line contains it), so a text search
+      only touches the rows that share trigrams with the query.
+    """
+
+    def __init__(self, records):
+        records = sorted({r["symbol"].upper(): r for r in records}.values(), key=lambda r: r["symbol"].upper())
+        symbols = [r["symbol"].upper() for r in records]
+        names = [r.get("name") or symbol for r, symbol in zip(records, symbols)]
+        self._symbols = np.array([symbol.encode("ascii") for symbol in symbols], dtype=bytes)
+        self._names, self._name_starts = self._join(names)
+
+        currency_labels, currency_codes = np.unique([r.get("currency") or "" for r in records], return_inverse=True)
+        market_labels, market_codes = np.unique([r.get("market") or "" for r in records], return_inverse=True)
+        self._currency_labels, self._market_labels = currency_labels.tolist(), market_labels.tolist()
+        self._currencies = currency_codes.astype(np.uint8)
+        self._markets = market_codes.astype(np.uint8)
+
+        # Espacio inicial: un trigrama " XY" marca el comienzo de una palabra
+        self._lines, self._line_starts = self._join(f" {_fold(s)} {_fold(n)}" for s, n in zip(symbols, names))
+        self._build_trigrams()
+
+    @staticmethod
+    def _join(strings):
+        """Joins strings with newlines; returns (text, start offset of each string plus the end)."""
+        strings = list(strings)
+        starts = np.zeros(len(strings) + 1, dtype=np.int64)
+        starts[1:] = np.cumsum([len(s) + 1 for s in strings])
+        return "\n".join(strings), starts
+
+    @staticmethod
+    def _slice(text, starts, row):
+        return text[starts[row]:starts[row + 1] - 1]
+
+    def _build_trigrams(self):
+        n_rows = max(len(self._symbols), 1)
+        codes = _trigram_codes(self._lines) if len(self._lines) >= 3 else np.array([], dtype=np.int32)
+        positions = np.arange(len(codes))
+        rows = np.searchsorted(self._line_starts, positions, side="right") - 1
+        # Fuera los trigramas que cruzan el salto de línea entre dos filas
+        inside = positions + 3 <= self._line_starts[rows + 1] - 1
+        keys = np.sort(codes[inside].astype(np.int64) * n_rows + rows[inside])
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        self._postings = (keys % n_rows).astype(np.int32)
+        self._posting_starts = np.searchsorted(keys // n_rows, np.arange(_ALPHABET ** 3 + 1)).astype(np.int32)
+
+    @classmethod
+    def from_csv(cls, path):
+        """Loads a CSV with the columns symbol, name, currency and market."""
+        with open(path, newline="", encoding="utf-8") as f:
+            return cls(list(csv.DictReader(f)))
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def _record(self, row):
+        return {
+            "symbol": self._symbols[row].decode("ascii"),
+            "name": self._slice(self._names, self._name_starts, row),
+            "currency": self._currency_labels[self._currencies[row]] or None,
+            "market": self._market_labels[self._markets[row]] or None,
+        }
+
+    def _prefix_rows(self, prefix):
+        prefix = prefix.encode("ascii", "ignore")
+        # Claves no más anchas que el array: si no, NumPy copia el array entero para compararlas
+        if not prefix or len(prefix) > self._symbols.itemsize:
+            return range(len(self._symbols)) if not prefix else range(0)
+        start = np.searchsorted(self._symbols, prefix, side="left")
+        end = np.searchsorted(self._symbols, prefix[:-1] + bytes([prefix[-1] + 1]), side="left")
+        return range(start, end)
+
+    def _trigram_counts(self, text):
+        """(number of distinct trigrams of `text`, trigrams each row shares with it)."""
+        codes = np.unique(_trigram_codes(text))
+        postings = [self._postings[self._posting_starts[c]:self._posting_starts[c + 1]] for c in codes]
+        return len(codes), np.bincount(np.concatenate(postings), minlength=len(self))
+
+    def get(self, symbol):
+        """Returns the record of an exact symbol, or None."""
+        symbol = symbol.upper()
+        rows = self._prefix_rows(symbol)
+        if rows and self._symbols[rows.start] == symbol.encode("ascii", "ignore"):
+            return self._record(rows.start)
+        return None
+
+    def prefix(self, prefix, limit=20):
+        """Records whose symbol starts with `prefix`, in symbol order."""
+        return [self._record(row) for row in self._prefix_rows(prefix.upper())[:limit]]
+
+    def search(self, query, limit=20):
+        """
+        Records matching `query` by symbol or name, best matches first:
+        exact symbol and symbol prefix, then symbol or name containing the
+        query, and finally near misses that share at least half of the
+        query's trigrams, most shared first ('santnder' -> 'Banco Santander').
+        Queries of one or two characters only match the start of a word.
+        """
+        query = " ".join(_fold(query).split())
+        if not query or not len(self):
+            return []
+        rows = list(self._prefix_rows(query)[:limit])
+        seen = set(rows)
+
+        # Con menos de tres caracteres solo hay trigrama si se ancla al inicio de palabra
+        text = query if len(query) >= 3 else f" {query}"
+        if len(rows) >= limit or len(text) < 3:
+            return [self._record(row) for row in rows]
+
+        n_codes, counts = self._trigram_counts(text)
+        for row in np.flatnonzero(counts == n_codes).tolist():
+            if row not in seen and text in self._slice(self._lines, self._line_starts, row):
+                seen.add(row)
+                rows.append(row)
+                if len(rows) >= limit:
+                    return [self._record(row) for row in rows]
+
+        # Tolerancia a erratas: filas con al menos la mitad de los trigramas de la consulta
+        candidates = np.flatnonzero(counts >= max(1, -(-n_codes // 2)))
+        candidates = candidates[~np.isin(candidates, rows)]
+        wanted = limit - len(rows)
+        if candidates.size > wanted:
+            candidates = candidates[np.argpartition(-counts[candidates], wanted - 1)[:wanted]]
+        candidates = candidates[np.lexsort((candidates, -counts[candidates]))]
+        rows.extend(candidates.tolist())
+        return [self._record(row) for row in rows]
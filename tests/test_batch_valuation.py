@@ -0,0 +1,40 @@
+from functools import partial
+
+import yfinance
+
+import yahoo_client
+from batch_valuation import run
+from bench.fakes import FakeMarket, FakeSupabase
+from market_data import TickerMetadataCache, fetch_ticker_details
+from price_history import PriceHistoryStore
+
+
+def position_row(row_id, user_id, ticker, lots, realizado=0.0):
+    return {"id": row_id, "user_id": user_id, "ticker": ticker, "realizado": realizado,
+            "precio_compra_currency": "USD", "nombre_personalizado": None, "lotes": lots}
+
+
+def test_users_with_only_closed_positions_keep_their_realized_pnl(tmp_path, monkeypatch):
+    market = FakeMarket(prices={"AAPL": 200.0})
+    monkeypatch.setattr(yfinance, "download", market.download)
+    monkeypatch.setattr(yfinance, "Ticker", market.ticker)
+    monkeypatch.setattr(yahoo_client, "request_quotes", market.quote)
+    lot = {"id": 1, "created_at": "2024-01-02T10:00:00+00:00", "cantidad": 2.0, "precio_compra": 150.0,
+           "precio_compra_currency": "USD", "fecha_compra": None}
+    client = FakeSupabase({"positions": [
+        position_row(1, "open", "AAPL", [lot], realizado=10.0),
+        position_row(2, "closed", "MSFT", [], realizado=50.0),
+    ]})
+
+    report = run(
+        client, workers=1,
+        metadata=TickerMetadataCache(str(tmp_path / "metadata.json"), partial(fetch_ticker_details, default_currency="USD")),
+        history=PriceHistoryStore(str(tmp_path / "prices.db")),
+    )
+
+    summaries = {row["user_id"]: row for row in client.tables["portfolio_summaries"]}
+    assert report["users"] == 2
+    assert summaries["open"]["market_value"] == 400.0
+    assert summaries["open"]["realized"] == 10.0
+    assert summaries["closed"]["realized"] == 50.0
+    assert summaries["closed"]["positions"] == 0
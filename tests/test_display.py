@@ -0,0 +1,27 @@
+import pandas as pd
+
+from display import format_details_table
+from valuation import summarize_portfolio
+
+
+def details(ticker_details):
+    df_lots = pd.DataFrame({
+        "ticker": ["AAPL", "ASML.AS", "UNKNOWN"],
+        "cantidad": [1.0, 2.0, 3.0],
+        "precio_compra": [10.0, 20.0, 30.0],
+        "precio_compra_currency": ["USD", "EUR", "USD"],
+        "nombre_personalizado": [None] * 3,
+    })
+    prices = {"AAPL": 11.0, "ASML.AS": 21.0, "UNKNOWN": 31.0}
+    return summarize_portfolio(df_lots, prices, {"USD": 1.0, "EUR": 1.1}, ticker_details, [], "USD")[2]
+
+
+def test_amounts_without_a_currency_are_not_available():
+    df_display, _ = format_details_table(details({"AAPL": {"currency": "USD"}, "ASML.AS": {"currency": "EUR"}}), {"USD": "$", "EUR": "€"})
+    assert df_display["Precio Actual"].tolist() == ["$11.00", "€21.00", "N/A"]
+
+
+def test_a_column_without_any_currency_is_not_numeric():
+    df_display, column_config = format_details_table(details({}), {"USD": "$", "EUR": "€"})
+    assert df_display["Valor de Mercado"].tolist() == ["N/A"] * 3
+    assert column_config["Valor de Mercado"]["type_config"]["type"] == "text"
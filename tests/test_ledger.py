@@ -0,0 +1,132 @@
+import copy
+
+import pytest
+
+from bench.fakes import FakeSupabase
+from ledger import Position, apply_new_trades, replay, sync_positions
+
+
+def trade(trade_id, ticker, tipo, cantidad, precio, currency="USD"):
+    return {
+        "id": trade_id,
+        "user_id": "u",
+        "created_at": f"2024-01-{trade_id:02d}T10:00:00+00:00",
+        "ticker": ticker,
+        "tipo": tipo,
+        "cantidad": cantidad,
+        "precio_compra": precio,
+        "precio_compra_currency": currency,
+        "nombre_personalizado": None,
+        "fecha_compra": None,
+    }
+
+
+def totals(positions):
+    return {t: (p.cantidad, p.coste, p.realizado) for t, p in positions.items()}
+
+
+@pytest.mark.parametrize("method", ["fifo", "average"])
+def test_sync_matches_a_full_replay(method):
+    ledger = [
+        trade(1, "AAPL", "compra", 2, 150.0),
+        trade(2, "AAPL", "compra", 1, 180.0),
+        trade(3, "ASML.AS", "compra", 3, 600.0, "EUR"),
+        trade(4, "AAPL", "venta", 2, 250.0),
+    ]
+    client = FakeSupabase({"portfolio": copy.deepcopy(ledger), "positions": []})
+
+    positions = sync_positions(client, "u", method)
+
+    expected = {}
+    replay(ledger, expected, method)
+    assert totals(positions) == totals(expected)
+    assert len(client.tables["positions"]) == 2
+
+
+def test_realized_pnl_depends_on_the_method():
+    ledger = [trade(1, "AAPL", "compra", 2, 150.0), trade(2, "AAPL", "compra", 1, 180.0), trade(3, "AAPL", "venta", 2, 250.0)]
+    fifo, average = {}, {}
+    replay(ledger, fifo, "fifo")
+    replay(ledger, average, "average")
+    assert fifo["AAPL"].realizado == pytest.approx(2 * 250 - 2 * 150)
+    assert average["AAPL"].realizado == pytest.approx(2 * 250 - 2 * 160)
+
+
+def test_oversell_is_ignored():
+    positions = {}
+    replay([trade(1, "AAPL", "compra", 1, 100.0), trade(2, "AAPL", "venta", 5, 120.0)], positions)
+    assert positions["AAPL"].cantidad == 1
+    assert positions["AAPL"].ultimo_id == 2
+
+
+def test_sync_recovers_a_position_overwritten_by_a_concurrent_session():
+    client = FakeSupabase({"portfolio": [trade(1, "AAPL", "compra", 10, 100.0)], "positions": []})
+    sync_positions(client, "u")
+
+    # La sesión B registra una compra y pone al día sus posiciones (AAPL hasta el id 2)...
+    client.tables["portfolio"].append(trade(2, "AAPL", "compra", 5, 110.0))
+    sync_positions(client, "u")
+    stale_rows = copy.deepcopy(client.tables["positions"])
+
+    # ...mientras la sesión A vende AAPL y compra MSFT (AAPL hasta el 3, MSFT hasta el 4)...
+    client.tables["portfolio"].append(trade(3, "AAPL", "venta", 8, 130.0))
+    client.tables["portfolio"].append(trade(4, "MSFT", "compra", 2, 300.0))
+    sync_positions(client, "u")
+
+    # ...y B escribe después su copia de AAPL, anterior a la venta
+    client.table("positions").upsert(stale_rows, on_conflict="user_id,ticker").execute()
+    assert {row["ticker"]: row["ultimo_id"] for row in client.tables["positions"]} == {"AAPL": 2, "MSFT": 4}
+
+    positions = sync_positions(client, "u")
+
+    expected = {}
+    replay(client.tables["portfolio"], expected)
+    assert totals(positions) == totals(expected)
+    assert positions["AAPL"].cantidad == 7
+    stored = {row["ticker"]: row for row in client.tables["positions"]}
+    assert stored["AAPL"]["ultimo_id"] == 4
+    assert stored["AAPL"]["cantidad"] == 7
+
+
+def test_an_idle_ticker_does_not_hold_back_the_ledger_reads():
+    ledger = [trade(1, "OLD", "compra", 1, 10.0)] + [trade(i, "AAPL", "compra", 1, 100.0) for i in range(2, 2002)]
+    client = FakeSupabase({"portfolio": ledger, "positions": []})
+    sync_positions(client, "u")
+    assert {row["ticker"]: row["ultimo_id"] for row in client.tables["positions"]} == {"OLD": 2001, "AAPL": 2001}
+
+    read = []
+    table = client.table
+    client.table = lambda name: _counting(table(name), read) if name == "portfolio" else table(name)
+    sync_positions(client, "u")
+    assert read == [0]
+
+    client.tables["portfolio"].append(trade(2002, "AAPL", "venta", 1, 120.0))
+    positions = sync_positions(client, "u")
+    assert read == [0, 1]
+    assert positions["OLD"].ultimo_id == 2002
+
+
+def _counting(query, read):
+    """Wraps a query of the fake client to append the number of rows it returns to `read`."""
+    execute = query.execute
+
+    def counted():
+        response = execute()
+        read.append(len(response.data))
+        return response
+    query.execute = counted
+    return query
+
+
+def test_view_rows_catch_up_with_newer_trades():
+    # Fila de portfolio_positions (modo server): sin lotes, hasta el id 2
+    view_row = {"ticker": "AAPL", "cantidad": 3.0, "coste": 480.0, "realizado": 0.0, "precio_compra_currency": "USD",
+                "metodo": "fifo", "ultimo_id": 2, "created_at": "2024-01-01T10:00:00+00:00", "fecha_compra": "2024-01-01"}
+    ledger = [trade(1, "AAPL", "compra", 2, 150.0), trade(2, "AAPL", "compra", 1, 180.0), trade(3, "AAPL", "venta", 1, 200.0)]
+    client = FakeSupabase({"portfolio": copy.deepcopy(ledger)})
+    positions = {"AAPL": Position.from_row(view_row)}
+
+    assert apply_new_trades(client, "u", positions) == {"AAPL"}
+    assert positions["AAPL"].cantidad == 2
+    # Un único lote al coste medio: la venta se casa a 160
+    assert positions["AAPL"].realizado == pytest.approx(200 - 160)
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from market_data import QuoteService
+
+
+class SavedQuotes:
+    """Snapshot store stand-in with fixed saved quotes."""
+
+    def __init__(self, quotes):
+        self.quotes = quotes
+
+    def load(self, tickers):
+        return {t: self.quotes[t] for t in tickers if t in self.quotes}
+
+    def save(self, prices, fetched_at):
+        pass
+
+
+def test_quotes_say_whether_they_were_served_from_a_last_known_price():
+    release = threading.Event()
+
+    def fetch(tickers):
+        release.wait(5)
+        return {t: 200.0 for t in tickers}
+
+    service = QuoteService(fetch, snapshots=SavedQuotes({"AAPL": (150.0, 1000.0)}))
+    quotes = service.get_quotes(["AAPL"])
+    assert quotes == {"AAPL": (150.0, 1000.0, True)}
+
+    # El refresco en segundo plano termina después: lo servido sigue marcado como antiguo
+    release.set()
+    while service.refreshing(["AAPL"]):
+        time.sleep(0.01)
+    assert quotes["AAPL"][2]
+    assert service.last_known(["AAPL"]) == {}
+    price, _, last_known = service.get_quotes(["AAPL"])["AAPL"]
+    assert (price, last_known) == (200.0, False)
@@ -0,0 +1,116 @@
+"""
+Migrations of supabase/migrations against a throwaway local Postgres.
+
+Needs the `pgserver` package (pip install pgserver), which ships its own
+Postgres binaries; without it these tests are skipped.
+"""
+import glob
+import json
+import os
+
+import pytest
+
+from ledger import Position, replay
+
+pgserver = pytest.importorskip("pgserver")
+
+MIGRATIONS = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(__file__)), "supabase", "migrations", "*.sql")))
+LEDGER_MIGRATION = next(path for path in MIGRATIONS if path.endswith("_ledger.sql"))
+
+PURCHASES = [
+    # (ticker, cantidad, precio_compra, divisa, created_at, fecha_compra)
+    ("AAPL", 2.0, 150.0, "USD", "2023-01-05 10:00:00+00", None),
+    ("AAPL", 1.0, 180.0, "USD", "2024-01-05 10:00:00+00", "2023-12-29"),
+    ("ASML.AS", 3.0, 600.0, "EUR", "2024-03-05 10:00:00+00", None),
+]
+
+
+def run_sql(server, sql):
+    """Runs `sql` stopping at the first error."""
+    return server.psql("\\set ON_ERROR_STOP on\n" + sql)
+
+
+def query(server, sql):
+    """Rows of a select as a list of dicts."""
+    output = run_sql(server, f"\\set QUIET on\n\\pset tuples_only on\n\\pset format unaligned\nselect coalesce(json_agg(t), '[]') from ({sql}) t;")
+    return json.loads(output)
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    server = pgserver.get_server(tmp_path_factory.mktemp("pgdata"))
+    # Compras guardadas antes del libro de movimientos, que la migración del libro pasa a posiciones
+    for path in MIGRATIONS[:MIGRATIONS.index(LEDGER_MIGRATION)]:
+        run_sql(server, open(path).read())
+    values = ", ".join(
+        f"('u', '{ticker}', {cantidad}, {precio}, '{currency}', '{created_at}', " + (f"'{fecha}')" if fecha else "null)")
+        for ticker, cantidad, precio, currency, created_at, fecha in PURCHASES
+    )
+    run_sql(server, f"insert into public.portfolio (user_id, ticker, cantidad, precio_compra, precio_compra_currency, created_at, fecha_compra) values {values};")
+    for path in MIGRATIONS[MIGRATIONS.index(LEDGER_MIGRATION):]:
+        run_sql(server, open(path).read())
+    yield server
+    server.cleanup()
+
+
+def ledger_rows(server):
+    return query(server, "select id, created_at, ticker, tipo, cantidad, precio_compra, precio_compra_currency, nombre_personalizado, fecha_compra from public.portfolio where user_id = 'u' order by id")
+
+
+def store_positions(server, positions):
+    """Upserts positions the way the app does (Position.to_row)."""
+    rows = json.dumps([position.to_row("u") for position in positions.values()], default=str)
+    run_sql(server, f"""
+        insert into public.positions (user_id, ticker, cantidad, coste, realizado, precio_compra_currency, nombre_personalizado, metodo, lotes, ultimo_id)
+        select * from jsonb_to_recordset($j${rows}$j$::jsonb) as r(
+            user_id text, ticker text, cantidad double precision, coste double precision, realizado double precision,
+            precio_compra_currency text, nombre_personalizado text, metodo text, lotes jsonb, ultimo_id bigint
+        )
+        on conflict (user_id, ticker) do update set
+            cantidad = excluded.cantidad, coste = excluded.coste, realizado = excluded.realizado,
+            lotes = excluded.lotes, ultimo_id = excluded.ultimo_id;
+    """)
+
+
+def view_positions(server):
+    rows = query(server, "select * from public.get_portfolio_positions('u')")
+    return {row["ticker"]: Position.from_row(row) for row in rows}
+
+
+def test_migrations_are_idempotent(database):
+    for path in MIGRATIONS:
+        run_sql(database, open(path).read())
+    assert len(query(database, "select * from public.positions")) == 2
+
+
+def test_backfilled_positions_match_a_replay_of_the_ledger(database):
+    expected = {}
+    replay(ledger_rows(database), expected)
+
+    stored = {row["ticker"]: row for row in query(database, "select * from public.positions where user_id = 'u'")}
+    for ticker, position in expected.items():
+        assert stored[ticker]["cantidad"] == pytest.approx(position.cantidad)
+        assert stored[ticker]["coste"] == pytest.approx(position.coste)
+        assert [lot["id"] for lot in stored[ticker]["lotes"]] == [lot["id"] for lot in position.lots]
+        assert stored[ticker]["ultimo_id"] == position.ultimo_id
+
+
+def test_view_gives_one_row_per_position_after_a_sale(database):
+    run_sql(database, """
+        insert into public.portfolio (user_id, ticker, tipo, cantidad, precio_compra, precio_compra_currency, fecha_compra)
+        values ('u', 'AAPL', 'venta', 2, 250, 'USD', '2024-06-03');
+    """)
+    positions = {}
+    replay(ledger_rows(database), positions)
+    store_positions(database, positions)
+
+    summary = view_positions(database)
+    assert set(summary) == {"AAPL", "ASML.AS"}
+    aapl = summary["AAPL"]
+    assert aapl.cantidad == pytest.approx(1.0)
+    assert aapl.coste == pytest.approx(180.0)
+    assert aapl.realizado == pytest.approx(2 * 250 - 2 * 150)
+    # El único lote sintético lleva la fecha del primer lote abierto: la compra de 2024 con fecha_compra
+    assert len(aapl.lots) == 1
+    assert aapl.lots[0]["fecha_compra"] == "2023-12-29"
+    assert query(database, "select lotes_abiertos from public.portfolio_positions where ticker = 'AAPL'") == [{"lotes_abiertos": 1}]
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from price_history import BAR_FIELDS, PriceHistoryStore
+
+
+def fake_download(calls):
+    def download(tickers, start=None, interval="1d", progress=False):
+        calls.append((sorted(tickers), pd.Timestamp(start).normalize()))
+        index = pd.date_range(pd.Timestamp(start).normalize(), periods=3, freq="D")
+        columns = pd.MultiIndex.from_product([BAR_FIELDS, list(tickers)])
+        return pd.DataFrame(1.0, index=index, columns=columns)
+    return download
+
+
+def test_a_stale_ticker_does_not_drag_the_others_back(tmp_path):
+    calls = []
+    store = PriceHistoryStore(str(tmp_path / "prices.db"), download=fake_download(calls))
+    store.append(fake_download([])(["AAPL", "MSFT"], start="2024-06-01"), ["AAPL", "MSFT"])
+    store.append(fake_download([])(["OLD"], start="2023-01-01"), ["OLD"])
+
+    store.refresh(["AAPL", "MSFT", "OLD", "NEW"])
+
+    assert (["AAPL", "MSFT"], pd.Timestamp("2024-06-03")) in calls
+    assert (["OLD"], pd.Timestamp("2023-01-03")) in calls
+    assert len(calls) == 3
+    assert store.last_timestamps(["AAPL", "OLD", "NEW"]).keys() == {"AAPL", "OLD", "NEW"}
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from valuation import summarize_portfolio, summarize_users
+
+
+@pytest.mark.parametrize("lot_rates", [None, np.array([np.nan, 1.2, np.nan, 1.05, np.nan])])
+def test_user_totals_match_the_dashboard_summary(lot_rates):
+    df_lots = pd.DataFrame({
+        "user_id": ["u"] * 5,
+        "ticker": ["AAPL", "ASML.AS", "AAPL", "DELISTED", "ZERO"],
+        "cantidad": [2.0, 3.0, 1.0, 4.0, 5.0],
+        "precio_compra": [150.0, 600.0, 180.0, 10.0, 1.0],
+        "precio_compra_currency": ["USD", "EUR", "USD", "EUR", "USD"],
+        "nombre_personalizado": [None] * 5,
+    })
+    # Sin precio y con precio 0 cuentan igual: ni valor de mercado ni posición valorada
+    prices = {"AAPL": 200.0, "ASML.AS": 700.0, "DELISTED": None, "ZERO": 0.0}
+    details = {"AAPL": {"currency": "USD"}, "ASML.AS": {"currency": "EUR"}, "DELISTED": {"currency": "EUR"}, "ZERO": {"currency": "USD"}}
+    rates = {"USD": 1.0, "EUR": 1.1}
+
+    invested, market_value, df_details, _, _ = summarize_portfolio(df_lots, prices, rates, details, [], "USD", lot_rates=lot_rates)
+    users = summarize_users(df_lots, prices, rates, details, "USD", lot_rates=lot_rates)
+
+    assert users.loc["u", "invested"] == pytest.approx(invested)
+    assert users.loc["u", "market_value"] == pytest.approx(market_value)
+    assert users.loc["u", "positions"] == len(df_details)
+    assert users.loc["u", "unpriced_positions"] == (df_details["Valor de Mercado (USD)"] == 0).sum() == 2
+
+
+def test_a_currency_without_any_price_keeps_none():
+    df_lots = pd.DataFrame({
+        "ticker": ["DELISTED"], "cantidad": [1.0], "precio_compra": [10.0],
+        "precio_compra_currency": ["EUR"], "nombre_personalizado": [None],
+    })
+    _, _, df_details, _, _ = summarize_portfolio(df_lots, {"DELISTED": None}, {"EUR": 1.1}, {"DELISTED": {"currency": "EUR"}}, [], "USD")
+    assert df_details["Precio Actual (EUR)"].tolist() == [None]
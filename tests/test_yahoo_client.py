@@ -0,0 +1,40 @@
+import pytest
+
+from yahoo_client import CircuitOpenError, YahooClient
+
+
+def failing():
+    raise ConnectionError("Yahoo Finance caído")
+
+
+def test_a_failed_quote_trial_opens_the_breaker_again(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("yahoo_client.time.monotonic", lambda: clock[0])
+    client = YahooClient(max_retries=0, breaker_threshold=1, breaker_cooldown=60)
+    with pytest.raises(ConnectionError):
+        client._request("download", failing)
+    assert client.breaker.state == "open"
+
+    # La petición de prueba es una cotización, cuyos fallos no abren el circuito por sí solos
+    clock[0] += 60
+    with pytest.raises(ConnectionError):
+        client._request("quote", failing, retries=0, trips_breaker=False)
+    assert client.breaker.state == "open"
+
+    # Pasada otra espera, Yahoo vuelve a responder y el circuito se cierra
+    clock[0] += 60
+    assert client._request("download", lambda: "ok") == "ok"
+    assert client.breaker.state == "closed"
+
+
+def test_quote_failures_alone_do_not_open_the_breaker():
+    client = YahooClient(max_retries=0, breaker_threshold=1)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            client._request("quote", failing, retries=0, trips_breaker=False)
+    assert client.breaker.state == "closed"
+
+    with pytest.raises(ConnectionError):
+        client._request("download", failing)
+    with pytest.raises(CircuitOpenError):
+        client._request("download", failing)
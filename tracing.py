@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+
+
+logger = logging.getLogger("portfolio.tracing")
+
+# Un único contexto vacío reutilizable: con el trazado apagado, span() no crea nada
+_NULL_SPAN = nullcontext()
+
+
+# -----------------------------------------------
+# RERUN TRACES
+# -----------------------------------------------
+class Trace:
+    """Durations of the named stages of one script run."""
+
+    enabled = True
+
+    def __init__(self, tracer):
+        self._tracer = tracer
+        self._started = time.perf_counter()
+        self._finished = False
+        self.spans = []
+
+    @contextmanager
+    def span(self, name):
+        """Times the body of the `with` block under `name`; ignored once the trace is finished."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Los fragmentos que se vuelven a ejecutar solos no alargan una traza ya cerrada
+            if not self._finished:
+                self.spans.append((name, time.perf_counter() - start))
+
+    def finish(self):
+        """Adds the whole run as the 'rerun' span and hands the trace to its tracer."""
+        self.spans.append(("rerun", time.perf_counter() - self._started))
+        self._finished = True
+        self._tracer.record(self)
+        return self.spans
+
+
+class NullTrace:
+    """Stand-in used when tracing is off; every call is a no-op."""
+
+    enabled = False
+    spans = []
+
+    def span(self, name):
+        return _NULL_SPAN
+
+    def finish(self):
+        return []
+
+
+NULL_TRACE = NullTrace()
+
+
+class Tracer:
+    """
+    Process-wide collector of rerun traces.
+
+    Keeps the last `window` durations of every stage for rolling p50/p95,
+    plus lifetime sums and counts for the Prometheus export. Each finished
+    trace is also logged as one JSON line and, when `textfile` is set,
+    written out in the Prometheus text format for the node_exporter
+    textfile collector, together with the text of every `collectors`
+    callable (other process-wide metrics, such as the Yahoo Finance client's).
+    """
+
+    def __init__(self, window=200, textfile=None, collectors=()):
+        self.textfile = textfile
+        self.collectors = list(collectors)
+        self._lock = threading.Lock()
+        self._recent = defaultdict(lambda: deque(maxlen=window))
+        self._sums = defaultdict(float)
+        self._counts = defaultdict(int)
+
+    def trace(self, enabled=True):
+        """Starts the trace of a script run, or returns NULL_TRACE when disabled."""
+        return Trace(self) if enabled else NULL_TRACE
+
+    def record(self, trace):
+        with self._lock:
+            for name, seconds in trace.spans:
+                self._recent[name].append(seconds)
+                self._sums[name] += seconds
+                self._counts[name] += 1
+        logger.info(json.dumps({"event": "rerun_timing", "spans_ms": {name: round(s * 1000, 2) for name, s in trace.spans}}))
+        if self.textfile:
+            self._write_textfile()
+
+    def percentiles(self):
+        """Returns {stage: {"p50": s, "p95": s, "count": n}} over the rolling window."""
+        # Import diferido: tracing se carga también en la página de inicio de sesión
+        import numpy as np
+
+        with self._lock:
+            recent = {name: np.array(values) for name, values in self._recent.items()}
+        return {
+            name: {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)), "count": len(values)}
+            for name, values in recent.items()
+        }
+
+    def prometheus_text(self):
+        """Stage durations as a Prometheus summary in the text exposition format."""
+        percentiles = self.percentiles()
+        with self._lock:
+            sums, counts = dict(self._sums), dict(self._counts)
+        lines = [
+            "# HELP portfolio_stage_duration_seconds Duration of each stage of a dashboard rerun.",
+            "# TYPE portfolio_stage_duration_seconds summary",
+        ]
+        for name in sorted(percentiles):
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95")):
+                lines.append(f'portfolio_stage_duration_seconds{{stage="{name}",quantile="{quantile}"}} {percentiles[name][key]:.6f}')
+            lines.append(f'portfolio_stage_duration_seconds_sum{{stage="{name}"}} {sums[name]:.6f}')
+            lines.append(f'portfolio_stage_duration_seconds_count{{stage="{name}"}} {counts[name]}')
+        return "\n".join(lines) + "\n" + "".join(collector() for collector in self.collectors)
+
+    def _write_textfile(self):
+        # Escritura atómica: el collector nunca lee un archivo a medias
+        directory = os.path.dirname(os.path.abspath(self.textfile))
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(f.name, self.textfile)
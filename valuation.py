@@ -0,0 +1,361 @@
+import numpy as np
+import pandas as pd
+
+from ledger import replay
+
+
+# -----------------------------------------------
+# PORTFOLIO VALUATION
+# -----------------------------------------------
+def _detail_columns(compra_currency, stock_currency, base_currency):
+    """Column names of one asset row, in the order the details table shows them."""
+    return [
+        "Ticker",
+        "Nombre",
+        "Cantidad",
+        "Divisa de Compra",
+        "Divisa de Activo",
+        f"Precio de Compra Promedio ({compra_currency})",
+        f"Precio Actual ({stock_currency})",
+        f"Valor de Mercado ({base_currency})",
+        f"Valor de Mercado Original ({stock_currency})",
+        f"Rentabilidad ({stock_currency})",
+        "Rentabilidad (%)",
+        f"Inversión Inicial ({base_currency})",
+        f"Inversión Inicial Original ({compra_currency})",
+        "Tipo",
+    ]
+
+
+def _per_currency_column(values, labels, label):
+    """Keeps `values` only on the rows whose currency label matches, NaN elsewhere."""
+    return np.where(labels == label, values, np.nan)
+
+
+def _lot_rates_to_base(df_portfolio, rates, lot_rates):
+    """Rate of every lot: its rate on the purchase date, or today's rate where that is unknown."""
+    current = df_portfolio['precio_compra_currency'].map(lambda c: rates.get(c, 1.0)).to_numpy(dtype=float)
+    return np.where(np.isnan(lot_rates), current, lot_rates)
+
+
+def _value_positions(cantidad_total, total_cost, current_price, rate_compra_to_base, rate_stock_to_base, invested_base=None):
+    """
+    Valuation rules shared by summarize_portfolio and summarize_users, given
+    the quantity, cost and price of every position: the average purchase
+    price, the cost at the rate of the purchase currency (unless
+    `invested_base` already holds it at each lot's own rate) and no market
+    value for a position without a price (missing or zero). Returns a dict
+    of arrays with one value per position.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precio_compra_promedio = np.where(cantidad_total > 0, total_cost / cantidad_total, 0)
+    invested_original = cantidad_total * precio_compra_promedio
+    if invested_base is None:
+        invested_base = invested_original * rate_compra_to_base
+    has_price = ~(np.isnan(current_price) | (current_price == 0))
+    market_value_original = np.where(has_price, cantidad_total * current_price, 0.0)
+    return {
+        'precio_compra_promedio': precio_compra_promedio,
+        'invested_original': invested_original,
+        'invested_base': invested_base,
+        'has_price': has_price,
+        'market_value_original': market_value_original,
+        'market_value_base': np.where(has_price, market_value_original * rate_stock_to_base, 0.0),
+    }
+
+
+def summarize_portfolio(df_portfolio, prices, rates, ticker_details, crypto_tickers, base_currency, lot_rates=None):
+    """
+    Aggregates purchase lots into one row per ticker and values them in base_currency.
+
+    Lots are grouped with one stable sort and reduced per contiguous slice, so
+    the cost grows linearly with the number of lots. With `lot_rates` (see
+    lot_fx_rates) every lot's cost is converted at its own rate instead of
+    today's. Returns (total_invested_base, total_market_value_base,
+    df_details, df_acciones, df_cryptos).
+    """
+    if df_portfolio.empty:
+        return 0.0, 0.0, pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    # Agrupa los lotes por ticker con una única ordenación estable. Cada suma
+    # se hace sobre un tramo contiguo, que reproduce exactamente el resultado
+    # de sumar las compras de cada ticker por separado.
+    codes, uniques = pd.factorize(df_portfolio['ticker'], sort=False)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(uniques)))))
+    spans = list(zip(bounds[:-1], bounds[1:]))
+
+    cantidad = df_portfolio['cantidad'].to_numpy()[order]
+    coste = (df_portfolio['cantidad'] * df_portfolio['precio_compra']).to_numpy()[order]
+    cantidad_total = np.array([cantidad[start:end].sum() for start, end in spans])
+    total_cost = np.array([coste[start:end].sum() for start, end in spans])
+
+    # La divisa y el nombre de cada activo se toman de su primera compra
+    first_lots = df_portfolio.iloc[order[bounds[:-1]]]
+    tickers = list(uniques)
+
+    compra_currency = first_lots['precio_compra_currency'].tolist()
+    stock_currency = [ticker_details.get(t, {}).get('currency') for t in tickers]
+    nombre = [
+        custom or ticker_details.get(t, {}).get('name')
+        for t, custom in zip(tickers, first_lots['nombre_personalizado'].tolist())
+    ]
+
+    current_price = np.array([prices.get(t) for t in tickers], dtype=float)
+    rate_compra_to_base = np.array([rates.get(c, 1.0) for c in compra_currency], dtype=float)
+    rate_stock_to_base = np.array([rates.get(c, 1.0) for c in stock_currency], dtype=float)
+
+    invested_base = None
+    if lot_rates is not None:
+        coste_base = coste * _lot_rates_to_base(df_portfolio, rates, lot_rates)[order]
+        invested_base = np.array([coste_base[start:end].sum() for start, end in spans])
+
+    valued = _value_positions(cantidad_total, total_cost, current_price, rate_compra_to_base, rate_stock_to_base, invested_base)
+    precio_compra_promedio = valued['precio_compra_promedio']
+    invested_original, invested_base = valued['invested_original'], valued['invested_base']
+    market_value_original, market_value_base = valued['market_value_original'], valued['market_value_base']
+    has_return = valued['has_price'] & (invested_original != 0)
+    rentabilidad_valor_original = np.where(has_return, market_value_original - invested_original, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rentabilidad_porcentaje = np.where(
+            has_return, (market_value_original - invested_original) / invested_original * 100, 0.0
+        )
+
+    # Las columnas con divisa en el nombre aparecen en el orden en que las
+    # introduce cada activo, igual que al construir el DataFrame fila a fila.
+    columns = {}
+    for compra, stock in zip(compra_currency, stock_currency):
+        for column in _detail_columns(compra, stock, base_currency):
+            columns.setdefault(column)
+
+    compra_labels = np.array([f"{c}" for c in compra_currency], dtype=object)
+    stock_labels = np.array([f"{c}" for c in stock_currency], dtype=object)
+    data = {
+        "Ticker": tickers,
+        "Nombre": nombre,
+        "Cantidad": cantidad_total,
+        "Divisa de Compra": compra_currency,
+        "Divisa de Activo": stock_currency,
+        f"Valor de Mercado ({base_currency})": market_value_base,
+        "Rentabilidad (%)": rentabilidad_porcentaje,
+        f"Inversión Inicial ({base_currency})": invested_base,
+        "Tipo": np.where(np.isin(tickers, list(crypto_tickers)), "Criptoactivo", "Acción"),
+    }
+    for label in dict.fromkeys(compra_labels):
+        data[f"Precio de Compra Promedio ({label})"] = _per_currency_column(precio_compra_promedio, compra_labels, label)
+        data[f"Inversión Inicial Original ({label})"] = _per_currency_column(invested_original, compra_labels, label)
+    # El precio tal y como llega, None si no hay cotización: una columna en la que ningún
+    # activo tiene precio se queda con None, como al construir el DataFrame fila a fila
+    quoted_price = np.array([prices.get(t) for t in tickers], dtype=object)
+    for label in dict.fromkeys(stock_labels):
+        data[f"Precio Actual ({label})"] = np.where(stock_labels == label, quoted_price, np.nan).tolist()
+        data[f"Valor de Mercado Original ({label})"] = _per_currency_column(market_value_original, stock_labels, label)
+        data[f"Rentabilidad ({label})"] = _per_currency_column(rentabilidad_valor_original, stock_labels, label)
+
+    df_details = pd.DataFrame({column: data[column] for column in columns})
+
+    # Suma secuencial, en el mismo orden que la tabla de detalles
+    total_invested_base = sum(invested_base.tolist(), 0.0)
+    total_market_value_base = sum(market_value_base.tolist(), 0.0)
+
+    numeric_cols = [
+        f'Valor de Mercado ({base_currency})',
+        'Rentabilidad (%)',
+        f'Inversión Inicial ({base_currency})'
+    ]
+    for col in numeric_cols:
+        if col in df_details.columns:
+            df_details[col] = pd.to_numeric(df_details[col], errors='coerce')
+
+    df_acciones = df_details[df_details['Tipo'] == 'Acción'].copy()
+    df_cryptos = df_details[df_details['Tipo'] == 'Criptoactivo'].copy()
+
+    total_market_value_from_df = df_details[f'Valor de Mercado ({base_currency})'].sum()
+    if total_market_value_from_df > 0:
+        df_details['Peso en el Portfolio (%)'] = (df_details[f'Valor de Mercado ({base_currency})'] / total_market_value_from_df) * 100
+    else:
+        df_details['Peso en el Portfolio (%)'] = 0.0
+
+    if not df_acciones.empty:
+        total_market_value_acciones = df_acciones[f'Valor de Mercado ({base_currency})'].sum()
+        if total_market_value_acciones > 0:
+            df_acciones['Peso en el Portfolio (%)'] = (df_acciones[f'Valor de Mercado ({base_currency})'] / total_market_value_acciones) * 100
+        else:
+            df_acciones['Peso en el Portfolio (%)'] = 0.0
+
+    if not df_cryptos.empty:
+        total_market_value_cryptos = df_cryptos[f'Valor de Mercado ({base_currency})'].sum()
+        if total_market_value_cryptos > 0:
+            df_cryptos['Peso en el Portfolio (%)'] = (df_cryptos[f'Valor de Mercado ({base_currency})'] / total_market_value_cryptos) * 100
+        else:
+            df_cryptos['Peso en el Portfolio (%)'] = 0.0
+
+    return total_invested_base, total_market_value_base, df_details, df_acciones, df_cryptos
+
+
+def summarize_users(df_lots, prices, rates, ticker_details, base_currency, lot_rates=None):
+    """
+    Totals of summarize_portfolio for every user in `df_lots` at once.
+
+    Lots are grouped by (user, ticker) with one factorization and valued with
+    the same rules (_value_positions, with the currency of the first lot),
+    but without building a details table per user. Returns a frame indexed by user_id with invested and market_value in
+    base_currency, positions and unpriced_positions.
+    """
+    columns = ['invested', 'market_value', 'positions', 'unpriced_positions']
+    if df_lots.empty:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='user_id'))
+
+    user_codes, users = pd.factorize(df_lots['user_id'], sort=False)
+    ticker_codes, tickers = pd.factorize(df_lots['ticker'], sort=False)
+    # Cada posición es un par (usuario, ticker), numerado en orden de aparición como en summarize_portfolio
+    codes, pairs = pd.factorize(user_codes.astype(np.int64) * len(tickers) + ticker_codes, sort=False)
+    pair_user, pair_ticker = pairs // len(tickers), pairs % len(tickers)
+    _, first_lot = np.unique(codes, return_index=True)
+
+    cantidad = df_lots['cantidad'].to_numpy(dtype=float)
+    cantidad_total = np.bincount(codes, weights=cantidad, minlength=len(pairs))
+    total_cost = np.bincount(codes, weights=cantidad * df_lots['precio_compra'].to_numpy(dtype=float), minlength=len(pairs))
+
+    compra_currency = df_lots['precio_compra_currency'].to_numpy()[first_lot]
+    rate_compra_to_base = np.array([rates.get(c, 1.0) for c in compra_currency], dtype=float)
+    ticker_price = np.array([prices.get(t) for t in tickers], dtype=float)
+    ticker_rate = np.array([rates.get(ticker_details.get(t, {}).get('currency'), 1.0) for t in tickers], dtype=float)
+
+    invested_base = None
+    if lot_rates is not None:
+        coste_base = cantidad * df_lots['precio_compra'].to_numpy(dtype=float) * _lot_rates_to_base(df_lots, rates, lot_rates)
+        invested_base = np.bincount(codes, weights=coste_base, minlength=len(pairs))
+    valued = _value_positions(
+        cantidad_total, total_cost, ticker_price[pair_ticker], rate_compra_to_base, ticker_rate[pair_ticker], invested_base
+    )
+
+    return pd.DataFrame({
+        'invested': np.bincount(pair_user, weights=valued['invested_base'], minlength=len(users)),
+        'market_value': np.bincount(pair_user, weights=valued['market_value_base'], minlength=len(users)),
+        'positions': np.bincount(pair_user, minlength=len(users)),
+        'unpriced_positions': np.bincount(pair_user, weights=~valued['has_price'], minlength=len(users)).astype(int),
+    }, index=pd.Index(users, name='user_id'))
+
+
+# -----------------------------------------------
+# VALUE OVER TIME
+# -----------------------------------------------
+def purchase_dates(df_portfolio):
+    """
+    Purchase day of every lot as naive dates: its fecha_compra when set, else
+    the UTC day of created_at (NaT when neither is known).
+    """
+    dates = pd.Series(pd.NaT, index=df_portfolio.index, dtype='datetime64[ns]')
+    if 'created_at' in df_portfolio.columns:
+        created = pd.to_datetime(df_portfolio['created_at'], utc=True, errors='coerce')
+        dates = created.dt.tz_convert(None).dt.normalize().astype('datetime64[ns]')
+    if 'fecha_compra' in df_portfolio.columns:
+        traded = pd.to_datetime(df_portfolio['fecha_compra'], errors='coerce').astype('datetime64[ns]')
+        dates = traded.fillna(dates)
+    return dates
+
+
+def lot_fx_rates(df_portfolio, fx_to_base):
+    """
+    Value in the base currency of one unit of every lot's purchase currency on
+    its purchase date, as an array aligned with the rows of df_portfolio.
+
+    `fx_to_base` is a dates x currencies frame of daily rates. All lots are
+    joined to it in one merge_asof by currency, taking the last rate on or
+    before the purchase date (the first one for lots older than the series),
+    so the cost is O(lots log dates). NaN for lots without a date or whose
+    currency has no series.
+    """
+    lot_rates = np.full(len(df_portfolio), np.nan)
+    if df_portfolio.empty or fx_to_base.empty:
+        return lot_rates
+
+    series = fx_to_base.rename_axis(index='fecha', columns='currency').stack().dropna()
+    # Las mismas dtypes a ambos lados: merge_asof no compara claves de tipos distintos
+    series = series.rename('rate').reset_index().astype({'fecha': 'datetime64[ns]', 'currency': 'str'})
+    series = series.sort_values('fecha', kind='stable')
+    lots = pd.DataFrame({
+        'fecha': purchase_dates(df_portfolio).to_numpy(),
+        'currency': df_portfolio['precio_compra_currency'].to_numpy(),
+        'row': np.arange(len(df_portfolio)),
+    }).astype({'fecha': 'datetime64[ns]', 'currency': 'str'})
+    lots = lots[lots['fecha'].notna()].sort_values('fecha', kind='stable')
+
+    for direction in ('backward', 'forward'):
+        pending = lots[np.isnan(lot_rates[lots['row'].to_numpy()])]
+        if pending.empty:
+            break
+        matched = pd.merge_asof(pending, series, on='fecha', by='currency', direction=direction)
+        lot_rates[matched['row'].to_numpy()] = matched['rate'].to_numpy(dtype=float)
+    return lot_rates
+
+
+def portfolio_value_history(df_portfolio, closes, fx_to_base, ticker_currencies, method="fifo"):
+    """
+    Daily market value, invested capital and P&L of the portfolio since its first purchase.
+
+    `df_portfolio` holds the ledger rows (buys, and sells when it has a
+    `tipo` column), `closes` is a dates x tickers frame of prices in each
+    ticker's currency and `fx_to_base` a dates x currencies frame with the
+    value of one unit in the base currency. Trades are scattered into a dates
+    x tickers matrix of position changes whose cumulative sum gives the
+    holdings on every date, so the whole history is valued in a handful of
+    NumPy operations. A sell takes out of the invested capital the cost of the
+    lots it closes (matched with `method`, see ledger.replay), each at the rate
+    of its own purchase date.
+    """
+    columns = ["Valor de Mercado", "Capital Invertido", "Rentabilidad"]
+    sold = (df_portfolio['tipo'] == 'venta').to_numpy() if 'tipo' in df_portfolio.columns else np.zeros(len(df_portfolio), bool)
+    cantidad = df_portfolio['cantidad'].to_numpy(dtype=float)
+    precio = df_portfolio['precio_compra'].to_numpy(dtype=float)
+
+    # Coste en la divisa base que entra con cada compra y sale con cada venta.
+    # El mismo tipo de cambio del día de compra que usa el resumen (lot_fx_rates).
+    fx_at_purchase = lot_fx_rates(df_portfolio, fx_to_base)
+    cost_change = np.where(sold, 0.0, np.nan_to_num(cantidad * precio * fx_at_purchase))
+    if sold.any():
+        matches = []
+        replay(df_portfolio.to_dict('records'), method=method, matches=matches)
+        if matches:
+            sale_ids, lot_ids, closed = (np.array(values) for values in zip(*matches))
+            ids = pd.Index(df_portfolio['id'])
+            sale_rows, lot_rows = ids.get_indexer(sale_ids), ids.get_indexer(lot_ids)
+            np.subtract.at(cost_change, sale_rows, np.nan_to_num(closed * precio[lot_rows] * fx_at_purchase[lot_rows]))
+
+    traded_on = purchase_dates(df_portfolio)
+    eligible = (traded_on.notna() & df_portfolio['ticker'].isin(closes.columns)).to_numpy()
+    lots = df_portfolio[eligible]
+    if lots.empty or closes.empty:
+        return pd.DataFrame(columns=columns, dtype=float)
+    traded_on = traded_on[eligible]
+
+    closes = closes.sort_index()
+    closes = closes[closes.index >= traded_on.min()]
+    if closes.empty:
+        return pd.DataFrame(columns=columns, dtype=float)
+    dates = closes.index
+    tickers = list(dict.fromkeys(lots['ticker']))
+    fx = fx_to_base.reindex(fx_to_base.index.union(dates)).sort_index().ffill().bfill().reindex(dates)
+
+    n_dates, n_tickers = len(dates), len(tickers)
+    row = np.searchsorted(dates.to_numpy(), traded_on.to_numpy(), side='left')
+    col = pd.Index(tickers).get_indexer(lots['ticker'])
+
+    # Cambios de posición por fecha; la fila extra recoge movimientos posteriores al último cierre
+    position_changes = np.zeros((n_dates + 1, n_tickers))
+    np.add.at(position_changes, (row, col), np.where(sold, -cantidad, cantidad)[eligible])
+    holdings = np.cumsum(position_changes, axis=0)[:n_dates]
+
+    invested_changes = np.zeros(n_dates + 1)
+    np.add.at(invested_changes, row, cost_change[eligible])
+    invested = np.cumsum(invested_changes)[:n_dates]
+
+    prices = closes.reindex(columns=tickers).ffill().to_numpy()
+    ticker_fx = fx.reindex(columns=[ticker_currencies.get(t) for t in tickers]).to_numpy()
+    market_value = np.nansum(holdings * prices * ticker_fx, axis=1)
+
+    return pd.DataFrame(
+        {"Valor de Mercado": market_value, "Capital Invertido": invested, "Rentabilidad": market_value - invested},
+        index=dates,
+    )
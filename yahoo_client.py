@@ -0,0 +1,383 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import yfinance as yf
+
+
+logger = logging.getLogger("portfolio.yahoo_client")
+
+# -----------------------------------------------
+# CONFIGURATION
+# -----------------------------------------------
+CHUNK_SIZE = int(os.environ.get("YF_CHUNK_SIZE", "100"))
+MAX_CONCURRENCY = int(os.environ.get("YF_MAX_CONCURRENCY", "8"))
+REQUESTS_PER_SECOND = float(os.environ.get("YF_REQUESTS_PER_SECOND", "20"))
+MAX_RETRIES = int(os.environ.get("YF_MAX_RETRIES", "3"))
+BREAKER_THRESHOLD = int(os.environ.get("YF_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("YF_BREAKER_COOLDOWN_SECONDS", "60"))
+
+QUOTE_URL = "https://query1.finance.yahoo.com/v7/finance/quote"
+QUOTE_FIELDS = "regularMarketPrice,regularMarketTime"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling Yahoo while the circuit breaker is open."""
+
+
+class EmptyResponse(RuntimeError):
+    """A download of several tickers that returned no data for any of them (typical of throttling)."""
+
+
+# -----------------------------------------------
+# RATE LIMITING AND CIRCUIT BREAKER
+# -----------------------------------------------
+class RateLimiter:
+    """Token bucket: at most `rate` requests per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        """Blocks until a request may go out."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Se reserva el token aunque falte tiempo: quien llega después espera detrás
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed requests and rejects every
+    request for `cooldown` seconds. Then one trial request is let through
+    (half-open): if it succeeds the circuit closes, if not it opens again.
+    """
+
+    def __init__(self, threshold=5, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        """
+        Raises CircuitOpenError unless a request may go out now. Returns True
+        when that request is the half-open trial: its outcome must then be
+        recorded, whatever kind of request it is.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at >= self.cooldown and not self._trial:
+                self._trial = True
+                return True
+        raise CircuitOpenError("Yahoo Finance no responde: circuito abierto")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self._opened_at is None and self._failures >= self.threshold):
+                if self._opened_at is None:
+                    logger.warning("Circuito de Yahoo Finance abierto tras %d fallos seguidos", self._failures)
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+# -----------------------------------------------
+# FETCH CLIENT
+# -----------------------------------------------
+class YahooClient:
+    """
+    Single entry point for every Yahoo Finance request of the process.
+
+    download() splits the tickers into chunks of at most `chunk_size` and runs
+    them in parallel. Every request, whoever sends it, takes one of
+    `max_concurrency` global slots and a token of the rate limiter, and is
+    retried up to `max_retries` times with jittered exponential backoff. A
+    chunk that still fails is split in two and each half is retried on its
+    own, so one bad ticker only loses itself. Failed requests feed a circuit
+    breaker; while it is open calls fail at once with CircuitOpenError and
+    the callers keep serving their cached data.
+
+    Latency, errors, retries and rejections are counted per operation for
+    stats() and prometheus_text().
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, max_concurrency=MAX_CONCURRENCY, rate=REQUESTS_PER_SECOND,
+                 max_retries=MAX_RETRIES, backoff=0.5, max_backoff=8.0,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN_SECONDS, window=200):
+        self.chunk_size = max(1, chunk_size)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = RateLimiter(rate, burst=max_concurrency)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="yahoo")
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._sums = defaultdict(float)
+        self._counts = defaultdict(lambda: {"requests": 0, "errors": 0, "retries": 0, "rejected": 0, "split": 0})
+
+    # -- Requests ------------------------------------------------------------
+    def _request(self, operation, call, retries=None, trips_breaker=True):
+        """
+        One request with retries, under the breaker, the rate limiter and a
+        concurrency slot. With trips_breaker=False its failures do not count
+        towards opening the breaker (its successes still close it), unless it
+        was the half-open trial, which opens it again.
+        """
+        retries = self.max_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                trial = self.breaker.allow()
+            except CircuitOpenError:
+                self._count(operation, "rejected")
+                raise
+            self.limiter.acquire()
+            with self._slots:
+                started = time.perf_counter()
+                try:
+                    result = call()
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+                elapsed = time.perf_counter() - started
+            self._record(operation, elapsed, error is None)
+            if error is None:
+                self.breaker.record_success()
+                return result
+            if trips_breaker or trial:
+                self.breaker.record_failure()
+            if attempt == retries:
+                raise error
+            self._count(operation, "retries")
+            # Backoff con jitter completo: los reintentos de varios hilos no llegan a la vez
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def _download_chunk(self, tickers, kwargs, part=False, bisect=True):
+        """
+        Frame of one chunk as (frame or None, error or None), bisecting it on failure.
+
+        The parts of a bisected chunk go out once, without retries and without
+        tripping the breaker: the chunk itself already did both. When a whole
+        half fails, the other half is tried once without bisecting it, and if
+        it fails too the failure is taken as an outage rather than a bad
+        ticker, so an outage costs a few requests per level instead of one
+        per ticker.
+        """
+        def call():
+            data = yf.download(tickers, **kwargs)
+            if len(tickers) > 1 and (data is None or not data.notna().to_numpy().any()):
+                raise EmptyResponse(f"Sin datos para ninguno de {len(tickers)} tickers")
+            return data
+
+        try:
+            data = self._request("download", call, retries=0 if part else None, trips_breaker=not part)
+            return _multi_index(data, tickers), None
+        except CircuitOpenError as e:
+            return None, e
+        except Exception as e:
+            error = e
+        if len(tickers) == 1 or not bisect:
+            if len(tickers) == 1:
+                logger.warning("No se pudo descargar %s: %s", tickers[0], error)
+            return None, error
+
+        self._count("download", "split")
+        middle = len(tickers) // 2
+        first, first_error = self._download_chunk(tickers[:middle], kwargs, part=True)
+        second, second_error = self._download_chunk(tickers[middle:], kwargs, part=True, bisect=first is not None)
+        frames = [frame for frame in (first, second) if frame is not None]
+        return (pd.concat(frames, axis=1) if frames else None), second_error or first_error
+
+    def download(self, tickers, **kwargs):
+        """
+        Same as yf.download(tickers, **kwargs), chunked and rate limited.
+
+        The frame always has (Price, Ticker) columns. Tickers whose requests
+        failed are missing from it; if every request failed, the last error
+        is raised instead (CircuitOpenError when the breaker is open).
+        """
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return pd.DataFrame()
+        kwargs.setdefault("progress", False)
+        chunks = [tickers[i:i + self.chunk_size] for i in range(0, len(tickers), self.chunk_size)]
+        if len(chunks) == 1:
+            results = [self._download_chunk(chunks[0], kwargs)]
+        else:
+            results = list(self._pool.map(lambda chunk: self._download_chunk(chunk, kwargs), chunks))
+
+        frames = [frame for frame, _ in results if frame is not None]
+        errors = [error for _, error in results if error is not None]
+        if not frames:
+            if errors:
+                raise errors[-1]
+            return pd.DataFrame()
+        return frames[0] if len(frames) == 1 else pd.concat(frames, axis=1)
+
+    def quotes(self, symbols):
+        """
+        {symbol: last price} from Yahoo's batch quote endpoint: one request per
+        chunk of symbols, returning a couple of fields per symbol instead of a
+        day of bars. Symbols Yahoo does not quote are left out; if every
+        request failed, the last error is raised instead.
+
+        Quote requests are not retried and do not trip the breaker: callers
+        fall back to bar downloads (see market_data.fetch_quotes), which
+        already retry and would find a real outage.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+        chunks = [symbols[i:i + self.chunk_size] for i in range(0, len(symbols), self.chunk_size)]
+
+        def fetch(chunk):
+            try:
+                return self._request("quote", lambda: request_quotes(chunk), retries=0, trips_breaker=False), None
+            except Exception as e:
+                return None, e
+
+        results = [fetch(chunks[0])] if len(chunks) == 1 else list(self._pool.map(fetch, chunks))
+        if all(rows is None for rows, _ in results):
+            raise results[-1][1]
+        wanted = set(symbols)
+        prices = {}
+        for rows, _ in results:
+            for row in rows or []:
+                price = row.get("regularMarketPrice")
+                if row.get("symbol") in wanted and price is not None:
+                    prices[row["symbol"]] = float(price)
+        return prices
+
+    def info(self, symbol):
+        """yf.Ticker(symbol).info, under the same limits, retries and breaker as download()."""
+        return self._request("info", lambda: yf.Ticker(symbol).info)
+
+    # -- Metrics -------------------------------------------------------------
+    def _count(self, operation, counter):
+        with self._lock:
+            self._counts[operation][counter] += 1
+
+    def _record(self, operation, seconds, ok):
+        with self._lock:
+            self._latencies[operation].append(seconds)
+            self._sums[operation] += seconds
+            self._counts[operation]["requests"] += 1
+            if not ok:
+                self._counts[operation]["errors"] += 1
+
+    def stats(self):
+        """
+        Returns {operation: {"requests", "errors", "retries", "rejected",
+        "split", "p50", "p95"}} with latencies in seconds over the recent window.
+        """
+        import numpy as np
+
+        with self._lock:
+            counts = {op: dict(c) for op, c in self._counts.items()}
+            recent = {op: np.array(values) for op, values in self._latencies.items()}
+        for operation, counters in counts.items():
+            values = recent.get(operation)
+            counters["p50"] = float(np.percentile(values, 50)) if values is not None and len(values) else None
+            counters["p95"] = float(np.percentile(values, 95)) if values is not None and len(values) else None
+        return counts
+
+    def prometheus_text(self):
+        """Request latency, errors and breaker state in the Prometheus text exposition format."""
+        stats = self.stats()
+        with self._lock:
+            sums = dict(self._sums)
+        lines = [
+            "# HELP portfolio_yahoo_request_duration_seconds Duration of each request to Yahoo Finance.",
+            "# TYPE portfolio_yahoo_request_duration_seconds summary",
+        ]
+        for operation in sorted(stats):
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95")):
+                if stats[operation].get(key) is not None:
+                    lines.append(
+                        f'portfolio_yahoo_request_duration_seconds{{operation="{operation}",quantile="{quantile}"}} '
+                        f'{stats[operation][key]:.6f}'
+                    )
+            lines.append(f'portfolio_yahoo_request_duration_seconds_sum{{operation="{operation}"}} {sums.get(operation, 0.0):.6f}')
+            lines.append(f'portfolio_yahoo_request_duration_seconds_count{{operation="{operation}"}} {stats[operation]["requests"]}')
+        for counter, help_text in (
+            ("errors", "Failed requests to Yahoo Finance."),
+            ("retries", "Requests retried after a failure."),
+            ("rejected", "Requests rejected by the open circuit breaker."),
+            ("split", "Failed chunks split in two and retried."),
+        ):
+            lines.append(f"# HELP portfolio_yahoo_{counter}_total {help_text}")
+            lines.append(f"# TYPE portfolio_yahoo_{counter}_total counter")
+            for operation in sorted(stats):
+                lines.append(f'portfolio_yahoo_{counter}_total{{operation="{operation}"}} {stats[operation][counter]}')
+        state = self.breaker.state
+        lines.append("# HELP portfolio_yahoo_circuit_open Whether the Yahoo Finance circuit breaker rejects requests.")
+        lines.append("# TYPE portfolio_yahoo_circuit_open gauge")
+        lines.append(f"portfolio_yahoo_circuit_open {int(state == 'open')}")
+        return "\n".join(lines) + "\n"
+
+
+def _multi_index(data, tickers):
+    """Gives a one-ticker frame the (Price, Ticker) columns of a multi-ticker download."""
+    if data is None or isinstance(data.columns, pd.MultiIndex) or len(tickers) != 1:
+        return data
+    data = data.copy()
+    data.columns = pd.MultiIndex.from_product([data.columns, tickers], names=["Price", "Ticker"])
+    return data
+
+
+def request_quotes(symbols):
+    """Raw results of one v7 quote request, sent with yfinance's session (its cookie and crumb)."""
+    from yfinance.data import YfData
+
+    data = YfData().get_raw_json(QUOTE_URL, params={"symbols": ",".join(symbols), "fields": QUOTE_FIELDS, "formatted": "false"})
+    return data["quoteResponse"]["result"]
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_client():
+    """The process-wide client, configured from the YF_* environment variables."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = YahooClient()
+        return _default